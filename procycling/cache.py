@@ -0,0 +1,81 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+import pandas as pd
+
+CACHE_BYTES = 256 * 1024 * 1024
+
+
+class FrameCache(object):
+    """Thread-safe LRU of DataFrames bounded by their memory footprint.
+
+    Every entry carries a version, e.g. mtime of the file it was decoded
+    from. A lookup with another version is a miss and drops the entry, so
+    stale frames are never served after the file is rewritten.
+    """
+
+    def __init__(self, max_bytes: int = CACHE_BYTES):
+        """
+
+        Args:
+            max_bytes: upper bound of the sum of DataFrame.memory_usage(deep=True) of cached frames
+        """
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, version: Any) -> Optional[pd.DataFrame]:
+        """
+
+        Args:
+            key: cache key
+            version: current version of the source
+
+        Returns:
+            copy of cached frame, None if key is missing or cached for another version
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1].copy()
+
+    def put(self, key: Hashable, version: Any, frame: pd.DataFrame) -> None:
+        size = int(frame.memory_usage(index=True, deep=True).sum())
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (version, frame.copy(), size)
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+
+    def pop(self, key: Hashable) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def _drop(self, key: Hashable) -> None:
+        self.nbytes -= self._entries.pop(key)[2]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+DEFAULT_CACHE = FrameCache()
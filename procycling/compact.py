@@ -0,0 +1,184 @@
+import threading
+from typing import Optional, Dict
+
+import pandas as pd
+
+from procycling.utils import FIRSTCYCLING_URL, HISTORY_CODE
+
+RIDER_URL = FIRSTCYCLING_URL + "rider.php?r="
+RACE_URL = FIRSTCYCLING_URL + "race.php?r="
+
+CATEGORY_COLUMNS = [
+    'Country_Race', 'Country_Winner', 'WinnerCountry', 'SecondCountry', 'ThirdCountry', 'RiderCountry',
+    'CountryName', 'Category', 'Classification', 'Gender', 'Profile_Type', 'AgeType'
+]
+INT_COLUMNS = ['Season', 'RaceID', 'WinnerID', 'SecondID', 'ThirdID', 'RiderID', 'Position', 'Year',
+               'FirstPlace', 'SecondPlace', 'ThirdPlace', 'WinStages']
+RIDER_NAMES = {'Rider': 'RiderID', 'Winner': 'WinnerID', 'Second': 'SecondID', 'Third': 'ThirdID'}
+RACE_NAMES = {'Race_Name': 'RaceID'}
+RIDER_LINKS = {'RiderLink': 'RiderID', 'WinnerLink': 'WinnerID', 'SecondLink': 'SecondID', 'ThirdLink': 'ThirdID'}
+RACE_LINKS = ['RaceLink']
+
+CATEGORY_RATIO = 0.5
+
+
+class Dimensions(object):
+    """Rider and race names referenced by id from compact frames.
+
+    One instance is shared by all frames compacted by a FirstCycling object,
+    so every rider name is held once however many editions mention it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._riders = {}
+        self._races = {}
+
+    @staticmethod
+    def _merge(dimension: Dict[int, str], ids: pd.Series, names: pd.Series) -> None:
+        """Add (id, name) pairs of one frame to ``dimension``, the last name of an id wins."""
+        pairs = pd.DataFrame({'id': pd.to_numeric(ids, errors='coerce').astype('Int32').to_numpy(),
+                              'name': names.astype('string').to_numpy()}).dropna()
+        dimension.update(zip(pairs['id'].astype(int).tolist(), pairs['name'].tolist()))
+
+    @staticmethod
+    def _series(dimension: Dict[int, str], index: str, name: str) -> pd.Series:
+        return pd.Series(list(dimension.values()), dtype='string',
+                         index=pd.Index(list(dimension), dtype='Int32', name=index), name=name)
+
+    @property
+    def riders(self) -> pd.Series:
+        with self._lock:
+            return self._series(self._riders, 'RiderID', 'Rider')
+
+    @property
+    def races(self) -> pd.Series:
+        with self._lock:
+            return self._series(self._races, 'RaceID', 'Race_Name')
+
+    def add_riders(self, ids: pd.Series, names: pd.Series) -> None:
+        with self._lock:
+            self._merge(self._riders, ids, names)
+
+    def add_races(self, ids: pd.Series, names: pd.Series) -> None:
+        with self._lock:
+            self._merge(self._races, ids, names)
+
+    def rider_names(self, ids: pd.Series) -> pd.Series:
+        with self._lock:
+            return ids.astype('Int32').map(self._riders).astype('string')
+
+    def race_names(self, ids: pd.Series) -> pd.Series:
+        with self._lock:
+            return ids.astype('Int32').map(self._races).astype('string')
+
+
+def rider_link(ids: pd.Series) -> pd.Series:
+    """
+
+    Args:
+        ids: rider ids
+
+    Returns:
+        links to rider pages, <NA> for missing ids
+    """
+    ids = ids.astype('Int32').astype('string')
+    return RIDER_URL + ids
+
+
+def race_link(ids: pd.Series, years: Optional[pd.Series] = None, classifications: Optional[pd.Series] = None
+              ) -> pd.Series:
+    """
+
+    Args:
+        ids: race ids
+        years: edition of every row, link to race page if None
+        classifications: values of HISTORY_CODE, link to edition results if given with years
+
+    Returns:
+        links to race pages
+    """
+    link = RACE_URL + ids.astype('Int32').astype('string')
+    if years is not None:
+        link = link + '&y=' + years.astype('Int32').astype('string')
+        if classifications is not None:
+            codes = {name: str(k) for k, name in HISTORY_CODE.items()}
+            link = link + '&k=' + classifications.astype(object).map(codes).astype('string')
+    return link
+
+
+def _to_int32(values: pd.Series) -> pd.Series:
+    numeric = pd.to_numeric(values, errors='coerce')
+    if not numeric.isna().equals(values.isna()) or (numeric.dropna() % 1 != 0).any():
+        return values
+    return numeric.astype('Int32')
+
+
+def compact(df: Optional[pd.DataFrame], dimensions: Dimensions, race_id: Optional[int] = None
+            ) -> Optional[pd.DataFrame]:
+    """Memory-compact copy of a reader's frame.
+
+    Repeated strings become categoricals, ids, positions and counters become
+    Int32, link columns are dropped (see expand) and rider and race names
+    are moved to ``dimensions`` when every named row has an id.
+
+    Args:
+        df: frame returned by one of FirstCycling readers
+        dimensions: tables receiving rider and race names
+        race_id: id of the race of history frames, stored as RaceID column
+
+    Returns:
+        compact frame, None if df is None
+    """
+    if df is None:
+        return None
+    df = df.copy()
+    if race_id is not None and 'RaceID' not in df.columns:
+        df.insert(0, 'RaceID', race_id)
+    for column in df.columns:
+        if column in INT_COLUMNS:
+            df[column] = _to_int32(df[column])
+    for names, add in [(RIDER_NAMES, dimensions.add_riders), (RACE_NAMES, dimensions.add_races)]:
+        for name, id_column in names.items():
+            if name in df.columns and id_column in df.columns:
+                add(df[id_column], df[name])
+                if not (df[name].notna() & df[id_column].isna()).any():
+                    df = df.drop(columns=name)
+    df = df.drop(columns=[column for column in [*RIDER_LINKS, *RACE_LINKS] if column in df.columns])
+    for column in df.columns:
+        if column in CATEGORY_COLUMNS or (
+                df[column].dtype == object and len(df) and df[column].nunique() / len(df) < CATEGORY_RATIO):
+            df[column] = df[column].astype('category')
+    return df
+
+
+def expand(df: Optional[pd.DataFrame], dimensions: Dimensions) -> Optional[pd.DataFrame]:
+    """Add names and links dropped by compact.
+
+    Race_Name is added only if ``dimensions`` knows the race, history frames
+    of races missing from every compacted schedule keep their RaceID only.
+
+    Args:
+        df: compact frame
+        dimensions: tables filled while compacting
+
+    Returns:
+        frame with name and link columns
+    """
+    if df is None:
+        return None
+    df = df.copy()
+    for name, id_column in RIDER_NAMES.items():
+        if id_column in df.columns and name not in df.columns:
+            df[name] = dimensions.rider_names(df[id_column])
+    for link, id_column in RIDER_LINKS.items():
+        if id_column in df.columns:
+            df[link] = rider_link(df[id_column])
+    for name, id_column in RACE_NAMES.items():
+        if id_column in df.columns and name not in df.columns:
+            names = dimensions.race_names(df[id_column])
+            if names.notna().any():
+                df[name] = names
+    if 'RaceID' in df.columns and 'Classification' in df.columns and 'Year' in df.columns:
+        df['RaceLink'] = race_link(df.RaceID, df.Year, df.Classification)
+    return df
@@ -0,0 +1,134 @@
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Union, Dict, IO, Iterator
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+    import msvcrt
+
+
+class FileLock(object):
+    """Advisory exclusive lock on a lock file, usable across processes and threads.
+
+    The lock file is created if missing and is never removed, so all
+    processes on the host agree on the same inode.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self._thread_lock = threading.RLock()
+        self._fd = None
+        self._depth = 0
+
+    def acquire(self, blocking: bool = True) -> bool:
+        """
+
+        Args:
+            blocking: wait for the lock if True, return immediately otherwise
+
+        Returns:
+            True if the lock is held by the caller
+        """
+        if not self._thread_lock.acquire(blocking):
+            return False
+        if self._depth > 0:
+            self._depth += 1
+            return True
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:  # pragma: no cover - Windows
+                msvcrt.locking(fd, msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+        except OSError:
+            os.close(fd)
+            self._thread_lock.release()
+            return False
+        self._fd = fd
+        self._depth = 1
+        return True
+
+    def release(self) -> None:
+        self._depth -= 1
+        if self._depth == 0:
+            fd, self._fd = self._fd, None
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+                else:  # pragma: no cover - Windows
+                    os.lseek(fd, 0, os.SEEK_SET)
+                    msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+            finally:
+                os.close(fd)
+        self._thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+_SHARED_LOCKS: Dict[Path, FileLock] = {}
+_SHARED_LOCKS_GUARD = threading.Lock()
+
+
+def shared_lock(path: Union[str, Path]) -> FileLock:
+    """FileLock of ``path`` shared by all threads of the process.
+
+    Threads must lock one FileLock object: two objects of the same path
+    would open two descriptors, and a thread holding the lock through one
+    would wait for itself through the other.
+
+    Args:
+        path: lock file
+
+    Returns:
+        the same FileLock for every call with the same path
+    """
+    path = Path(path).absolute()
+    with _SHARED_LOCKS_GUARD:
+        if path not in _SHARED_LOCKS:
+            _SHARED_LOCKS[path] = FileLock(path)
+        return _SHARED_LOCKS[path]
+
+
+@contextmanager
+def atomic_write(path: Union[str, Path], mode: str = 'w', durable: bool = True, **kwargs) -> Iterator[IO]:
+    """Write a file through a temporary file renamed over ``path`` when the block succeeds.
+
+    Readers of ``path`` see the old or the new content, never a half-written
+    file, and two writers never interleave: the last rename wins. The
+    temporary file is removed if the block raises.
+
+    Args:
+        path: target file, parent directories are created
+        mode: 'w' or 'wb'
+        durable: fsync the file before the rename, so a crash cannot leave an empty file behind
+        **kwargs: passed to ``open``, e.g. newline
+
+    Returns:
+        file object of the temporary file
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix='.{}.'.format(path.name), suffix='.tmp', dir=path.parent)
+    try:
+        with os.fdopen(fd, mode, **kwargs) as file:
+            yield file
+            if durable:
+                file.flush()
+                os.fsync(file.fileno())
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
@@ -1,44 +1,88 @@
-import json
-from typing import Optional, Union, List, Dict
+import copy
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager, nullcontext, ExitStack
+from dataclasses import dataclass
+from typing import Optional, Union, List, Dict, Iterable, Iterator, Callable, ContextManager
 from pathlib import Path
 import os
-import re
+import threading
+import time
 from datetime import datetime
 
-import bs4
 import pandas as pd
-import requests
-from lxml import etree
 
-import functions as f
-from utils import (
-    RE_ID,
+import procycling.functions as f
+from procycling.compact import Dimensions, compact, expand
+from procycling.freshness import FreshnessPolicy, HIT, STALE, FRESH, LOAD, FETCH, REFRESH
+from procycling.parsers import (
+    parse_schedule_month,
+    parse_hist_general,
+    parse_hist_yby,
+    iter_hist_yby,
+    parse_hist_victories,
+    parse_hist_stages,
+    parse_hist_young_old_win,
+    parse_race_pages
+)
+from procycling.pipeline import RacePipeline
+from procycling.ratelimit import AdaptiveRateLimiter
+from procycling.riderindex import RiderIndex, default_rider_index
+from procycling.storage import Storage, FileStorage, conform, query_result, schedule_resource, race_resource
+from procycling.transport import Transport, FetchError
+from procycling.utils import (
     HISTORY_CODE,
-    XPATH_HIST_GEN,
-    XPATH_HIST_YBY,
-    XPATH_HIST_YO
+    RACE_PAGE_URL,
+    HISTORY_PAGES,
+    PARSE_MODE,
+    SCHEDULE_URL
 )
 
 BASE_DIR = Path(os.environ.get("CYCLING_DIR", Path.home() / "procycling"))
 DATA_DIR = Path(BASE_DIR, "data")
 
 FIRSTCYCLING_DATADIR = DATA_DIR / "Firstcycling"
-FIRSTCYCLING_URL = "https://firstcycling.com/"
 
 NO_CACHE = False
 NO_STORE = False
+MAX_WORKERS = 4
+RESULT_GRACE_DAYS = 7
+
+
+@dataclass
+class RaceHistoryResult(object):
+    """History of one race returned by FirstCycling.read_race_histories.
+
+    Attributes:
+        race_id: race id
+        history: same dict as returned by read_race_history, None if reading failed
+        error: exception raised while fetching or parsing, None on success
+        status: how the history was served, HIT, STALE or FRESH, None if reading failed
+    """
+    race_id: int
+    history: Optional[Dict] = None
+    error: Optional[Exception] = None
+    status: Optional[str] = None
 
 
 class FirstCycling(object):
     """
 
+    Attributes:
+        last_status: how the last read_* call of the calling thread was served: HIT from storage,
+            STALE from storage because refresh failed, FRESH from the site
     """
 
     def __init__(self,
                  season: int,
                  no_cache: bool = NO_CACHE,
                  no_store: bool = NO_STORE,
-                 data_dir: Path = FIRSTCYCLING_DATADIR
+                 data_dir: Path = FIRSTCYCLING_DATADIR,
+                 transport: Optional[Transport] = None,
+                 parse_mode: str = PARSE_MODE,
+                 storage: Optional[Storage] = None,
+                 compact: bool = False,
+                 policy: Optional[FreshnessPolicy] = None,
+                 rider_index: Optional[RiderIndex] = None
                  ):
         """
 
@@ -47,464 +91,747 @@ class FirstCycling(object):
             no_cache:
             no_store:
             data_dir:
+            transport: HTTP client used for every page fetch, new rate limited Transport is created if None
+            parse_mode: 'lxml' parses every page once into lxml tree, 'bs4' keeps BeautifulSoup round-trip
+            storage: backend of cached schedules and race histories, FileStorage in data_dir if None
+            compact: return memory-compact frames (categoricals, Int32 ids, names in self.dimensions, no links),
+                see compact.compact and FirstCycling.expand
+            policy: when stored data is served without asking the site, default FreshnessPolicy if None
+            rider_index: index of riders of stored races, if None it is kept in the data dir of FileStorage or
+                in the database of SQLiteStorage, other storages are not indexed unless rider_index is passed
         """
 
         self.season = season
         self.no_cache = no_cache
         self.no_store = no_store
         self.data_dir = data_dir
-        if not self.no_store:
+        self.transport = transport if transport is not None else Transport(rate_limiter=AdaptiveRateLimiter())
+        self.parse_mode = parse_mode
+        self.storage = storage if storage is not None else FileStorage(self.data_dir)
+        self.compact = compact
+        self.dimensions = Dimensions()
+        self.policy = policy if policy is not None else FreshnessPolicy()
+        self.rider_index = rider_index if rider_index is not None else default_rider_index(self.storage)
+        self._status = threading.local()
+        if not self.no_store and isinstance(self.storage, FileStorage):
             self.data_dir.joinpath("seasons").mkdir(parents=True, exist_ok=True)
             self.data_dir.joinpath("races").mkdir(parents=True, exist_ok=True)
             self.data_dir.mkdir(parents=True, exist_ok=True)
 
+    @property
+    def last_status(self) -> Optional[str]:
+        return getattr(self._status, 'value', None)
+
+    @last_status.setter
+    def last_status(self, status: str) -> None:
+        # kept per thread, so concurrent reads through one instance do not overwrite each other's status
+        self._status.value = status
+
     def read_schedule(self,
                       gender: str = 'M',
-                      force_cache: bool = True
+                      force_cache: Optional[bool] = None
                       ) -> pd.DataFrame:
         """
 
         Args:
-            gender:
-            force_cache:
+            gender: 'M' or 'W'
+            force_cache: True to serve any stored schedule, False to fetch the whole season,
+                None to follow self.policy; missing schedule is always fetched and stored
+
+        Returns:
+            schedule of the season
+        """
+        stored_at = self._schedule_stored_at(gender)
+        action = FETCH if self.no_cache else self.policy.schedule_action(
+            self.season, stored_at, force_cache,
+            complete=self.storage.read_validators(schedule_resource(self.season, gender)).get('complete', False))
+        if action == LOAD:
+            races_year, self.last_status = self._stored_schedule(gender), HIT
+        else:
+            with self._elect_writer(schedule_resource(self.season, gender), stored_at,
+                                    lambda: self._schedule_stored_at(gender)) as elected:
+                if not elected:
+                    races_year, self.last_status = self._stored_schedule(gender), HIT
+                elif action == REFRESH:
+                    try:
+                        races_year, self.last_status = self._refresh_schedule(gender), FRESH
+                    except FetchError:
+                        races_year, self.last_status = self._stored_schedule(gender), STALE
+                else:
+                    races_year, self.last_status = self._fetch_and_store_schedule(gender), FRESH
+        return self._output(races_year)
+
+    def _stored_schedule(self, gender: str) -> pd.DataFrame:
+        return conform(self.storage.read_schedule(self.season, gender), 'schedule')
+
+    def _fetch_and_store_schedule(self, gender: str) -> pd.DataFrame:
+        validators = {}
+        races_year = conform(self._fetch_schedule(gender, validators=validators), 'schedule')
+        if not self.no_store:
+            resource = schedule_resource(self.season, gender)
+            with self._locked(resource):
+                self.storage.write_schedule(races_year, self.season, gender)
+                self._write_validators(resource, validators, complete=self._season_over())
+        return races_year
+
+    def _stored_at(self, updated: Optional[float], resource: str) -> Optional[float]:
+        """Time stored resource was written or last revalidated against the site, None if it is not stored."""
+        if updated is None:
+            return None
+        return max(updated, self.storage.read_validators(resource).get('checked', updated))
+
+    def _schedule_stored_at(self, gender: str) -> Optional[float]:
+        return self._stored_at(self.storage.schedule_updated(self.season, gender),
+                               schedule_resource(self.season, gender))
+
+    def _race_stored_at(self, race_id: int) -> Optional[float]:
+        return self._stored_at(self.storage.race_history_updated(race_id), race_resource(race_id))
+
+    def _locked(self, resource: str) -> ContextManager:
+        """Lock of the resource held around read-modify-write, nothing to lock if nothing is stored."""
+        return nullcontext() if self.no_store else self.storage.lock(resource)
+
+    @contextmanager
+    def _elect_writer(self,
+                      resource: str,
+                      stored_at: Optional[float],
+                      current: Callable[[], Optional[float]]
+                      ) -> Iterator[bool]:
+        """Single writer of a resource across threads and processes.
+
+        The caller decided to fetch the resource seeing it stored at ``stored_at``.
+        The block runs under the lock of the resource and gets False if another
+        writer stored it while the caller waited for the lock, so the caller
+        reads the stored result instead of fetching it again.
+
+        Args:
+            resource: schedule_resource or race_resource
+            stored_at: time resource was stored when the caller checked it, None if it was missing
+            current: returns time resource is stored now
 
         Returns:
+            True if the caller has to fetch the resource
+        """
+        with self._locked(resource):
+            yield self.no_store or current() == stored_at
 
+    def _write_validators(self, resource: str, validators: Dict, **state) -> None:
+        if not self.no_store:
+            self.storage.write_validators(resource, {'checked': time.time(), 'pages': validators, **state})
+
+    def _season_over(self) -> bool:
+        """Season ended, its schedule is fetched up to December without cutting the current month."""
+        return self.season < datetime.now().year
+
+    def _get_page(self, url: str, validators: Dict, conditional: bool = True, hedge: bool = False
+                  ) -> Optional[bytes]:
         """
-        filemask = "seasons/schedule{}_{}.csv"
-        filepath = self.data_dir / filemask.format(gender, self.season)
-
-        if not force_cache or self.no_cache:
-            all_months = ['0' + str(x) if x < 10 else str(x) for x in range(1, 13)]
-
-            month_now = '0' + str(datetime.now().month) if datetime.now().month < 10 else str(datetime.now().month)
-
-            races_year = pd.DataFrame()
-            for month in all_months:
-                t = 2 if gender == 'M' else 6
-                month_url = FIRSTCYCLING_URL + f"race.php?y={str(self.season)}&t={t}&m={month}"
-                month_page = bs4.BeautifulSoup(requests.get(month_url).content, 'lxml')
-                body = month_page.find('body')
-                tbl_races = body.find('tbody')
-                if tbl_races is None:
-                    if month == month_now:
-                        break
-                    else:
-                        continue
-                races_info = [x.strip('\t').strip('\r') for x in tbl_races.text.split('\n') if x not in ['', ' ', '\r']]
-                list_ids = [RE_ID.search(ids['href']).group() for ids in tbl_races.find_all('a', href=True)]
-                dom = etree.HTML(str(body))
 
-                if month == month_now:
-                    end_races = f.finish_race_in_current_month(self.season, races_info)
-                    races_info = races_info[:end_races * 5]
-                    list_ids = list_ids[: end_races * 3]
-                    countries = [
-                        [dom.xpath(f'//*[@id="wrapper"]/div[3]/table/tbody/tr[{row}]/td[{td}]/span')[0].values()[0] \
-                         for td in range(3, 5)] for row in range(1, end_races + 1)]
-                else:
-                    countries = [
-                        [dom.xpath(f'//*[@id="wrapper"]/div[3]/table/tbody/tr[{row}]/td[{td}]/span')[0].values()[0] \
-                         for td in range(3, 5)] for row in range(1, len(tbl_races.find_all('tr')) + 1)]
-
-                list_ids_2d = [[x1, x2] for x1, x2 in zip(list_ids[0::3], list_ids[1::3])]
-                list_races = [[dates, cat, rname, win,
-                               f.re_country_flag(country[0]),
-                               f.re_country_flag(country[1]),
-                               ids[0], ids[1]] \
-                              for (dates, cat, rname, win, country, ids) in zip(races_info[0::5],
-                                                                                races_info[1::5],
-                                                                                races_info[2::5],
-                                                                                races_info[3::5],
-                                                                                countries,
-                                                                                list_ids_2d)]
-
-                races_month = (
-                    pd.DataFrame(list_races, columns=['Date', 'Category', 'Race_Name', 'Winner',
-                                                      'Country_Race', 'Country_Winner',
-                                                      'RaceID', 'WinnerID'])
-                    .assign(
-                        Season_RaceID=lambda df_: ["_".join([str(self.season), race_id]) for race_id in df_.RaceID],
-                        Season=self.season,
-                        Gender=gender,
-                        Profile_Type=lambda df_: ['Stage Race' if x == '2' else 'One Day' for x in
-                                                  df_.Category.str[:1]],
-                        Start_End=lambda df_: [f.parse_race_dates(self.season, dt) for dt in df_.Date],
-                    )
-                    .assign(
-                        Date_Start=lambda df_: [dt[0] for dt in df_.Start_End],
-                        Date_End=lambda df_: [dt[1] for dt in df_.Start_End]
-                    )
-                    .drop(columns='Start_End')
-                    .loc[:, ['Season_RaceID', 'Season', 'Date', 'Date_Start', 'Date_End', 'RaceID', 'Race_Name',
-                             'Category', 'Gender', 'Profile_Type', 'Country_Race', 'WinnerID', 'Winner',
-                             'Country_Winner']]
-                )
-                races_year = pd.concat([races_year, races_month], axis=0, ignore_index=True)
+        Args:
+            url: page url
+            validators: url -> validator of pages of one resource, updated with validator of the fetched page
+            conditional: revalidate the page stored in validators instead of fetching it unconditionally
+            hedge: send a hedged request, see Transport.fetch
+
+        Returns:
+            body of the page, None if conditional and page has not changed
+        """
+        content, validators[url] = self.transport.get_if_changed(url, validators.get(url) if conditional else None,
+                                                                 hedge=hedge)
+        return content
+
+    def refresh_schedule(self, gender: str = 'M') -> pd.DataFrame:
+        """Bring stored schedule up to date fetching only months that may have changed.
+
+        Refresh starts at the month of the latest stored race or at the month of
+        the earliest race stored without a winner (not finished at the previous
+        refresh), whichever is earlier. Only races that have started and ended
+        less than RESULT_GRACE_DAYS ago count as unfinished; a cancelled race or
+        one the site never gives a result does not hold the refresh back for the
+        rest of the season. Months are revalidated with conditional
+        requests and months that have not changed since they were stored are
+        not parsed. Fetched races replace stored ones with the same
+        Season_RaceID. Without stored schedule the whole season is read.
+
+        Args:
+            gender: 'M' or 'W'
+
+        Returns:
+            schedule of the season
+        """
+        races_year, self.last_status = self._refresh_schedule(gender), FRESH
+        return self._output(races_year)
+
+    def _refresh_schedule(self, gender: str) -> pd.DataFrame:
+        resource = schedule_resource(self.season, gender)
+        with self._locked(resource):
+            try:
+                stored = self._stored_schedule(gender)
+            except FileNotFoundError:
+                return self._fetch_and_store_schedule(gender)
+            if stored.shape[0] == 0:
+                return self._fetch_and_store_schedule(gender)
+            today = pd.Timestamp.now().normalize()
+            unfinished = stored.loc[stored.WinnerID.isna() & stored.Winner.isna() & (stored.Date_Start <= today)
+                                    & (stored.Date_End >= today - pd.Timedelta(days=RESULT_GRACE_DAYS)), 'Date_Start']
+            first_month = min([stored.Date_Start.max(), *unfinished]).month
+
+            validators = self.storage.read_validators(resource).get('pages', {})
+            fetched = conform(self._fetch_schedule(gender, first_month, validators, conditional=True), 'schedule')
+            if fetched.shape[0] == 0:
+                self._write_validators(resource, validators, complete=self._season_over())
+                return stored
+            races_year = (
+                pd.concat([stored.loc[~stored.Season_RaceID.isin(fetched.Season_RaceID)], fetched],
+                          axis=0, ignore_index=True)
+                .sort_values('Date_Start', kind='stable')
+                .reset_index(drop=True)
+            )
+            if not self.no_store:
+                self.storage.write_schedule(races_year, self.season, gender)
+                self._write_validators(resource, validators, complete=self._season_over())
+            return races_year
+
+    def _fetch_schedule(self,
+                        gender: str,
+                        first_month: int = 1,
+                        validators: Optional[Dict] = None,
+                        conditional: bool = False
+                        ) -> pd.DataFrame:
+        """
+
+        Args:
+            gender: 'M' or 'W'
+            first_month: first month to fetch
+            validators: url -> validator of month pages, updated with fetched pages
+            conditional: skip months not changed since validators were stored, the current month
+                is always fetched and parsed
+
+        Returns:
+            races from first_month up to the current month, up to December if season is not the current one
+        """
+        validators = validators if validators is not None else {}
+        all_months = ['0' + str(x) if x < 10 else str(x) for x in range(first_month, 13)]
+
+        now = datetime.now()
+        # only the current season is cut at today, other seasons have no current month
+        month_now = ('0' + str(now.month) if now.month < 10 else str(now.month)) if self.season == now.year else None
+
+        races_year = pd.DataFrame()
+        for month in all_months:
+            t = 2 if gender == 'M' else 6
+            url = SCHEDULE_URL.format(str(self.season), t, month)
+            content = self._get_page(url, validators, conditional=conditional and month != month_now)
+            if content is None:
+                continue
+            if month == month_now:
+                # rows were cut by today's date, the same body may give more finished races later
+                validators.pop(url)
+            races_month = parse_schedule_month(content, self.season, gender, current_month=month == month_now,
+                                               mode=self.parse_mode)
+            if races_month is None:
                 if month == month_now:
                     break
-            races_year = races_year.drop_duplicates().reset_index(drop=True)
-            if not self.no_store:
-                races_year.to_csv(filepath, index=False)
-        else:
-            races_year = pd.read_csv(filepath)
-        return races_year
+                else:
+                    continue
+            races_year = pd.concat([races_year, races_month], axis=0, ignore_index=True)
+            if month == month_now:
+                break
+        return races_year.drop_duplicates().reset_index(drop=True)
 
     def read_race_history(self,
                           race_id: int,
-                          force_cache: bool = True
+                          force_cache: Optional[bool] = None
                           ) -> Dict:
-        foldermask = "races/race_{}"
-        folderpath = self.data_dir / foldermask.format(race_id)
-        hist_race = {}
-        if not force_cache or self.no_cache:
-            general = self.read_race_hist_general(race_id, force_cache=False)
-            yby = self.read_race_hist_yby(race_id, force_cache=False)
-            victory = self.read_race_hist_victories(race_id, force_cache=False)
-            stage = self.read_race_hist_stages(race_id, force_cache=False)
-            age_winner = self.read_race_hist_young_old_win(race_id, force_cache=False)
-            if not self.no_store:
-                folderpath.mkdir(parents=True, exist_ok=True)
-                hist_race['general'] = {
-                    'headers': f.convert_dataframe_to_json(general, True),
-                    'data': f.convert_dataframe_to_json(general)
-                }
-                hist_race['yby'] = {
-                    'headers': f.convert_dataframe_to_json(yby, True),
-                    'data': f.convert_dataframe_to_json(yby)
-                }
-                hist_race['victory'] = {
-                    'headers': f.convert_dataframe_to_json(victory, True),
-                    'data': f.convert_dataframe_to_json(victory)
-                }
-                hist_race['stage'] = {
-                    'headers': f.convert_dataframe_to_json(stage, True),
-                    'data': f.convert_dataframe_to_json(stage)
-                }
-                hist_race['age_winner'] = {
-                    'headers': f.convert_dataframe_to_json(age_winner, True),
-                    'data': f.convert_dataframe_to_json(age_winner)
-                }
-                with Path(folderpath.joinpath('history_race.json')).open('w') as file:
-                    json.dump(hist_race, file)
+        """
+
+        Args:
+            race_id: race id
+            force_cache: True to serve any stored history, False to fetch all pages,
+                None to follow self.policy; missing history is always fetched and stored
+
+        Returns:
+            headers and data of every section of HISTORY_PAGES
+        """
+        stored_at = self._race_stored_at(race_id)
+        action = self._race_action(race_id, stored_at, force_cache)
+        if action == LOAD:
+            hist_race, self.last_status = self.storage.read_race_history(race_id), HIT
         else:
-            with Path(folderpath.joinpath('history_race.json')).open('r') as file:
-                hist_race = json.load(file)
+            with self._elect_writer(race_resource(race_id), stored_at,
+                                    lambda: self._race_stored_at(race_id)) as elected:
+                if not elected:
+                    hist_race, self.last_status = self.storage.read_race_history(race_id), HIT
+                elif action == REFRESH:
+                    try:
+                        hist_race, self.last_status = self.update_race_history(race_id), FRESH
+                    except FetchError:
+                        hist_race, self.last_status = self.storage.read_race_history(race_id), STALE
+                else:
+                    hist_race, self.last_status = self._fetch_race_history(race_id), FRESH
+        return hist_race
+
+    def _race_history_result(self, race_id: int, force_cache: Optional[bool] = None) -> RaceHistoryResult:
+        """read_race_history with the status of this call, errors are returned instead of raised."""
+        try:
+            hist_race = self.read_race_history(race_id, force_cache)
+        except Exception as e:
+            return RaceHistoryResult(race_id, error=e)
+        return RaceHistoryResult(race_id, hist_race, status=self.last_status)
+
+    def _fetch_race_history(self, race_id: int) -> Dict:
+        validators = {}
+        race_pages = {k: self._get_page(RACE_PAGE_URL.format(race_id, k), validators, conditional=False, hedge=k == 'X')
+                      for section in HISTORY_PAGES.values() for k in section}
+        return self._store_race_history(race_id, *self._parse_race_pages(race_pages), validators=validators)
+
+    def _race_action(self, race_id: int, stored_at: Optional[float], force_cache: Optional[bool]) -> str:
+        if self.no_cache:
+            return FETCH
+        return self.policy.race_action(stored_at, lambda: self._last_edition(race_id), force_cache)
+
+    def _last_edition(self, race_id: int) -> Optional[int]:
+        general = self.storage.read_race_section(race_id, 'general')
+        return int(general.Year.max()) if general.shape[0] else None
+
+    def _cached_section(self, race_id: int, section: str, force_cache: Optional[bool]) -> Optional[pd.DataFrame]:
+        """Stored section brought up to date by the policy, None if it has to be fetched on its own."""
+        stored_at = self._race_stored_at(race_id)
+        action = self._race_action(race_id, stored_at, force_cache)
+        if action == FETCH and (force_cache is False or self.no_cache or self.no_store):
+            self.last_status = FRESH
+            return None
+        if action == LOAD:
+            self.last_status = HIT
+            return self.storage.read_race_section(race_id, section)
+        with self._elect_writer(race_resource(race_id), stored_at, lambda: self._race_stored_at(race_id)) as elected:
+            if not elected:
+                self.last_status = HIT
+            elif action == REFRESH:
+                try:
+                    hist_race = self.update_race_history(race_id)
+                    self.last_status = FRESH
+                except FetchError:
+                    self.last_status = STALE
+                else:
+                    if self.no_store:
+                        # refreshed history was not written, storage still has the old one
+                        tbl = hist_race[section]
+                        return pd.DataFrame(tbl['data'], columns=tbl['headers'])
+            else:
+                self._fetch_race_history(race_id)
+                self.last_status = FRESH
+        return self.storage.read_race_section(race_id, section)
+
+    def update_race_history(self, race_id: int) -> Dict:
+        """Add editions published since race history was stored.
+
+        General and year-by-year pages are revalidated with conditional
+        requests, pages that have not changed are not parsed and only editions
+        missing in storage are parsed from the others. Victories, stage wins
+        and age records are derived from all editions, so their pages are
+        fetched only if there is a new one. Nothing but validators is written
+        if there is no new edition.
+
+        Args:
+            race_id: race id
+
+        Returns:
+            same dict as read_race_history
+        """
+        with self._locked(race_resource(race_id)):
+            return self._update_race_history(race_id)
+
+    def _update_race_history(self, race_id: int) -> Dict:
+        if self.no_cache or not self.storage.has_race_history(race_id):
+            return self._fetch_race_history(race_id)
+        general = self.storage.read_race_section(race_id, 'general')
+        yby = self.storage.read_race_section(race_id, 'yby')
+        resource = race_resource(race_id)
+        validators = self.storage.read_validators(resource).get('pages', {})
+
+        new_general = [general.iloc[:0]]
+        for k in HISTORY_PAGES['general']:
+            content = self._get_page(RACE_PAGE_URL.format(race_id, k), validators)
+            if content is None:
+                continue
+            known = set(general.loc[general.Classification == HISTORY_CODE[int(k)], 'Year'].astype(int)) \
+                if general.shape[0] else set()
+            new_general.append(parse_hist_general(content, int(k), self.parse_mode, skip_years=known))
+        new_general = pd.concat(new_general, axis=0, ignore_index=True)
+        content = self._get_page(RACE_PAGE_URL.format(race_id, 'X'), validators, hedge=True)
+        known = set(yby.Year.dropna().astype(int)) if yby.shape[0] else set()
+        new_yby = yby.iloc[:0] if content is None else parse_hist_yby(content, mode=self.parse_mode,
+                                                                      skip_years=known)
+        if new_general.shape[0] == 0 and new_yby.shape[0] == 0:
+            self._write_validators(resource, validators)
+            return self.storage.read_race_history(race_id)
+
+        order = {name: i for i, name in enumerate(HISTORY_CODE.values())}
+        general = (
+            pd.concat([new_general, general], axis=0, ignore_index=True)
+            .pipe(lambda df_: df_.iloc[df_.Classification.map(order).argsort(kind='stable')])
+            .reset_index(drop=True)
+        )
+        yby = pd.concat([new_yby, yby], axis=0, ignore_index=True)
+        race_pages = {k: self._get_page(RACE_PAGE_URL.format(race_id, k), validators, conditional=False)
+                      for k in [*HISTORY_PAGES['victory'], *HISTORY_PAGES['stage'], *HISTORY_PAGES['age_winner']]}
+        return self._store_race_history(
+            race_id, general, yby,
+            parse_hist_victories(race_pages['W'], self.parse_mode),
+            parse_hist_stages(race_pages['Z'], self.parse_mode),
+            parse_hist_young_old_win(race_pages['Y'], self.parse_mode),
+            validators=validators
+        )
+
+    def read_race_histories(self,
+                            race_ids: Iterable[int],
+                            max_workers: int = MAX_WORKERS,
+                            force_cache: Optional[bool] = None,
+                            parse_workers: Optional[int] = None
+                            ) -> Iterator[RaceHistoryResult]:
+        """Read history of many races, races to fetch go through a RacePipeline.
+
+        Every race is served as read_race_history would serve it. Stored
+        histories that self.policy loads or refreshes are read first by
+        read_race_history on max_workers threads. Races to fetch go through
+        the single-writer election of read_race_history as the pipeline
+        admits them: a race stored by another writer meanwhile is served from
+        storage, the others are fetched by max_workers threads and parsed
+        apart from them, in parse_workers processes, so CPU-bound parsing
+        neither holds the GIL against downloads nor waits for them.
+
+        Args:
+            race_ids: races to read
+            max_workers: number of races read or pages fetched concurrently
+            force_cache: True to serve any stored history, False to fetch all races,
+                None to follow self.policy; missing histories are always fetched and stored
+            parse_workers: number of parse processes, 0 parses in the calling thread, see RacePipeline if None
+
+        Returns:
+            RaceHistoryResult of every race as soon as it is read
+        """
+        to_fetch, stored = {}, []
+        for race_id in dict.fromkeys(race_ids):
+            stored_at = self._race_stored_at(race_id)
+            if self._race_action(race_id, stored_at, force_cache) == FETCH:
+                to_fetch[race_id] = stored_at
+            else:
+                stored.append(race_id)
+        if stored:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = [executor.submit(self._race_history_result, race_id, force_cache) for race_id in stored]
+                for future in as_completed(futures):
+                    yield future.result()
+
+        elected, lost = {}, []
+        pipeline = RacePipeline(self.transport, self.parse_mode, fetch_workers=max_workers, parse_workers=parse_workers)
+        try:
+            for parsed in pipeline.run(self._elected(to_fetch, elected, lost)):
+                while lost:
+                    yield self._race_history_result(lost.pop(0), force_cache=True)
+                with elected.pop(parsed.race_id):
+                    if parsed.error is not None:
+                        result = RaceHistoryResult(parsed.race_id, error=parsed.error)
+                    else:
+                        try:
+                            hist_race = self._store_race_history(parsed.race_id, *parsed.tables,
+                                                                 validators=parsed.validators)
+                        except Exception as e:
+                            result = RaceHistoryResult(parsed.race_id, error=e)
+                        else:
+                            result = RaceHistoryResult(parsed.race_id, hist_race, status=FRESH)
+                yield result
+            while lost:
+                yield self._race_history_result(lost.pop(0), force_cache=True)
+        finally:
+            for held in elected.values():
+                held.close()
+
+    def _elected(self,
+                 to_fetch: Dict[int, Optional[float]],
+                 elected: Dict[int, ExitStack],
+                 lost: List[int]
+                 ) -> Iterator[int]:
+        """Races of to_fetch this instance is elected to write, see _elect_writer.
+
+        Races are elected in race id order, so two bulk reads never wait for
+        each other's locks, and only as they are consumed, so locks are held
+        for races in flight only.
+
+        Args:
+            to_fetch: race id -> time the race was stored when the caller decided to fetch it
+            elected: filled with race id -> held lock of the race, the consumer closes it once the race is stored
+            lost: filled with races stored by another writer meanwhile
+
+        Returns:
+            ids of races to fetch
+        """
+        for race_id in sorted(to_fetch):
+            held = ExitStack()
+            if held.enter_context(self._elect_writer(race_resource(race_id), to_fetch[race_id],
+                                                     lambda: self._race_stored_at(race_id))):
+                elected[race_id] = held
+                yield race_id
+            else:
+                held.close()
+                lost.append(race_id)
+
+    def load_season(self,
+                    season: Optional[int] = None,
+                    gender: str = 'M',
+                    tables: Optional[Iterable[str]] = None,
+                    max_workers: int = MAX_WORKERS,
+                    progress: Optional[Callable[[RaceHistoryResult, int, int], None]] = None,
+                    parse_workers: Optional[int] = None
+                    ) -> Dict[str, pd.DataFrame]:
+        """Schedule of a season and history of all its races as one frame per table.
+
+        Races are read by read_race_histories, so stored histories are served
+        by self.policy and only missing ones are fetched, through the
+        RacePipeline with parsing spread over parse_workers processes. Races
+        that could not be read are reported to progress and left out.
+
+        Args:
+            season: season of the schedule, self.season if None
+            gender: 'M' or 'W'
+            tables: 'schedule' and sections of HISTORY_PAGES to return, all if None
+            max_workers: see read_race_histories
+            progress: called with RaceHistoryResult, number of finished races and number of races
+                as soon as each race is read
+            parse_workers: number of parse processes, 0 parses in the calling thread, see RacePipeline if None
+
+        Returns:
+            table -> frame; history sections have Season_RaceID and RaceID key columns first
+        """
+        tables = ['schedule', *HISTORY_PAGES] if tables is None else list(tables)
+        unknown = [table for table in tables if table != 'schedule' and table not in HISTORY_PAGES]
+        if unknown:
+            raise KeyError("Unknown tables: {}".format(unknown))
+        reader = copy.copy(self)
+        reader.season = self.season if season is None else season
+        reader.compact = False
+        schedule = conform(reader.read_schedule(gender), 'schedule')
+        keys = schedule.loc[schedule.RaceID.notna(), ['RaceID', 'Season_RaceID']].drop_duplicates('RaceID')
+        race_ids = [int(race_id) for race_id in keys.RaceID]
+
+        sections = [table for table in tables if table in HISTORY_PAGES]
+        frames = {section: [] for section in sections}
+        if sections:
+            results = reader.read_race_histories(race_ids, max_workers, parse_workers=parse_workers)
+            for done, result in enumerate(results, 1):
+                if result.error is None:
+                    for section in sections:
+                        tbl = result.history[section]
+                        if tbl['data']:
+                            frames[section].append(
+                                pd.DataFrame(tbl['data'], columns=tbl['headers']).assign(RaceID=result.race_id))
+                if progress is not None:
+                    progress(result, done, len(race_ids))
+
+        season_race_ids = keys.set_index('RaceID').Season_RaceID
+        order = {race_id: i for i, race_id in enumerate(race_ids)}
+        loaded = {}
+        for table in tables:
+            if table == 'schedule':
+                loaded[table] = schedule
+                continue
+            tbl = query_result(pd.concat(frames[table], ignore_index=True) if frames[table] else None, table)
+            tbl = tbl.sort_values('RaceID', kind='stable', key=lambda ids: ids.map(order)).reset_index(drop=True)
+            tbl.insert(0, 'Season_RaceID', tbl.RaceID.map(season_race_ids).astype('string'))
+            loaded[table] = tbl
+        return {table: self._output(tbl) for table, tbl in loaded.items()}
+
+    def _parse_race_pages(self, race_pages: Dict[str, bytes]) -> List[Optional[pd.DataFrame]]:
+        """
+
+        Args:
+            race_pages: body of every page of HISTORY_PAGES by its k
+
+        Returns:
+            general, yby, victory, stage and age_winner tables
+        """
+        return parse_race_pages(race_pages, self.parse_mode)
+
+    def _store_race_history(self,
+                            race_id: int,
+                            general: pd.DataFrame,
+                            yby: pd.DataFrame,
+                            victory: Optional[pd.DataFrame],
+                            stage: Optional[pd.DataFrame],
+                            age_winner: Optional[pd.DataFrame],
+                            validators: Optional[Dict] = None
+                            ) -> Dict:
+        hist_race = {}
+        for section, tbl in zip(HISTORY_PAGES, [general, yby, victory, stage, age_winner]):
+            hist_race[section] = {
+                'headers': f.convert_dataframe_to_json(tbl, True),
+                'data': f.convert_dataframe_to_json(tbl)
+            }
+        if not self.no_store:
+            sections = dict(zip(HISTORY_PAGES, [general, yby, victory, stage, age_winner]))
+            with self._locked(race_resource(race_id)):
+                self.storage.write_race_history(race_id, sections)
+                if self.rider_index is not None:
+                    self.rider_index.update(race_id, sections)
+                if validators is not None:
+                    self._write_validators(race_resource(race_id), validators)
         return hist_race
 
     def read_race_hist_general(self,
                                race_id: Union[int, List[int]],
-                               force_cache: bool = True) -> pd.DataFrame:
-        overall_tbl = pd.DataFrame()
-        if not force_cache or self.no_cache:
-            info_url = FIRSTCYCLING_URL + "race.php?r={}&k={}"
+                               force_cache: Optional[bool] = None) -> pd.DataFrame:
+        overall_tbl = self._cached_section(race_id, 'general', force_cache)
+        if overall_tbl is None:
+            overall_tbl = pd.DataFrame()
             for k in range(1, 5):
-                page = bs4.BeautifulSoup(requests.get(info_url.format(race_id, k)).content, 'lxml')
-                body = page.find("body")
-                tbl_history = body.find("tbody")
-                dom = etree.HTML(str(body))
-
-                hist_df = (
-                    pd.DataFrame([[
-                        *f.xpath_element(dom, XPATH_HIST_GEN, 3, tr, 1, 'a'),
-                        *f.xpath_element(dom, XPATH_HIST_GEN, 3, tr, 2, return_text=True),
-                        *f.xpath_element(dom, XPATH_HIST_GEN, 3, tr, 3, 'a', expected_length=3, check_information=True),
-                        *f.xpath_element(dom, XPATH_HIST_GEN, 3, tr, 4, 'span'),
-                        *f.xpath_element(dom, XPATH_HIST_GEN, 3, tr, 4, 'a', expected_length=2),
-                        *f.xpath_element(dom, XPATH_HIST_GEN, 3, tr, 5, 'span'),
-                        *f.xpath_element(dom, XPATH_HIST_GEN, 3, tr, 5, 'a', expected_length=2),
-                        *f.xpath_element(dom, XPATH_HIST_GEN, 3, tr, 6, 'span'),
-                        *f.xpath_element(dom, XPATH_HIST_GEN, 3, tr, 6, 'a', expected_length=2),
-                    ] for tr in range(1, len(tbl_history.find_all('tr')) + 1)],
-                        columns=['Year', 'Category', 'Information', 'RaceLink', 'Results',
-                                 'WinnerCountry', 'WinnerID', 'Winner', 'SecondCountry', 'SecondID',
-                                 'Second', 'ThirdCountry', 'ThirdID', 'Third'])
-                    .pipe(lambda df_: df_.loc[df_.Information != 'Information']).reset_index(drop=True)
-                    .drop(columns=['Information', 'Results'])
-                    .assign(
-                        Year=lambda df_: [int(re.search(r"(?<=y=)\d{4}", year).group()) for year in df_.Year],
-                        RaceLink=lambda df_: FIRSTCYCLING_URL + df_.RaceLink,
-                        WinnerCountry=lambda df_: [f.re_country_flag(flag) for flag in df_.WinnerCountry],
-                        WinnerLink=lambda df_: FIRSTCYCLING_URL + df_.WinnerID,
-                        WinnerID=lambda df_: [f.re_racer_id(racer_id) for racer_id in df_.WinnerID],
-                        SecondCountry=lambda df_: [f.re_country_flag(flag) for flag in df_.SecondCountry],
-                        SecondLink=lambda df_: FIRSTCYCLING_URL + df_.SecondID,
-                        SecondID=lambda df_: [f.re_racer_id(racer_id) for racer_id in df_.SecondID],
-                        ThirdCountry=lambda df_: [f.re_country_flag(flag) for flag in df_.ThirdCountry],
-                        ThirdLink=lambda df_: FIRSTCYCLING_URL + df_.ThirdID,
-                        ThirdID=lambda df_: [f.re_racer_id(racer_id) for racer_id in df_.ThirdID],
-                        Classification=HISTORY_CODE[k]
-                    )
-                    .loc[:, ['Classification', 'Year', 'Category', 'RaceLink', 'WinnerCountry', 'WinnerID', 'Winner',
-                             'WinnerLink', 'SecondCountry', 'SecondID', 'Second', 'SecondLink', 'ThirdCountry',
-                             'ThirdID', 'Third', 'ThirdLink']]
-                )
+                hist_df = parse_hist_general(self.transport.get_content(RACE_PAGE_URL.format(race_id, k)), k,
+                                             self.parse_mode)
                 overall_tbl = pd.concat([overall_tbl, hist_df], axis=0, ignore_index=True)
-        else:
-            foldermask = "races/race_{}"
-            folderpath = self.data_dir / foldermask.format(race_id)
-            with Path(folderpath.joinpath('history_race.json')).open('r') as file:
-                hist_race = json.load(file)
-            data = hist_race['general']['data']
-            headers = hist_race['general']['headers']
-            overall_tbl = pd.DataFrame(data, columns=headers)
-        return overall_tbl
+        return self._section_output(overall_tbl, 'general', race_id)
 
     def read_race_hist_yby(self,
                            race_id: int,
                            convert_to_sec: bool = False,
-                           force_cache: bool = True) -> pd.DataFrame:
-        overall_tbl = pd.DataFrame()
-        if not force_cache or self.no_cache:
-            yby_url = FIRSTCYCLING_URL + "race.php?r={}&k=X"
-            page = bs4.BeautifulSoup(requests.get(yby_url.format(race_id)).content, 'lxml')
-            body = page.find("body")
-            years = [year.text.strip('\n') for year in body.find_all('thead')]
-            tbl_yby = body.find_all("tbody")
-            dom = etree.HTML(str(body))
-
-            for i, tbl_year in enumerate(tbl_yby):
-                text = [x.strip('\t') for x in tbl_year.text.split('\n') if x not in ['', ' ', '\r']]
-                position = [int(pos) for pos in text[::2]]
-                results = [[re.sub(r"(\d{1,3}:\d{2}:\d{2})|(\+.+)", "", x),
-                            re.search(r"(\d{1,3}:\d{2}:\d{2})|((?<=\+ ).+)|(0)", x)] for x in text[1::2]]
-                results = [[rider, None] if time is None else [rider, time.group()] for rider, time in results]
-                xpath_year = [[
-                    *f.xpath_element(dom, XPATH_HIST_YBY, i+2, tr, 2, 'span'),
-                    *f.xpath_element(dom, XPATH_HIST_YBY, i+2, tr, 3, 'a')
-                ] for tr in range(1, len(tbl_year.find_all('td')) + 1)]
-                countries = [f.re_country_flag(flag[0]) for flag in xpath_year]
-                riders_id = [f.re_racer_id(rider_id[1]) for rider_id in xpath_year]
-                riders_link = [rider_id[1] for rider_id in xpath_year]
-                year = (
-                    pd.DataFrame([[pos, country, r_id, r_link, *res] for pos, country, r_id, r_link, res in zip(
-                        position, countries, riders_id, riders_link, results
-                    )],
-                                 columns=['Position', 'RiderCountry', 'RiderID', 'RiderLink', 'Rider', 'Time'])
-                    .assign(
-                        Year=years[i],
-                        RiderLink=lambda df_: FIRSTCYCLING_URL + df_.RiderLink
-                    )
-                )
-                overall_tbl = pd.concat([overall_tbl, year], axis=0, ignore_index=True)
-            if convert_to_sec:
-                overall_tbl = (
-                    overall_tbl
-                    .merge(
-                        (
-                            overall_tbl
-                            .pipe(lambda df_: df_.loc[df_.Position == 1])
-                            .drop(columns=['Position', 'Rider', 'RiderLink', 'RiderCountry', 'RiderID'])
-                            .reset_index(drop=True)
-                        ),
-                        how='inner',
-                        on=['Year']
-                    )
-                    .assign(Time_Winner=lambda df_: df_.Time_x == df_.Time_y)
-                    .assign(
-                        Time_x=lambda df_: [f.convert_to_seconds(race_time) for race_time in df_.Time_x],
-                        Time_y=lambda df_: [f.convert_to_seconds(race_time) for race_time in df_.Time_y]
-                    )
-                    .assign(
-                        Time_x=lambda df_: [x + y if z is False else x for (x, y, z) in zip(
-                            df_.Time_x,
-                            df_.Time_y,
-                            df_.Time_Winner
-                        )]
-                    )
-                    .drop(columns=['Time_y', 'Time_Winner'])
-                    .rename(columns={'Time_x': 'Time'})
-                )
-            else:
-                overall_tbl = (
-                    overall_tbl
-                    .assign(Time=lambda df_: ['+' + t if pos != 1 and t is not None else t for t, pos in zip(
-                        df_.Time, df_.Position
-                    )])
-                )
-        else:
-            foldermask = "races/race_{}"
-            folderpath = self.data_dir / foldermask.format(race_id)
-            with Path(folderpath.joinpath('history_race.json')).open('r') as file:
-                hist_race = json.load(file)
-            data = hist_race['yby']['data']
-            headers = hist_race['yby']['headers']
-            overall_tbl = pd.DataFrame(data, columns=headers)
-            if convert_to_sec:
-                overall_tbl = (
-                    overall_tbl
-                    .assign(
-                        TimeWinner=lambda df_: [f.convert_to_seconds(time) for time in
-                                                df_.groupby('Year')['Time'].transform(lambda x: x.head(1)).ffill()],
-                        Time=lambda df_: [f.convert_to_seconds(time)
-                                          if f.convert_to_seconds(time) == winner
-                                          else f.convert_to_seconds(time) + winner
-                                          if f.convert_to_seconds(time) is not None
-                                          else None for time, winner in
-                                          zip(df_.Time, df_.TimeWinner)]
-                    )
-                    .drop(columns='TimeWinner')
-                )
-        return overall_tbl
+                           force_cache: Optional[bool] = None) -> pd.DataFrame:
+        overall_tbl = self._cached_section(race_id, 'yby', force_cache)
+        if overall_tbl is None:
+            overall_tbl = parse_hist_yby(self.transport.get_content(RACE_PAGE_URL.format(race_id, 'X'), hedge=True),
+                                         convert_to_sec, self.parse_mode)
+        elif convert_to_sec:
+            overall_tbl = (
+                overall_tbl
+                .assign(Time=lambda df_: f.times_to_seconds(df_.Time))
+                .assign(TimeWinner=lambda df_: df_.groupby('Year')['Time'].transform('first'))
+                .assign(Time=lambda df_: df_.Time.where(df_.Time == df_.TimeWinner, df_.Time + df_.TimeWinner))
+                .drop(columns='TimeWinner')
+            )
+        return self._section_output(overall_tbl, 'yby', race_id, **({'Time': 'Int64'} if convert_to_sec else {}))
+
+    def iter_race_hist_yby(self,
+                           race_id: int,
+                           convert_to_sec: bool = False
+                           ) -> Iterator[pd.DataFrame]:
+        """Stream year-by-year results from the site, one edition at a time.
+
+        Page is parsed while it is downloaded and parsed editions are dropped,
+        so memory stays flat for races with a century of results.
+
+        Args:
+            race_id: race id
+            convert_to_sec: convert finish times and gaps to seconds
+
+        Returns:
+            results of one edition in the order of the page
+        """
+        for edition in iter_hist_yby(self.transport.stream(RACE_PAGE_URL.format(race_id, 'X')), convert_to_sec):
+            yield self._section_output(edition, 'yby', race_id, **({'Time': 'Int64'} if convert_to_sec else {}))
 
     def read_race_hist_victories(self,
                                  race_id: int,
-                                 force_cache: bool = True) -> Optional[pd.DataFrame]:
-
-        if not force_cache or self.no_cache:
-            victory_url = FIRSTCYCLING_URL + "race.php?r={}&k=W"
-            page = bs4.BeautifulSoup(requests.get(victory_url.format(race_id)).content, 'lxml')
-            body = page.find("body")
-            tbl_victory = body.find("tbody")
-            dom = etree.HTML(str(body))
-
-            text = [x.strip('\t').strip('\r') for x in tbl_victory.text.split('\n') if x not in ['', ' ', '\r']]
-            if len(text) == 0:
-                return None
-            text = [x.strip(' ').strip('\t') for x in text if re.search(r'(\w)|(\d)', x) is not None]
-            results = [[pos, rider, country_name, first, second, third] \
-                       for pos, rider, country_name, first, second, third in zip(
-                text[::6],
-                text[1::6],
-                text[2::6],
-                text[3::6],
-                text[4::6],
-                text[5::6]
-            )]
-
-            xpath_winner = [[
-                *f.xpath_element(dom, XPATH_HIST_GEN, 3, tr, 3, 'span'),
-                *f.xpath_element(dom, XPATH_HIST_GEN, 3, tr, 2, 'a')
-            ] for tr in range(1, len(tbl_victory.find_all('tr')) + 1)]
-            countries = [f.re_country_flag(flag[0]) for flag in xpath_winner]
-            riders_id = [f.re_racer_id(rider_id[1]) for rider_id in xpath_winner]
-            riders_link = [rider_id[1] for rider_id in xpath_winner]
-            winner = (
-                pd.DataFrame(
-                    [[country, r_id, r_link, *res] for country, r_id, r_link, res in zip(
-                        countries, riders_id, riders_link, results
-                    )],
-                    columns=['RiderCountry', 'RiderID', 'RiderLink', 'Position', 'Rider', 'CountryName',
-                             'FirstPlace', 'SecondPlace', 'ThirdPlace'])
-                .assign(RiderLink=lambda df_: FIRSTCYCLING_URL + df_.RiderLink)
-                .loc[:, ['Position', 'RiderCountry', 'RiderID', 'RiderLink', 'Rider', 'CountryName',
-                         'FirstPlace', 'SecondPlace', 'ThirdPlace']]
-            )
-        else:
-            foldermask = "races/race_{}"
-            folderpath = self.data_dir / foldermask.format(race_id)
-            with Path(folderpath.joinpath('history_race.json')).open('r') as file:
-                hist_race = json.load(file)
-            data = hist_race['victory']['data']
-            headers = hist_race['victory']['headers']
-            winner = pd.DataFrame(data, columns=headers)
-            if winner.shape[0] == 0:
-                winner = None
-        return winner
+                                 force_cache: Optional[bool] = None) -> Optional[pd.DataFrame]:
+        winner = self._cached_section(race_id, 'victory', force_cache)
+        if winner is None:
+            winner = parse_hist_victories(self.transport.get_content(RACE_PAGE_URL.format(race_id, 'W')),
+                                          self.parse_mode)
+        elif winner.shape[0] == 0:
+            winner = None
+        return self._section_output(winner, 'victory', race_id)
 
     def read_race_hist_stages(self,
                               race_id: int,
-                              force_cache: bool = True
+                              force_cache: Optional[bool] = None
                               ) -> Optional[pd.DataFrame]:
-        if not force_cache or self.no_cache:
-            stages_url = FIRSTCYCLING_URL + "race.php?r={}&k=Z"
-            page = bs4.BeautifulSoup(requests.get(stages_url.format(race_id)).content, 'lxml')
-            body = page.find("body")
-            tbl_stages = body.find("tbody")
-            dom = etree.HTML(str(body))
-
-            text = [x.strip('\t').strip('\r') for x in tbl_stages.text.split('\n') if x not in ['', ' ', '\r']]
-            if len(text) == 0:
-                return None
-            text = [x.strip(' ').strip('\t') for x in text if re.search(r'(\w)|(\d)', x) is not None]
-            results = [[pos, rider, country_name, win] for pos, rider, country_name, win in zip(
-                text[::4],
-                text[1::4],
-                text[2::4],
-                text[3::4]
-            )]
-            xpath_stage = [[
-                *f.xpath_element(dom, XPATH_HIST_GEN, 3, tr, 3, 'span'),
-                *f.xpath_element(dom, XPATH_HIST_GEN, 3, tr, 2, 'a')
-            ] for tr in range(1, len(tbl_stages.find_all('tr')) + 1)]
-            countries = [f.re_country_flag(flag[0]) for flag in xpath_stage]
-            riders_id = [f.re_racer_id(rider_id[1]) for rider_id in xpath_stage]
-            riders_link = [rider_id[1] for rider_id in xpath_stage]
-            win_stages = (
-                pd.DataFrame(
-                    [[country, r_id, r_link, *res] for country, r_id, r_link, res in zip(
-                        countries, riders_id, riders_link, results
-                    )],
-                    columns=['RiderCountry', 'RiderID', 'RiderLink', 'Position', 'Rider', 'CountryName', 'WinStages'])
-                .assign(RiderLink=lambda df_: FIRSTCYCLING_URL + df_.RiderLink)
-                .loc[:, ['Position', 'RiderCountry', 'RiderID', 'RiderLink', 'Rider', 'CountryName', 'WinStages']]
-            )
-        else:
-            foldermask = "races/race_{}"
-            folderpath = self.data_dir / foldermask.format(race_id)
-            with Path(folderpath.joinpath('history_race.json')).open('r') as file:
-                hist_race = json.load(file)
-            data = hist_race['stage']['data']
-            headers = hist_race['stage']['headers']
-            win_stages = pd.DataFrame(data, columns=headers)
-            if win_stages.shape[0] == 0:
-                win_stages = None
-        return win_stages
+        win_stages = self._cached_section(race_id, 'stage', force_cache)
+        if win_stages is None:
+            win_stages = parse_hist_stages(self.transport.get_content(RACE_PAGE_URL.format(race_id, 'Z')),
+                                           self.parse_mode)
+        elif win_stages.shape[0] == 0:
+            win_stages = None
+        return self._section_output(win_stages, 'stage', race_id)
 
     def read_race_hist_young_old_win(self,
                                      race_id: int,
-                                     force_cache: bool = True
+                                     force_cache: Optional[bool] = None
                                      ) -> Optional[pd.DataFrame]:
-        overall_tbl = pd.DataFrame()
-        if not force_cache or self.no_cache:
-            yby_url = FIRSTCYCLING_URL + "race.php?r={}&k=Y"
-            page = bs4.BeautifulSoup(requests.get(yby_url.format(race_id)).content, 'lxml')
-            body = page.find("body")
-            tbl_yo = body.find_all("tbody")
-            dom = etree.HTML(str(body))
-
-            for i, yo in enumerate(tbl_yo):
-                text = [x.strip('\t').strip(' ') for x in yo.text.split('\n') if x not in ['', ' ', '\r']]
-                if f.is_blank(text):
-                    return None
-                tbl = [[year, rider, country_name, age] for year, rider, country_name, age in zip(text[::4],
-                                                                                                  text[1::4],
-                                                                                                  text[2::4],
-                                                                                                  text[3::4])]
-                xpath_year = [[
-                    *f.xpath_element(dom, XPATH_HIST_YO, 3, tr, 3, 'span', table=i+1),
-                    *f.xpath_element(dom, XPATH_HIST_YO, 3, tr, 2, 'a', table=i+1)
-                ] for tr in range(1, len(yo.find_all('td')) + 1)]
-                countries = [f.re_country_flag(flag[0]) for flag in xpath_year]
-                riders_id = [f.re_racer_id(rider_id[1]) for rider_id in xpath_year]
-                riders_link = [rider_id[1] for rider_id in xpath_year]
-                age_winner = (
-                    pd.DataFrame([[country, r_id, r_link, *info] for country, r_id, r_link, info in zip(
-                        countries, riders_id, riders_link, tbl
-                    )],
-                                 columns=['RiderCountry', 'RiderID', 'RiderLink', 'Year', 'Rider', 'CountryName', 'Age'])
-                    .assign(
-                        AgeType='Youngest' if i == 0 else 'Oldest',
-                        RiderLink=lambda df_: FIRSTCYCLING_URL + df_.RiderLink
-                    )
-                    .loc[:, ['Year', 'AgeType', 'RiderCountry', 'RiderID', 'RiderLink', 'Rider', 'CountryName', 'Age']]
-                )
-                overall_tbl = pd.concat([overall_tbl, age_winner], axis=0, ignore_index=True)
-        else:
-            foldermask = "races/race_{}"
-            folderpath = self.data_dir / foldermask.format(race_id)
-            with Path(folderpath.joinpath('history_race.json')).open('r') as file:
-                hist_race = json.load(file)
-            data = hist_race['age_winner']['data']
-            headers = hist_race['age_winner']['headers']
-            overall_tbl = pd.DataFrame(data, columns=headers)
-            if overall_tbl.shape[0] == 0:
-                overall_tbl = None
-        return overall_tbl
+        overall_tbl = self._cached_section(race_id, 'age_winner', force_cache)
+        if overall_tbl is None:
+            overall_tbl = parse_hist_young_old_win(self.transport.get_content(RACE_PAGE_URL.format(race_id, 'Y')),
+                                                   self.parse_mode)
+        elif overall_tbl.shape[0] == 0:
+            overall_tbl = None
+        return self._section_output(overall_tbl, 'age_winner', race_id)
+
+    def _output(self, df: Optional[pd.DataFrame], race_id: Optional[int] = None) -> Optional[pd.DataFrame]:
+        return compact(df, self.dimensions, race_id) if self.compact else df
+
+    def _section_output(self,
+                        df: Optional[pd.DataFrame],
+                        section: str,
+                        race_id: int,
+                        **dtypes: str
+                        ) -> Optional[pd.DataFrame]:
+        """History section typed by storage.SCHEMAS, the same whether it was fetched or read from any storage."""
+        return self._output(conform(df, section, dtypes) if df is not None else None, race_id)
+
+    def expand(self, df: Optional[pd.DataFrame]) -> Optional[pd.DataFrame]:
+        """Names and links of a compact frame taken from self.dimensions.
+
+        Args:
+            df: frame returned in compact mode
+
+        Returns:
+            frame with rider and race names and links
+        """
+        return expand(df, self.dimensions)
+
+    def query(self, table: str, columns: Optional[List[str]] = None, **filters) -> pd.DataFrame:
+        """Query cached tables of all seasons and races, filters are pushed down to storage.
+
+        Args:
+            table: 'schedule' or section of race history ('general', 'yby', 'victory', 'stage', 'age_winner')
+            columns: columns to return, all if None
+            **filters: column -> value; a list or a set selects any of the values,
+                a (low, high) tuple selects inclusive range, e.g. Season=(2000, 2010), Category=['2.UWT']
+
+        Returns:
+            matching rows
+        """
+        return self.storage.query(table, columns, **filters)
+
+    def read_rider_results(self, rider_id: int) -> pd.DataFrame:
+        """Every result of a rider in stored race histories, answered from self.rider_index.
+
+        Races stored before the index existed are added by build_rider_index.
+
+        Args:
+            rider_id: rider id
+
+        Returns:
+            RaceID, Year, Table (section of HISTORY_PAGES), Classification (or age type) and Position of each result
+
+        Raises:
+            ValueError: storage has no default rider index and none was passed
+        """
+        return self._output(self._require_rider_index().lookup(rider_id))
+
+    def build_rider_index(self) -> int:
+        """Rebuild self.rider_index from all race histories in storage.
+
+        Returns:
+            number of indexed results
+        """
+        return self._require_rider_index().build(self.storage)
+
+    def _require_rider_index(self) -> RiderIndex:
+        if self.rider_index is None:
+            raise ValueError("{} has no default rider index, pass rider_index to FirstCycling".format(
+                type(self.storage).__name__))
+        return self.rider_index
 
     def read_race(self,
                   race_id: Optional[Union[int, List[int]]] = None,
-                  force_cache: bool = True,
+                  force_cache: Optional[bool] = None,
                   live: bool = True
                   ):
         """
@@ -0,0 +1,78 @@
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional, Callable
+
+HIT = 'hit'
+STALE = 'stale'
+FRESH = 'fresh'
+
+LOAD = 'load'
+FETCH = 'fetch'
+REFRESH = 'refresh'
+
+SCHEDULE_TTL = 60 * 60
+RACE_TTL = 6 * 60 * 60
+
+
+@dataclass
+class FreshnessPolicy(object):
+    """How long stored data is served without asking the site.
+
+    A schedule that covers the whole of a season that has ended and a race
+    history that already has an edition of the current year do not change
+    any more and are served from storage forever. Everything else is
+    refreshed once it is older than its TTL.
+
+    Attributes:
+        schedule_ttl: seconds a schedule of the current season stays fresh
+        race_ttl: seconds a history of a race without this year's edition stays fresh
+    """
+    schedule_ttl: float = SCHEDULE_TTL
+    race_ttl: float = RACE_TTL
+
+    def schedule_action(self,
+                        season: int,
+                        stored_at: Optional[float],
+                        force_cache: Optional[bool] = None,
+                        complete: bool = False
+                        ) -> str:
+        """
+
+        Args:
+            season: season of the schedule
+            stored_at: unix time schedule was stored, None if it is not stored
+            force_cache: True to load anything stored, False to always fetch, None to apply the policy
+            complete: stored schedule was fetched up to December after the season ended
+
+        Returns:
+            LOAD, FETCH or REFRESH
+        """
+        if force_cache is False or stored_at is None:
+            return FETCH
+        if force_cache or (complete and datetime.fromtimestamp(stored_at).year > season) or \
+                time.time() - stored_at < self.schedule_ttl:
+            return LOAD
+        return REFRESH
+
+    def race_action(self,
+                    stored_at: Optional[float],
+                    last_edition: Callable[[], Optional[int]],
+                    force_cache: Optional[bool] = None
+                    ) -> str:
+        """
+
+        Args:
+            stored_at: unix time race history was stored, None if it is not stored
+            last_edition: returns year of the latest stored edition, called only when TTL has expired
+            force_cache: True to load anything stored, False to always fetch, None to apply the policy
+
+        Returns:
+            LOAD, FETCH or REFRESH
+        """
+        if force_cache is False or stored_at is None:
+            return FETCH
+        if force_cache or time.time() - stored_at < self.race_ttl:
+            return LOAD
+        year = last_edition()
+        return LOAD if year is not None and year >= datetime.now().year else REFRESH
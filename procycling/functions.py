@@ -1,24 +1,53 @@
-from typing import List, Union, Optional
+from typing import List, Union, Optional, Iterator, Callable
 from datetime import datetime
 
+import bs4
 import pandas as pd
 from lxml import etree
 
-from procycling.utils import ISO_COUNTRY_CODE, RE_FLAG, RE_ID, RE_DATE_RACE
-
-
-def parse_race_dates(season: int, date: str):
-    d = date.split('-')
-    if len(d) == 1:
-        return [
-            datetime.strptime('.'.join([d[0], str(season)]), '%d.%M.%Y').strftime('%Y/%M/%d'),
-            datetime.strptime('.'.join([d[0], str(season)]), '%d.%M.%Y').strftime('%Y/%M/%d')
-        ]
-    else:
-        return [
-            datetime.strptime('.'.join([d[0], str(season)]), '%d.%M.%Y').strftime('%Y/%M/%d'),
-            datetime.strptime('.'.join([d[1], str(season)]), '%d.%M.%Y').strftime('%Y/%M/%d')
-        ]
+from procycling.utils import (
+    ISO_COUNTRY_CODE,
+    RE_FLAG,
+    RE_ID,
+    RE_DATE_RACE,
+    RE_DATE_RANGE,
+    RE_FLAG_CODE,
+    RE_ID_CODE,
+    RE_YEAR_CODE,
+    RE_RACE_TIME,
+    RE_CHARSET,
+    PARSE_MODE,
+    PAGE_ENCODING,
+    CHARSET_SNIFF_BYTES
+)
+
+XPATH_STRING = etree.XPath('string()')
+
+
+def parse_page(content: bytes, mode: str = PARSE_MODE, encoding: Optional[str] = None) -> etree._Element:
+    """
+
+    Args:
+        content: raw page body
+        mode: 'lxml' builds one lxml tree straight from the bytes,
+            'bs4' parses with BeautifulSoup and re-parses serialised body with lxml
+        encoding: charset of the body, e.g. from Content-Type header. If None, lxml detects
+            the charset declared in the head of the page and PAGE_ENCODING is used if none is
+
+    Returns:
+        root of lxml tree
+    """
+    if mode == 'bs4':
+        return etree.HTML(str(bs4.BeautifulSoup(content, 'lxml', from_encoding=encoding).find('body')))
+    if mode != 'lxml':
+        raise ValueError(f"Unknown parse mode: {mode}")
+    if encoding is None and not RE_CHARSET.search(content, 0, CHARSET_SNIFF_BYTES):
+        encoding = PAGE_ENCODING
+    return etree.fromstring(content, etree.HTMLParser(encoding=encoding))
+
+
+def element_text(element: etree._Element) -> str:
+    return XPATH_STRING(element)
 
 
 def re_country_flag(flag: str):
@@ -40,10 +69,29 @@ def re_racer_id(racer_id: str):
     return int(RE_ID.search(racer_id).group())
 
 
+def race_dates(dates: pd.Series, season: Union[int, pd.Series]) -> pd.DataFrame:
+    """Start and end dates of schedule races.
+
+    Args:
+        dates: 'dd.mm' or 'dd.mm-dd.mm' strings of schedule
+        season: season of every date, scalar or series aligned with ``dates``
+
+    Returns:
+        Date_Start and Date_End as datetime64, end falls in the next year if range crosses New Year
+    """
+    parts = dates.astype(object).str.extract(RE_DATE_RANGE).astype(float)
+    start = pd.to_datetime(pd.DataFrame({'year': season, 'month': parts[1], 'day': parts[0]},
+                                        index=dates.index), errors='coerce')
+    end = pd.to_datetime(pd.DataFrame({'year': season, 'month': parts[3].fillna(parts[1]),
+                                       'day': parts[2].fillna(parts[0])},
+                                      index=dates.index), errors='coerce')
+    end = end.where(~(end < start), end + pd.DateOffset(years=1))
+    return pd.DataFrame({'Date_Start': start, 'Date_End': end}, index=dates.index)
+
+
 def finish_race_in_current_month(season: int, races_info):
-    dt = [x for x in races_info if (RE_DATE_RACE.search(x) is not None) or (RE_DATE_RACE.search(x) is not None)]
-    return len([1 for date in dt if datetime.strptime(parse_race_dates(season, date)[1],
-                                                      "%Y/%M/%d").day < datetime.now().day])
+    dt = pd.Series([x for x in races_info if RE_DATE_RACE.search(x) is not None], dtype=object)
+    return int((race_dates(dt, season).Date_End.dt.day < datetime.now().day).sum())
 
 
 def is_blank(data: List[str]) -> bool:
@@ -60,36 +108,124 @@ def convert_to_seconds(race_time: str) -> int:
     elif len(race_time) == 2:
         return int(race_time[0]) * 60 + int(race_time[1])
     elif len(race_time) == 3:
-        return int(race_time[0]) * 3600 + int(race_time[0]) * 60 + int(race_time[1])
+        return int(race_time[0]) * 3600 + int(race_time[1]) * 60 + int(race_time[2])
+
+
+def _by_unique(values: pd.Series, transform: Callable[[pd.Series], pd.Series], dtype: str) -> pd.Series:
+    """Apply ``transform`` to distinct values only and broadcast back, missing values stay missing."""
+    codes, uniques = pd.factorize(values.astype(object))
+    result = pd.array(transform(pd.Series(uniques, dtype=object)).to_numpy(), dtype=dtype)
+    return pd.Series(result.take(codes, allow_fill=True), index=values.index)
+
+
+def flags_to_country(flags: pd.Series) -> pd.Series:
+    """Vectorized re_country_flag.
+
+    Args:
+        flags: class attributes of flag <span>, e.g. 'flag flag-fra'
+
+    Returns:
+        ISO3 codes, 'UCI' if flag has no code, 'UNK' if code is unknown, None if flag is missing
+    """
+    def transform(uniques: pd.Series) -> pd.Series:
+        codes = uniques.str.extract(RE_FLAG_CODE, expand=False).str.upper()
+        return codes.map(ISO_COUNTRY_CODE).where(codes.isna() | codes.isin(ISO_COUNTRY_CODE.keys()), 'UNK') \
+            .fillna('UCI')
+
+    return none_if_na(_by_unique(flags, transform, 'category'))
+
+
+def hrefs_to_id(hrefs: pd.Series) -> pd.Series:
+    """Vectorized re_racer_id.
+
+    Args:
+        hrefs: links with r=<id> parameter
+
+    Returns:
+        ids as Int64, <NA> if link is missing
+    """
+    return _by_unique(hrefs, lambda uniques: pd.to_numeric(uniques.str.extract(RE_ID_CODE, expand=False)), 'Int64')
 
 
-def xpath_element(
-        dom: etree._Element,
-        base_xpath: str,
-        div: int,
-        tr: int,
+def hrefs_to_year(hrefs: pd.Series) -> pd.Series:
+    """
+
+    Args:
+        hrefs: links with y=<year> parameter
+
+    Returns:
+        years as Int64
+    """
+    return _by_unique(hrefs, lambda uniques: pd.to_numeric(uniques.str.extract(RE_YEAR_CODE, expand=False)), 'Int64')
+
+
+def none_if_na(values: pd.Series) -> pd.Series:
+    return values.astype(object).where(values.notna(), None)
+
+
+def times_to_seconds(race_times: pd.Series) -> pd.Series:
+    """Vectorized convert_to_seconds, accepts 'h:mm:ss', 'm:ss', 's' and gaps with leading '+'.
+
+    Args:
+        race_times: finish times or gaps
+
+    Returns:
+        seconds as Int64, <NA> if time is missing or malformed
+    """
+    def transform(uniques: pd.Series) -> pd.Series:
+        parts = uniques.str.strip().str.extract(RE_RACE_TIME).astype(float)
+        return parts[0].fillna(0) * 3600 + parts[1].fillna(0) * 60 + parts[2]
+
+    return _by_unique(race_times, transform, 'Int64')
+
+
+def iter_rows(tbody: etree._Element) -> Iterator[List[etree._Element]]:
+    """
+
+    Args:
+        tbody: table body located once per page
+
+    Returns:
+        list of <td> cells of every row
+    """
+    for tr in tbody.iterchildren('tr'):
+        yield tr.findall('td')
+
+
+def cell_values(
+        cells: List[etree._Element],
         td: int,
         tag: str = None,
-        table: int = None,
         expected_length: int = 1,
         check_information: bool = False,
         return_text: bool = False
 ) -> List[Union[str, None]]:
-    if table is not None:
-        base_xpath = base_xpath.format(str(div), str(table), str(tr), str(td))
-    else:
-        base_xpath = base_xpath.format(str(div), str(tr), str(td))
-    xpath = base_xpath + '/' + tag if tag is not None else base_xpath
-    try:
-        res = dom.xpath(xpath)[0].values()
-    except IndexError:
-        res = [None] * expected_length
-    if check_information:
-        if dom.xpath(xpath)[0].text == 'Information':
-            return ['Information'] * expected_length
+    """Attribute values of ``tag`` child of ``td``-th cell (1-based), same as td[n]/tag in XPath.
+
+    Values are ordered by attribute name, as on the page re-serialised by
+    BeautifulSoup, so parsers read them by the same position in both modes.
+
+    Args:
+        cells: cells of one row from iter_rows
+        td: position of the cell
+        tag: child tag, the cell itself if None
+        expected_length: length of the result if element is missing
+        check_information: return ['Information'] * expected_length for 'Information' placeholder links
+        return_text: return text of the element instead of attribute values
+
+    Returns:
+        list of values
+    """
+    element = cells[td - 1] if len(cells) >= td else None
+    if element is not None and tag is not None:
+        element = element.find(tag)
+    if element is None:
+        return [None] * expected_length
+    if check_information and element.text == 'Information':
+        return ['Information'] * expected_length
     if return_text:
-        res = [dom.xpath(xpath)[0].text]
-    return res
+        return [element.text]
+    return [value for _, value in sorted(element.items())]
 
 
 def convert_dataframe_to_json(
@@ -100,6 +236,6 @@ def convert_dataframe_to_json(
         if columns:
             return df.columns.to_list()
         else:
-            return df.values.tolist()
+            return df.astype(object).where(df.notna(), None).values.tolist()
     else:
         return None
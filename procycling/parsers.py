@@ -0,0 +1,476 @@
+import re
+from typing import Optional, List, Iterable, Iterator, Set, Dict
+
+import pandas as pd
+from lxml import etree
+
+import procycling.functions as f
+from procycling.utils import (
+    FIRSTCYCLING_URL,
+    HISTORY_CODE,
+    HISTORY_PAGES,
+    PARSE_MODE,
+    RE_ID,
+    RE_YEAR_CODE,
+    RE_YBY_TIME,
+    RE_YBY_TIME_STRIP,
+    XPATH_TBODY_GEN,
+    XPATH_TBODY_YBY
+)
+
+TBODY_GEN = etree.XPath(XPATH_TBODY_GEN)
+TBODY_YBY = etree.XPath(XPATH_TBODY_YBY)
+
+YBY_COLUMNS = ['Position', 'RiderCountry', 'RiderID', 'RiderLink', 'Rider', 'Time', 'Year']
+
+
+def parse_schedule_month(content: bytes,
+                         season: int,
+                         gender: str,
+                         current_month: bool = False,
+                         mode: str = PARSE_MODE
+                         ) -> Optional[pd.DataFrame]:
+    """
+
+    Args:
+        content: body of race.php?y=..&t=..&m=.. page
+        season: season of the page
+        gender: 'M' or 'W'
+        current_month: keep only races finished before today
+        mode: parse mode, see functions.parse_page
+
+    Returns:
+        races of the month, None if page has no races
+    """
+    dom = f.parse_page(content, mode)
+    tbl_races = next(iter(TBODY_GEN(dom)), None)
+    if tbl_races is None:
+        return None
+    races_info = [x.strip('\t').strip('\r') for x in f.element_text(tbl_races).split('\n') if x not in ['', ' ', '\r']]
+    list_ids = [RE_ID.search(ids.get('href')).group() for ids in tbl_races.xpath('.//a[@href]')]
+
+    rows = list(f.iter_rows(tbl_races))
+    if current_month:
+        end_races = f.finish_race_in_current_month(season, races_info)
+        races_info = races_info[:end_races * 5]
+        list_ids = list_ids[: end_races * 3]
+        rows = rows[:end_races]
+    countries = [[f.cell_values(cells, td, 'span')[0] for td in range(3, 5)] for cells in rows]
+
+    list_ids_2d = [[x1, x2] for x1, x2 in zip(list_ids[0::3], list_ids[1::3])]
+    list_races = [[dates, cat, rname, win, *country, *ids] \
+                  for (dates, cat, rname, win, country, ids) in zip(races_info[0::5],
+                                                                    races_info[1::5],
+                                                                    races_info[2::5],
+                                                                    races_info[3::5],
+                                                                    countries,
+                                                                    list_ids_2d)]
+
+    races_month = (
+        pd.DataFrame(list_races, columns=['Date', 'Category', 'Race_Name', 'Winner',
+                                          'Country_Race', 'Country_Winner',
+                                          'RaceID', 'WinnerID'])
+        .assign(
+            Country_Race=lambda df_: f.flags_to_country(df_.Country_Race),
+            Country_Winner=lambda df_: f.flags_to_country(df_.Country_Winner),
+            Season_RaceID=lambda df_: ["_".join([str(season), race_id]) for race_id in df_.RaceID],
+            Season=season,
+            Gender=gender,
+            Profile_Type=lambda df_: ['Stage Race' if x == '2' else 'One Day' for x in
+                                      df_.Category.str[:1]],
+        )
+        .pipe(lambda df_: df_.join(f.race_dates(df_.Date, season)))
+        .loc[:, ['Season_RaceID', 'Season', 'Date', 'Date_Start', 'Date_End', 'RaceID', 'Race_Name',
+                 'Category', 'Gender', 'Profile_Type', 'Country_Race', 'WinnerID', 'Winner',
+                 'Country_Winner']]
+    )
+    return races_month
+
+
+def parse_race_catalog_month(content: bytes, mode: str = PARSE_MODE) -> List[List]:
+    """
+
+    Args:
+        content: body of race.php?y=..&t=..&m=.. page
+        mode: parse mode, see functions.parse_page
+
+    Returns:
+        rows of RaceScraper catalog for one month
+    """
+    dom = f.parse_page(content, mode)
+    tbl = next(iter(TBODY_GEN(dom)), None)
+    if tbl is None:
+        return []
+    text = [x.strip('\t').strip('\r') for x in f.element_text(tbl).split('\n') if x not in ['', ' ', '\r']]
+    text = [[x1, x2, x3, x4, x5] for x1, x2, x3, x4, x5 in zip(text[::5],
+                                                               text[1::5],
+                                                               text[2::5],
+                                                               text[3::5],
+                                                               text[4::5])]
+    xpath = [[
+        *f.cell_values(cells, 3, 'span'),
+        *f.cell_values(cells, 3, 'a', expected_length=2),
+        *f.cell_values(cells, 4, 'span'),
+        *f.cell_values(cells, 4, 'a', expected_length=2)
+    ] for cells in f.iter_rows(tbl)]
+    flag_race = [f.re_country_flag(flag[0]) for flag in xpath]
+    res_lnk = [FIRSTCYCLING_URL + lnk[1] for lnk in xpath]
+    winner_flag = [f.re_country_flag(flag[3]) for flag in xpath]
+    rider_id = [f.re_racer_id(rider_id[4]) for rider_id in xpath]
+    rider_lnk = [FIRSTCYCLING_URL + rider_id[4] if isinstance(rider_id[4], str) else None for rider_id in xpath]
+    races_month = [[res[0], res[1], flag_race, res[2], res_lnk,
+                    winner_flag, rider_id, res[3], rider_lnk] for (flag_race,
+                                                                   res_lnk,
+                                                                   winner_flag,
+                                                                   rider_id,
+                                                                   rider_lnk,
+                                                                   res) in zip(flag_race,
+                                                                               res_lnk,
+                                                                               winner_flag,
+                                                                               rider_id,
+                                                                               rider_lnk,
+                                                                               text)]
+    return races_month
+
+
+def parse_hist_general(content: bytes,
+                       k: int,
+                       mode: str = PARSE_MODE,
+                       skip_years: Optional[Set[int]] = None
+                       ) -> pd.DataFrame:
+    """
+
+    Args:
+        content: body of race.php?r=..&k=1..4 page
+        k: classification code of the page, key of HISTORY_CODE
+        mode: parse mode, see functions.parse_page
+        skip_years: editions left out before their cells are read, e.g. years already stored
+
+    Returns:
+        podiums of all editions in one classification
+    """
+    dom = f.parse_page(content, mode)
+    tbl_history = next(iter(TBODY_GEN(dom)), None)
+
+    hist_df = (
+        pd.DataFrame([[
+            *f.cell_values(cells, 1, 'a'),
+            *f.cell_values(cells, 2, return_text=True),
+            *f.cell_values(cells, 3, 'a', expected_length=3, check_information=True),
+            *f.cell_values(cells, 4, 'span'),
+            *f.cell_values(cells, 4, 'a', expected_length=2),
+            *f.cell_values(cells, 5, 'span'),
+            *f.cell_values(cells, 5, 'a', expected_length=2),
+            *f.cell_values(cells, 6, 'span'),
+            *f.cell_values(cells, 6, 'a', expected_length=2),
+        ] for cells in f.iter_rows(tbl_history) if not skip_years or _row_year(cells) not in skip_years],
+            columns=['Year', 'Category', 'Information', 'RaceLink', 'Results',
+                     'WinnerCountry', 'WinnerID', 'Winner', 'SecondCountry', 'SecondID',
+                     'Second', 'ThirdCountry', 'ThirdID', 'Third'])
+        .pipe(lambda df_: df_.loc[df_.Information != 'Information']).reset_index(drop=True)
+        .drop(columns=['Information', 'Results'])
+        .assign(
+            Year=lambda df_: f.hrefs_to_year(df_.Year).astype('Int32'),
+            RaceLink=lambda df_: FIRSTCYCLING_URL + df_.RaceLink,
+            WinnerCountry=lambda df_: f.flags_to_country(df_.WinnerCountry),
+            WinnerLink=lambda df_: FIRSTCYCLING_URL + df_.WinnerID,
+            WinnerID=lambda df_: f.hrefs_to_id(df_.WinnerID),
+            SecondCountry=lambda df_: f.flags_to_country(df_.SecondCountry),
+            SecondLink=lambda df_: FIRSTCYCLING_URL + df_.SecondID,
+            SecondID=lambda df_: f.hrefs_to_id(df_.SecondID),
+            ThirdCountry=lambda df_: f.flags_to_country(df_.ThirdCountry),
+            ThirdLink=lambda df_: FIRSTCYCLING_URL + df_.ThirdID,
+            ThirdID=lambda df_: f.hrefs_to_id(df_.ThirdID),
+            Classification=HISTORY_CODE[k]
+        )
+        .loc[:, ['Classification', 'Year', 'Category', 'RaceLink', 'WinnerCountry', 'WinnerID', 'Winner',
+                 'WinnerLink', 'SecondCountry', 'SecondID', 'Second', 'SecondLink', 'ThirdCountry',
+                 'ThirdID', 'Third', 'ThirdLink']]
+    )
+    return hist_df
+
+
+def parse_hist_yby(content: bytes,
+                   convert_to_sec: bool = False,
+                   mode: str = PARSE_MODE,
+                   skip_years: Optional[Set[int]] = None
+                   ) -> pd.DataFrame:
+    """
+
+    Args:
+        content: body of race.php?r=..&k=X page
+        convert_to_sec: convert finish times and gaps to seconds
+        mode: parse mode, see functions.parse_page
+        skip_years: editions (values of Year column) left out before their rows are read
+
+    Returns:
+        results of all editions
+    """
+    dom = f.parse_page(content, mode)
+    editions = [_yby_edition(tbl_year) for tbl_year in TBODY_YBY(dom)
+                if not skip_years or _edition_year(tbl_year) not in skip_years]
+    overall_tbl = pd.concat(editions, axis=0, ignore_index=True) if editions else pd.DataFrame(columns=YBY_COLUMNS)
+    return _yby_time(overall_tbl, convert_to_sec)
+
+
+def iter_hist_yby(chunks: Iterable[bytes],
+                  convert_to_sec: bool = False,
+                  encoding: str = 'utf-8'
+                  ) -> Iterator[pd.DataFrame]:
+    """Incremental parser of race.php?r=..&k=X page.
+
+    Every edition is yielded as soon as its <tbody> is closed, after that
+    the parsed elements are dropped from the tree, so memory does not grow
+    with the number of editions.
+
+    Args:
+        chunks: body of the page in chunks, e.g. Transport.stream
+        convert_to_sec: convert finish times and gaps to seconds
+        encoding: encoding of the page
+
+    Returns:
+        results of one edition
+    """
+    parser = etree.HTMLPullParser(events=('end',), tag='tbody', encoding=encoding)
+
+    def events():
+        for chunk in chunks:
+            parser.feed(chunk)
+            yield from parser.read_events()
+        parser.close()
+        yield from parser.read_events()
+
+    for _, tbody in events():
+        if _is_yby_tbody(tbody):
+            yield _yby_time(_yby_edition(tbody), convert_to_sec)
+        tbody.clear()
+        for element in [tbody, *tbody.iterancestors()]:
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+
+
+def _is_yby_tbody(tbody: etree._Element) -> bool:
+    ancestors = list(tbody.iterancestors())
+    return [a.tag for a in ancestors[:4]] == ['table', 'div', 'div', 'div'] and \
+        len(ancestors) > 4 and ancestors[4].get('id') == 'wrapper'
+
+
+def _row_year(cells: List[etree._Element]) -> Optional[int]:
+    link = f.cell_values(cells, 1, 'a')[0]
+    year = RE_YEAR_CODE.search(link) if link is not None else None
+    return int(year.group(1)) if year is not None else None
+
+
+def _edition_year(tbl_year: etree._Element) -> Optional[int]:
+    thead = tbl_year.getparent().find('thead')
+    return int(f.element_text(thead)) if thead is not None else None
+
+
+def _yby_edition(tbl_year: etree._Element) -> pd.DataFrame:
+    text = [x.strip('\t') for x in f.element_text(tbl_year).split('\n') if x not in ['', ' ', '\r']]
+    xpath_year = [[
+        *f.cell_values(cells, 2, 'span'),
+        *f.cell_values(cells, 3, 'a')
+    ] for cells in f.iter_rows(tbl_year)]
+    year = (
+        pd.DataFrame([[int(pos), *xpath[:2], res] for pos, xpath, res in zip(text[::2], xpath_year, text[1::2])],
+                     columns=['Position', 'RiderCountry', 'RiderLink', 'Rider'], dtype=object)
+        .assign(
+            RiderCountry=lambda df_: f.flags_to_country(df_.RiderCountry),
+            RiderID=lambda df_: f.hrefs_to_id(df_.RiderLink),
+            RiderLink=lambda df_: FIRSTCYCLING_URL + df_.RiderLink,
+            Time=lambda df_: f.none_if_na(df_.Rider.str.extract(RE_YBY_TIME, expand=False)),
+            Rider=lambda df_: df_.Rider.str.replace(RE_YBY_TIME_STRIP, '', regex=True),
+            Year=_edition_year(tbl_year),
+        )
+        .astype({'Position': int, 'Year': 'Int32'})
+        .loc[:, YBY_COLUMNS]
+    )
+    return year
+
+
+def _yby_time(overall_tbl: pd.DataFrame, convert_to_sec: bool) -> pd.DataFrame:
+    if convert_to_sec:
+        overall_tbl = (
+            overall_tbl
+            .merge(
+                (
+                    overall_tbl
+                    .pipe(lambda df_: df_.loc[df_.Position == 1])
+                    .drop(columns=['Position', 'Rider', 'RiderLink', 'RiderCountry', 'RiderID'])
+                    .reset_index(drop=True)
+                ),
+                how='inner',
+                on=['Year']
+            )
+            .assign(
+                Time_x=lambda df_: f.times_to_seconds(df_.Time_x).where(
+                    df_.Time_x == df_.Time_y,
+                    f.times_to_seconds(df_.Time_x) + f.times_to_seconds(df_.Time_y)
+                )
+            )
+            .drop(columns=['Time_y'])
+            .rename(columns={'Time_x': 'Time'})
+        )
+    else:
+        overall_tbl = (
+            overall_tbl
+            .assign(Time=lambda df_: df_.Time.where(
+                (df_.Position == 1) | df_.Time.isna(), '+' + df_.Time.astype(object)
+            ))
+        )
+    return overall_tbl
+
+
+def parse_hist_victories(content: bytes, mode: str = PARSE_MODE) -> Optional[pd.DataFrame]:
+    """
+
+    Args:
+        content: body of race.php?r=..&k=W page
+        mode: parse mode, see functions.parse_page
+
+    Returns:
+        riders by number of podiums, None if race has no such table
+    """
+    dom = f.parse_page(content, mode)
+    tbl_victory = next(iter(TBODY_GEN(dom)), None)
+
+    if tbl_victory is None:
+        return None
+    text = [x.strip('\t').strip('\r') for x in f.element_text(tbl_victory).split('\n') if x not in ['', ' ', '\r']]
+    if len(text) == 0:
+        return None
+    text = [x.strip(' ').strip('\t') for x in text if re.search(r'(\w)|(\d)', x) is not None]
+    results = [[pos, rider, country_name, first, second, third] \
+               for pos, rider, country_name, first, second, third in zip(
+        text[::6],
+        text[1::6],
+        text[2::6],
+        text[3::6],
+        text[4::6],
+        text[5::6]
+    )]
+
+    xpath_winner = [[
+        *f.cell_values(cells, 3, 'span'),
+        *f.cell_values(cells, 2, 'a')
+    ] for cells in f.iter_rows(tbl_victory)]
+    winner = (
+        pd.DataFrame(
+            [[*xpath[:2], *res] for xpath, res in zip(xpath_winner, results)],
+            columns=['RiderCountry', 'RiderLink', 'Position', 'Rider', 'CountryName',
+                     'FirstPlace', 'SecondPlace', 'ThirdPlace'])
+        .assign(
+            RiderCountry=lambda df_: f.flags_to_country(df_.RiderCountry),
+            RiderID=lambda df_: f.hrefs_to_id(df_.RiderLink),
+            RiderLink=lambda df_: FIRSTCYCLING_URL + df_.RiderLink
+        )
+        .loc[:, ['Position', 'RiderCountry', 'RiderID', 'RiderLink', 'Rider', 'CountryName',
+                 'FirstPlace', 'SecondPlace', 'ThirdPlace']]
+    )
+    return winner
+
+
+def parse_hist_stages(content: bytes, mode: str = PARSE_MODE) -> Optional[pd.DataFrame]:
+    """
+
+    Args:
+        content: body of race.php?r=..&k=Z page
+        mode: parse mode, see functions.parse_page
+
+    Returns:
+        riders by number of stage wins, None if race has no stages
+    """
+    dom = f.parse_page(content, mode)
+    tbl_stages = next(iter(TBODY_GEN(dom)), None)
+
+    if tbl_stages is None:
+        return None
+    text = [x.strip('\t').strip('\r') for x in f.element_text(tbl_stages).split('\n') if x not in ['', ' ', '\r']]
+    if len(text) == 0:
+        return None
+    text = [x.strip(' ').strip('\t') for x in text if re.search(r'(\w)|(\d)', x) is not None]
+    results = [[pos, rider, country_name, win] for pos, rider, country_name, win in zip(
+        text[::4],
+        text[1::4],
+        text[2::4],
+        text[3::4]
+    )]
+    xpath_stage = [[
+        *f.cell_values(cells, 3, 'span'),
+        *f.cell_values(cells, 2, 'a')
+    ] for cells in f.iter_rows(tbl_stages)]
+    win_stages = (
+        pd.DataFrame(
+            [[*xpath[:2], *res] for xpath, res in zip(xpath_stage, results)],
+            columns=['RiderCountry', 'RiderLink', 'Position', 'Rider', 'CountryName', 'WinStages'])
+        .assign(
+            RiderCountry=lambda df_: f.flags_to_country(df_.RiderCountry),
+            RiderID=lambda df_: f.hrefs_to_id(df_.RiderLink),
+            RiderLink=lambda df_: FIRSTCYCLING_URL + df_.RiderLink
+        )
+        .loc[:, ['Position', 'RiderCountry', 'RiderID', 'RiderLink', 'Rider', 'CountryName', 'WinStages']]
+    )
+    return win_stages
+
+
+def parse_hist_young_old_win(content: bytes, mode: str = PARSE_MODE) -> Optional[pd.DataFrame]:
+    """
+
+    Args:
+        content: body of race.php?r=..&k=Y page
+        mode: parse mode, see functions.parse_page
+
+    Returns:
+        youngest and oldest winners, None if race has no such tables
+    """
+    overall_tbl = pd.DataFrame()
+    dom = f.parse_page(content, mode)
+    tbl_yo = TBODY_GEN(dom)
+
+    for i, yo in enumerate(tbl_yo):
+        text = [x.strip('\t').strip(' ') for x in f.element_text(yo).split('\n') if x not in ['', ' ', '\r']]
+        if f.is_blank(text):
+            return None
+        tbl = [[year, rider, country_name, age] for year, rider, country_name, age in zip(text[::4],
+                                                                                          text[1::4],
+                                                                                          text[2::4],
+                                                                                          text[3::4])]
+        xpath_year = [[
+            *f.cell_values(cells, 3, 'span'),
+            *f.cell_values(cells, 2, 'a')
+        ] for cells in f.iter_rows(yo)]
+        age_winner = (
+            pd.DataFrame([[*xpath[:2], *info] for xpath, info in zip(xpath_year, tbl)],
+                         columns=['RiderCountry', 'RiderLink', 'Year', 'Rider', 'CountryName', 'Age'])
+            .assign(
+                AgeType='Youngest' if i == 0 else 'Oldest',
+                RiderCountry=lambda df_: f.flags_to_country(df_.RiderCountry),
+                RiderID=lambda df_: f.hrefs_to_id(df_.RiderLink),
+                RiderLink=lambda df_: FIRSTCYCLING_URL + df_.RiderLink,
+                Year=lambda df_: pd.to_numeric(df_.Year).astype('Int32')
+            )
+            .loc[:, ['Year', 'AgeType', 'RiderCountry', 'RiderID', 'RiderLink', 'Rider', 'CountryName', 'Age']]
+        )
+        overall_tbl = pd.concat([overall_tbl, age_winner], axis=0, ignore_index=True)
+    return overall_tbl
+
+
+def parse_race_pages(race_pages: Dict[str, bytes], mode: str = PARSE_MODE) -> List[Optional[pd.DataFrame]]:
+    """
+
+    Args:
+        race_pages: body of every page of HISTORY_PAGES by its k
+        mode: parse mode, see functions.parse_page
+
+    Returns:
+        general, yby, victory, stage and age_winner tables
+    """
+    return [
+        pd.concat([parse_hist_general(race_pages[k], int(k), mode) for k in HISTORY_PAGES['general']],
+                  axis=0, ignore_index=True),
+        parse_hist_yby(race_pages['X'], mode=mode),
+        parse_hist_victories(race_pages['W'], mode),
+        parse_hist_stages(race_pages['Z'], mode),
+        parse_hist_young_old_win(race_pages['Y'], mode)
+    ]
@@ -0,0 +1,230 @@
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import dataclass, field
+from itertools import chain, islice
+from typing import Optional, List, Dict, Iterable, Iterator, Callable
+
+import numpy as np
+import pandas as pd
+
+from procycling.parsers import parse_race_pages
+from procycling.transport import Transport
+from procycling.utils import HISTORY_PAGES, PARSE_MODE, RACE_PAGE_URL
+
+FETCH_WORKERS = 4
+QUEUE_PER_WORKER = 2
+PAGES = [k for section in HISTORY_PAGES.values() for k in section]
+# parse processes are never forked from the threaded parent, a fork could copy locks held by fetch threads
+PARSE_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+
+def frame_to_columns(df: Optional[pd.DataFrame]) -> Optional[Dict]:
+    """Plain column data of a frame, cheap to pickle between processes.
+
+    Numeric columns are sent as numpy arrays, nullable integers as values
+    and mask arrays and all other columns as lists of Python objects.
+
+    Args:
+        df: parsed table
+
+    Returns:
+        {'columns': .., 'dtypes': .., 'values': ..}, None if df is None
+    """
+    if df is None:
+        return None
+    values = []
+    for column, dtype in df.dtypes.items():
+        series = df[column]
+        if isinstance(dtype, np.dtype) and dtype.kind in 'biufM':
+            values.append(series.to_numpy())
+        elif pd.api.types.is_extension_array_dtype(dtype) and pd.api.types.is_integer_dtype(dtype):
+            values.append((series.to_numpy(dtype='int64', na_value=0), series.isna().to_numpy()))
+        else:
+            values.append(series.astype(object).where(series.notna(), None).tolist())
+    return {'columns': list(df.columns), 'dtypes': [str(dtype) for dtype in df.dtypes], 'values': values}
+
+
+def columns_to_frame(columns: Optional[Dict]) -> Optional[pd.DataFrame]:
+    """
+
+    Args:
+        columns: result of frame_to_columns
+
+    Returns:
+        frame equal to the one passed to frame_to_columns
+    """
+    if columns is None:
+        return None
+    data = {}
+    for column, dtype, values in zip(columns['columns'], columns['dtypes'], columns['values']):
+        if isinstance(values, tuple):
+            data[column] = pd.array(pd.arrays.IntegerArray(*values), dtype=dtype)
+        else:
+            data[column] = pd.array(values, dtype=dtype if dtype != 'object' else object)
+    return pd.DataFrame(data, columns=columns['columns'])
+
+
+def parse_race_columns(race_pages: Dict[str, bytes], mode: str = PARSE_MODE) -> List[Optional[Dict]]:
+    """parsers.parse_race_pages returning column data, runs in a worker process of RacePipeline."""
+    return [frame_to_columns(tbl) for tbl in parse_race_pages(race_pages, mode)]
+
+
+def _unique(race_ids: Iterable[int]) -> Iterator[int]:
+    seen = set()
+    for race_id in race_ids:
+        if race_id not in seen:
+            seen.add(race_id)
+            yield race_id
+
+
+@dataclass
+class ParsedRace(object):
+    """Race that went through RacePipeline.
+
+    Attributes:
+        race_id: race id
+        tables: general, yby, victory, stage and age_winner tables, None if fetching or parsing failed
+        validators: url -> validator of fetched pages, see Transport.get_if_changed
+        error: exception raised while fetching or parsing, None on success
+    """
+    race_id: int
+    tables: Optional[List[Optional[pd.DataFrame]]] = None
+    validators: Optional[Dict] = None
+    error: Optional[Exception] = None
+
+
+@dataclass
+class _FetchedRace(object):
+    race_id: int
+    pages: Dict[str, Optional[bytes]] = field(default_factory=dict)
+    validators: Dict[str, Dict] = field(default_factory=dict)
+    error: Optional[Exception] = None
+
+    @property
+    def complete(self) -> bool:
+        return len(self.pages) == len(PAGES)
+
+
+class RacePipeline(object):
+    """Bulk race history reads with fetching and parsing in separate stages.
+
+    Every (race, page) fetch is a job of one pool of ``fetch_workers``
+    threads. Pages are grouped by race and a race with all PAGES fetched
+    goes to a pool of ``parse_workers`` processes, so parsing is not
+    serialised by the GIL, and comes back as column data (see
+    frame_to_columns) instead of pickled DataFrames. At most ``queue_size``
+    fetched races wait for a parse process and at most ``queue_size`` are
+    parsed at once: slow parsing stops the downloads, a slow consumer stops
+    both.
+
+    Starting parse processes costs more than parsing a few races, so by
+    default a batch is parsed in the consuming thread on a single CPU or
+    when it has fewer races than there are CPUs. Parse processes are
+    started with PARSE_START_METHOD, so a script that runs a pipeline with
+    them needs the ``if __name__ == '__main__'`` guard.
+    """
+
+    def __init__(self,
+                 transport: Transport,
+                 parse_mode: str = PARSE_MODE,
+                 fetch_workers: int = FETCH_WORKERS,
+                 parse_workers: Optional[int] = None,
+                 queue_size: Optional[int] = None
+                 ):
+        """
+
+        Args:
+            transport: HTTP client of the fetch stage
+            parse_mode: parse mode of pages, see functions.parse_page
+            fetch_workers: number of pages fetched concurrently
+            parse_workers: number of parse processes, 0 parses in the consuming thread; if None one per CPU
+                for batches of at least as many races as CPUs, in the consuming thread otherwise
+            queue_size: bound of fetched races waiting for and being parsed, QUEUE_PER_WORKER per parse process
+                if None
+        """
+        self.transport = transport
+        self.parse_mode = parse_mode
+        self.fetch_workers = fetch_workers
+        self.parse_workers = parse_workers
+        self.queue_size = queue_size
+
+    def run(self, race_ids: Iterable[int]) -> Iterator[ParsedRace]:
+        """
+
+        Args:
+            race_ids: races to read, taken one by one as the fetch pool has room for them
+
+        Returns:
+            ParsedRace of every race as soon as it is parsed, in order of completion
+        """
+        race_ids = _unique(race_ids)
+        parse_workers = self.parse_workers
+        if parse_workers is None:
+            parse_workers = os.cpu_count() or 1
+            head = list(islice(race_ids, parse_workers))
+            race_ids = chain(head, race_ids)
+            if parse_workers == 1 or len(head) < parse_workers:
+                parse_workers = 0
+        queue_size = self.queue_size if self.queue_size is not None else QUEUE_PER_WORKER * max(parse_workers, 1)
+        pool = ProcessPoolExecutor(max_workers=parse_workers,
+                                   mp_context=multiprocessing.get_context(PARSE_START_METHOD)) \
+            if parse_workers > 0 else None
+        fetch = ThreadPoolExecutor(max_workers=self.fetch_workers)
+        fetching, races, fetched, parsing = {}, {}, deque(), {}
+        exhausted = False
+        try:
+            while True:
+                # keep every fetch thread busy while fetched races do not pile up ahead of parsing
+                while not exhausted and len(fetching) < 2 * self.fetch_workers and len(fetched) < queue_size:
+                    race_id = next(race_ids, None)
+                    if race_id is None:
+                        exhausted = True
+                        break
+                    races[race_id] = _FetchedRace(race_id)
+                    for k in PAGES:
+                        future = fetch.submit(self.transport.get_if_changed, RACE_PAGE_URL.format(race_id, k),
+                                              hedge=k == 'X')
+                        fetching[future] = (race_id, k)
+                while fetched and (pool is None or len(parsing) < queue_size):
+                    race = fetched.popleft()
+                    if pool is None:
+                        yield self._parsed(race, lambda: parse_race_pages(race.pages, self.parse_mode))
+                    else:
+                        parsing[pool.submit(parse_race_columns, race.pages, self.parse_mode)] = race
+                if not fetching and not parsing:
+                    if exhausted and not fetched:
+                        return
+                    continue
+                done, _ = wait([*fetching, *parsing], return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future in parsing:
+                        race = parsing.pop(future)
+                        yield self._parsed(race, lambda: [columns_to_frame(tbl) for tbl in future.result()])
+                        continue
+                    race_id, k = fetching.pop(future)
+                    race = races[race_id]
+                    try:
+                        race.pages[k], race.validators[RACE_PAGE_URL.format(race_id, k)] = future.result()
+                    except Exception as e:
+                        race.pages[k] = None
+                        race.error = race.error or e
+                    if not race.complete:
+                        continue
+                    del races[race_id]
+                    if race.error is not None:
+                        yield ParsedRace(race_id, validators=race.validators, error=race.error)
+                    else:
+                        fetched.append(race)
+        finally:
+            fetch.shutdown(wait=False, cancel_futures=True)
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+
+    @staticmethod
+    def _parsed(race: _FetchedRace, parse: Callable[[], List[Optional[pd.DataFrame]]]) -> ParsedRace:
+        try:
+            return ParsedRace(race.race_id, parse(), race.validators)
+        except Exception as e:
+            return ParsedRace(race.race_id, validators=race.validators, error=e)
@@ -0,0 +1,161 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional, Union, Dict
+
+from procycling.filelock import FileLock, atomic_write
+
+MAX_RPS = 1.0
+
+RATE = 1.0
+MIN_RATE = 0.1
+# ceiling of the default crawl pace, faster crawls are opt-in through max_rate
+MAX_RATE = MAX_RPS
+RATE_INCREASE = 0.05
+RATE_DECREASE = 0.5
+LATENCY_FACTOR = 2.0
+LATENCY_SMOOTHING = 0.1
+
+
+class RateLimiter(object):
+    """Thread-safe token bucket limiting requests per second.
+
+    Every caller reserves a slot under the lock and sleeps outside of it,
+    so N workers sharing one limiter are served in arrival order and never
+    exceed ``rate`` requests per second on average.
+
+    If ``state_path`` is given the bucket lives in that file and is guarded
+    by a lock file next to it, so every process on the host pointing to the
+    same path draws from one budget.
+    """
+
+    def __init__(self,
+                 rate: float = MAX_RPS,
+                 burst: int = 1,
+                 state_path: Optional[Union[str, Path]] = None
+                 ):
+        """
+
+        Args:
+            rate: allowed requests per second
+            burst: number of requests allowed to go out back to back
+            state_path: file with bucket state shared between processes, in-process bucket if None
+        """
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.burst = burst
+        self.state_path = Path(state_path) if state_path is not None else None
+        self._file_lock = FileLock(self.state_path.with_name(self.state_path.name + '.lock')) \
+            if self.state_path is not None else None
+        self._lock = threading.Lock()
+        self._state = {'tokens': float(burst), 'updated': time.time(), 'rate': float(rate)}
+
+    @property
+    def rate(self) -> float:
+        with self._locked() as state:
+            return state['rate']
+
+    @contextmanager
+    def _locked(self):
+        with self._lock:
+            if self._file_lock is None:
+                yield self._state
+                return
+            with self._file_lock:
+                state = self._read_state()
+                yield state
+                with atomic_write(self.state_path, durable=False) as file:
+                    file.write(json.dumps(state))
+                self._state = state
+
+    def _read_state(self) -> Dict[str, float]:
+        try:
+            state = json.loads(self.state_path.read_text())
+            if {'tokens', 'updated', 'rate'} <= set(state):
+                return state
+        except (OSError, ValueError):
+            pass
+        return dict(self._state)
+
+    def acquire(self) -> float:
+        """Block until the caller is allowed to send one request.
+
+        Returns:
+            seconds spent waiting
+        """
+        with self._locked() as state:
+            now = time.time()
+            state['tokens'] = min(float(self.burst),
+                                  state['tokens'] + max(now - state['updated'], 0.0) * state['rate'])
+            state['updated'] = now
+            state['tokens'] -= 1
+            wait = -state['tokens'] / state['rate'] if state['tokens'] < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def feedback(self, status: Optional[int], elapsed: float) -> None:
+        """Outcome of a request sent after ``acquire``. Fixed rate limiter ignores it.
+
+        Args:
+            status: HTTP status code, None if request failed without response
+            elapsed: latency of the request in seconds
+        """
+        pass
+
+
+class AdaptiveRateLimiter(RateLimiter):
+    """Token bucket whose rate follows AIMD on the health of responses.
+
+    Every fast successful response adds ``increase`` requests per second up
+    to ``max_rate``. A 429, a 5xx, a failed request or a latency above
+    ``latency_factor`` times the smoothed latency multiplies the rate by
+    ``decrease`` down to ``min_rate``. With ``state_path`` the rate is part
+    of the shared state, so all processes back off together.
+
+    By default the rate never goes above MAX_RATE, the fixed pace of one
+    request per second used before, and only backs off from it. A higher
+    ``max_rate`` lets the limiter ramp up while the site stays healthy.
+    """
+
+    def __init__(self,
+                 rate: float = RATE,
+                 min_rate: float = MIN_RATE,
+                 max_rate: float = MAX_RATE,
+                 increase: float = RATE_INCREASE,
+                 decrease: float = RATE_DECREASE,
+                 latency_factor: float = LATENCY_FACTOR,
+                 burst: int = 1,
+                 state_path: Optional[Union[str, Path]] = None
+                 ):
+        """
+
+        Args:
+            rate: starting requests per second
+            min_rate: lower bound of the rate
+            max_rate: upper bound of the rate
+            increase: additive step in requests per second after a healthy response
+            decrease: multiplicative factor applied after an unhealthy response
+            latency_factor: latency above this multiple of the smoothed latency counts as unhealthy
+            burst: number of requests allowed to go out back to back
+            state_path: file with bucket state shared between processes, in-process bucket if None
+        """
+        super().__init__(rate=min(max(rate, min_rate), max_rate), burst=burst, state_path=state_path)
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.latency = None
+
+    def feedback(self, status: Optional[int], elapsed: float) -> None:
+        with self._locked() as state:
+            slow = self.latency is not None and elapsed > self.latency * self.latency_factor
+            self.latency = elapsed if self.latency is None \
+                else self.latency + LATENCY_SMOOTHING * (elapsed - self.latency)
+            if status is None or status == 429 or status >= 500 or slow:
+                state['rate'] = max(state['rate'] * self.decrease, self.min_rate)
+            else:
+                state['rate'] = min(state['rate'] + self.increase, self.max_rate)
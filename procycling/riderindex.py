@@ -0,0 +1,151 @@
+import sqlite3
+from contextlib import closing
+from pathlib import Path
+from typing import Optional, Union, Dict
+
+import pandas as pd
+
+from procycling.storage import Storage, FileStorage, SQLiteStorage, WriteThroughStorage
+from procycling.utils import HISTORY_PAGES
+
+INDEX_SCHEMA = {
+    'RiderID': 'Int64', 'RaceID': 'Int64', 'Year': 'Int32', 'Table': 'string', 'Classification': 'string',
+    'Position': 'Int64'
+}
+GENERAL_PLACES = {'WinnerID': 1, 'SecondID': 2, 'ThirdID': 3}
+
+
+def rider_entries(race_id: Optional[int], section: str, tbl: Optional[pd.DataFrame]) -> pd.DataFrame:
+    """Rows of the rider index taken from one history section.
+
+    Args:
+        race_id: race of the section, None if tbl already has RaceID column (Storage.query)
+        section: key of HISTORY_PAGES
+        tbl: stored section
+
+    Returns:
+        frame with INDEX_SCHEMA, Classification holds classification of general and age type of age_winner
+    """
+    if tbl is None or tbl.shape[0] == 0:
+        return pd.DataFrame({column: pd.Series(dtype=dtype) for column, dtype in INDEX_SCHEMA.items()})
+    if race_id is not None:
+        tbl = tbl.assign(RaceID=race_id)
+    if section == 'general':
+        entries = pd.concat([
+            pd.DataFrame({'RiderID': tbl[column], 'RaceID': tbl.RaceID, 'Year': tbl.Year,
+                          'Classification': tbl.Classification, 'Position': place})
+            for column, place in GENERAL_PLACES.items()
+        ], ignore_index=True)
+    else:
+        entries = pd.DataFrame({
+            'RiderID': tbl.RiderID,
+            'RaceID': tbl.RaceID,
+            'Year': tbl.Year if 'Year' in tbl.columns else None,
+            'Classification': tbl.AgeType if section == 'age_winner' else None,
+            'Position': tbl.Position if 'Position' in tbl.columns else None
+        })
+    entries['Table'] = section
+    for column in ['RiderID', 'RaceID', 'Year', 'Position']:
+        entries[column] = pd.to_numeric(entries[column].astype('string').str.extract(r'(\d+)', expand=False),
+                                        errors='coerce')
+    return entries.loc[entries.RiderID.notna(), list(INDEX_SCHEMA)].astype(INDEX_SCHEMA).reset_index(drop=True)
+
+
+class RiderIndex(object):
+    """Inverted index RiderID -> (RaceID, Year, Table, Position) of stored race histories.
+
+    Kept in a SQLite file with one integer row per result and an index on
+    RiderID, so results of a rider are found without decoding any race.
+    FirstCycling replaces rows of a race every time it stores its history.
+    The file may be the database of SQLiteStorage, the index lives in its
+    own rider_index table there.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self._ready = False
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._ready:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        if not self._ready:
+            with conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("CREATE TABLE IF NOT EXISTS rider_index (RiderID INTEGER NOT NULL, "
+                             "RaceID INTEGER NOT NULL, Year INTEGER, Tbl TEXT NOT NULL, Classification TEXT, "
+                             "Position INTEGER)")
+                conn.execute("CREATE INDEX IF NOT EXISTS ix_rider_index_RiderID ON rider_index (RiderID)")
+                conn.execute("CREATE INDEX IF NOT EXISTS ix_rider_index_RaceID ON rider_index (RaceID)")
+            self._ready = True
+        return conn
+
+    @staticmethod
+    def _insert(conn: sqlite3.Connection, entries: pd.DataFrame) -> None:
+        values = entries.astype(object).where(entries.notna(), None)
+        conn.executemany("INSERT INTO rider_index (RiderID, RaceID, Year, Tbl, Classification, Position) "
+                         "VALUES (?, ?, ?, ?, ?, ?)", values.itertuples(index=False))
+
+    def update(self, race_id: int, sections: Dict[str, Optional[pd.DataFrame]]) -> None:
+        """Replace entries of one race.
+
+        Args:
+            race_id: race id
+            sections: stored sections of the race by key of HISTORY_PAGES
+        """
+        entries = pd.concat([rider_entries(race_id, section, tbl) for section, tbl in sections.items()],
+                            ignore_index=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM rider_index WHERE RaceID = ?", (race_id,))
+            self._insert(conn, entries)
+
+    def build(self, storage: Storage) -> int:
+        """Rebuild the whole index from all races in storage.
+
+        Args:
+            storage: storage of race histories
+
+        Returns:
+            number of indexed results
+        """
+        entries = pd.concat([rider_entries(None, section, storage.query(section)) for section in HISTORY_PAGES],
+                            ignore_index=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM rider_index")
+            self._insert(conn, entries)
+        return entries.shape[0]
+
+    def lookup(self, rider_id: int) -> pd.DataFrame:
+        """
+
+        Args:
+            rider_id: rider id
+
+        Returns:
+            results of the rider with INDEX_SCHEMA, ordered by Year, RaceID and Table
+        """
+        with closing(self._connect()) as conn:
+            result = pd.read_sql_query(
+                "SELECT RiderID, RaceID, Year, Tbl AS \"Table\", Classification, Position FROM rider_index "
+                "WHERE RiderID = ? ORDER BY Year, RaceID, Tbl, Classification, Position", conn, params=(rider_id,)
+            )
+        return result.astype(INDEX_SCHEMA)
+
+
+def default_rider_index(storage: Storage) -> Optional[RiderIndex]:
+    """Index kept next to the race histories of ``storage``.
+
+    Args:
+        storage: storage of race histories, WriteThroughStorage is indexed beside its primary
+
+    Returns:
+        RiderIndex in the data dir of FileStorage or in the database of SQLiteStorage,
+        None for other storages, which need an explicit RiderIndex
+    """
+    if isinstance(storage, WriteThroughStorage):
+        return default_rider_index(storage.primary)
+    if isinstance(storage, SQLiteStorage):
+        return RiderIndex(storage.path)
+    if isinstance(storage, FileStorage):
+        return RiderIndex(storage.data_dir / "rider_index.sqlite")
+    return None
@@ -0,0 +1,768 @@
+import json
+import re
+import sqlite3
+import time
+import uuid
+from contextlib import closing
+from pathlib import Path
+from typing import Optional, Union, List, Dict, Iterator, Tuple
+
+import pandas as pd
+
+import procycling.functions as f
+from procycling.cache import FrameCache, DEFAULT_CACHE
+from procycling.filelock import FileLock, atomic_write, shared_lock
+from procycling.utils import HISTORY_PAGES
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+SCHEMAS = {
+    'schedule': {
+        'Season_RaceID': 'string', 'Season': 'Int32', 'Date': 'string', 'Date_Start': 'datetime64[ns]',
+        'Date_End': 'datetime64[ns]', 'RaceID': 'Int64', 'Race_Name': 'string', 'Category': 'string',
+        'Gender': 'string', 'Profile_Type': 'string', 'Country_Race': 'string', 'WinnerID': 'Int64',
+        'Winner': 'string', 'Country_Winner': 'string'
+    },
+    'general': {
+        'Classification': 'string', 'Year': 'Int32', 'Category': 'string', 'RaceLink': 'string',
+        'WinnerCountry': 'string', 'WinnerID': 'Int64', 'Winner': 'string', 'WinnerLink': 'string',
+        'SecondCountry': 'string', 'SecondID': 'Int64', 'Second': 'string', 'SecondLink': 'string',
+        'ThirdCountry': 'string', 'ThirdID': 'Int64', 'Third': 'string', 'ThirdLink': 'string'
+    },
+    'yby': {
+        'Position': 'Int32', 'RiderCountry': 'string', 'RiderID': 'Int64', 'RiderLink': 'string',
+        'Rider': 'string', 'Time': 'string', 'Year': 'Int32'
+    },
+    'victory': {
+        'Position': 'string', 'RiderCountry': 'string', 'RiderID': 'Int64', 'RiderLink': 'string',
+        'Rider': 'string', 'CountryName': 'string', 'FirstPlace': 'string', 'SecondPlace': 'string',
+        'ThirdPlace': 'string'
+    },
+    'stage': {
+        'Position': 'string', 'RiderCountry': 'string', 'RiderID': 'Int64', 'RiderLink': 'string',
+        'Rider': 'string', 'CountryName': 'string', 'WinStages': 'string'
+    },
+    'age_winner': {
+        'Year': 'Int32', 'AgeType': 'string', 'RiderCountry': 'string', 'RiderID': 'Int64',
+        'RiderLink': 'string', 'Rider': 'string', 'CountryName': 'string', 'Age': 'string'
+    }
+}
+
+PARTITIONS = {
+    'schedule': ['Season', 'Gender'],
+    **{section: ['RaceID'] for section in HISTORY_PAGES}
+}
+
+SQL_INDEXES = {
+    'schedule': [['Season_RaceID'], ['RaceID'], ['WinnerID'], ['Date_Start']],
+    'general': [['RaceID', 'Classification', 'Year'], ['Classification', 'Year'], ['Year'], ['WinnerID'],
+                ['SecondID'], ['ThirdID']],
+    'yby': [['RaceID', 'Year', 'Position'], ['Year'], ['RiderID']],
+    'victory': [['RaceID', 'RiderID'], ['RiderID']],
+    'stage': [['RaceID', 'RiderID'], ['RiderID']],
+    'age_winner': [['RaceID', 'AgeType', 'Year'], ['RiderID']]
+}
+
+RE_SCHEDULE_FILE = re.compile(r"schedule(\w)_(\d+)\.csv")
+RE_RACE_DIR = re.compile(r"race_(\d+)")
+RE_SECTION_FILE = re.compile(r"(\w+)(\.\w+)?\.json")
+
+Filters = Dict[str, Union[object, List, Tuple]]
+
+
+def schedule_resource(season: int, gender: str) -> str:
+    return "schedule{}_{}".format(gender, season)
+
+
+def race_resource(race_id: int) -> str:
+    return "race_{}".format(race_id)
+
+
+def conform(df: Optional[pd.DataFrame], table: str, dtypes: Optional[Dict[str, str]] = None) -> pd.DataFrame:
+    """Cast table to its schema, missing columns are added as nulls.
+
+    Args:
+        df: schedule or history section, None for a missing section
+        table: key of SCHEMAS
+        dtypes: column -> dtype overriding the schema, e.g. yby times converted to seconds
+
+    Returns:
+        DataFrame with columns and dtypes of SCHEMAS[table]
+    """
+    schema = {**SCHEMAS[table], **(dtypes or {})}
+    df = pd.DataFrame(columns=list(schema)) if df is None else df
+    columns = {}
+    for column, dtype in schema.items():
+        values = df[column] if column in df.columns else pd.Series(None, index=df.index, dtype=object)
+        if dtype.startswith('Int'):
+            values = pd.to_numeric(values)
+        elif dtype == 'string':
+            values = f.none_if_na(values).map(lambda x: x if x is None else str(x))
+        columns[column] = values.astype(dtype)
+    return pd.DataFrame(columns, index=df.index).reset_index(drop=True)
+
+
+def query_result(df: Optional[pd.DataFrame], table: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """Conform rows returned by Storage.query, history sections keep RaceID as the first column.
+
+    Rows are typed by SCHEMAS like sections returned by the FirstCycling
+    readers, so a filtered read from any backend matches the same rows of a
+    fresh read.
+    """
+    result = conform(df, table)
+    if table != 'schedule':
+        race_ids = pd.to_numeric(df['RaceID']).to_numpy() if df is not None else []
+        result.insert(0, 'RaceID', pd.array(race_ids, dtype='Int64'))
+    return result.loc[:, columns] if columns is not None else result
+
+
+def filter_frame(df: pd.DataFrame, filters: Filters) -> pd.DataFrame:
+    """Pandas counterpart of parquet filter pushdown with the same filter semantics.
+
+    Args:
+        df: table to filter
+        filters: column -> value; a list or a set selects any of the values,
+            a (low, high) tuple selects inclusive range, None bound is open
+
+    Returns:
+        rows matching every filter
+    """
+    mask = pd.Series(True, index=df.index)
+    for column, value in filters.items():
+        if isinstance(value, tuple):
+            low, high = value
+            if low is not None:
+                mask &= df[column] >= low
+            if high is not None:
+                mask &= df[column] <= high
+        elif isinstance(value, (list, set, frozenset)):
+            mask &= df[column].isin(list(value))
+        else:
+            mask &= df[column] == value
+    return df.loc[mask.fillna(False).astype(bool)].reset_index(drop=True)
+
+
+def _matches(value, condition) -> bool:
+    """Filter semantics of filter_frame for a single partition value."""
+    if isinstance(condition, tuple):
+        low, high = condition
+        return (low is None or value >= low) and (high is None or value <= high)
+    if isinstance(condition, (list, set, frozenset)):
+        return value in condition
+    return value == condition
+
+
+class Storage(object):
+    """Where FirstCycling keeps schedules and race histories.
+
+    Subclasses store tables of SCHEMAS: one schedule per season and gender
+    and HISTORY_PAGES sections per race. Every write replaces a resource
+    atomically, readers never see it half-written.
+    """
+
+    def _lock_dir(self) -> Path:
+        raise NotImplementedError
+
+    def lock(self, resource: str) -> FileLock:
+        """Advisory lock of a resource shared by all processes and threads using the same storage.
+
+        FirstCycling holds it while it reads, fetches and writes the resource,
+        so concurrent refreshes do not interleave and only one of them
+        fetches a missing resource.
+
+        Args:
+            resource: schedule_resource or race_resource
+
+        Returns:
+            reentrant lock, the same object for the same resource
+        """
+        return shared_lock(self._lock_dir() / "{}.lock".format(resource))
+
+    def write_schedule(self, schedule: pd.DataFrame, season: int, gender: str) -> None:
+        raise NotImplementedError
+
+    def read_schedule(self, season: int, gender: str) -> pd.DataFrame:
+        """
+
+        Raises:
+            FileNotFoundError: schedule is not stored
+        """
+        raise NotImplementedError
+
+    def write_race_history(self, race_id: int, sections: Dict[str, Optional[pd.DataFrame]]) -> None:
+        raise NotImplementedError
+
+    def has_race_history(self, race_id: int) -> bool:
+        raise NotImplementedError
+
+    def schedule_updated(self, season: int, gender: str) -> Optional[float]:
+        """
+
+        Returns:
+            unix time the schedule was stored, None if it is not stored
+        """
+        raise NotImplementedError
+
+    def race_history_updated(self, race_id: int) -> Optional[float]:
+        """
+
+        Returns:
+            unix time the race history was stored, None if it is not stored
+        """
+        raise NotImplementedError
+
+    def read_race_section(self, race_id: int, section: str) -> pd.DataFrame:
+        """
+
+        Args:
+            race_id: race id
+            section: key of HISTORY_PAGES
+
+        Returns:
+            stored table, empty DataFrame if race has no such table
+
+        Raises:
+            FileNotFoundError: race history is not stored
+        """
+        raise NotImplementedError
+
+    def read_race_history(self, race_id: int) -> Dict:
+        """
+
+        Returns:
+            same dict as FirstCycling.read_race_history
+        """
+        hist_race = {}
+        for section in HISTORY_PAGES:
+            tbl = self.read_race_section(race_id, section)
+            hist_race[section] = {
+                'headers': f.convert_dataframe_to_json(tbl, True),
+                'data': f.convert_dataframe_to_json(tbl)
+            }
+        return hist_race
+
+    def read_validators(self, resource: str) -> Dict:
+        """HTTP validators of pages a stored resource was parsed from.
+
+        Args:
+            resource: schedule_resource or race_resource
+
+        Returns:
+            {'checked': unix time pages were last fetched or revalidated, 'pages': url -> validator},
+            empty dict if nothing is stored
+        """
+        raise NotImplementedError
+
+    def write_validators(self, resource: str, validators: Dict) -> None:
+        raise NotImplementedError
+
+    def query(self, table: str, columns: Optional[List[str]] = None, **filters) -> pd.DataFrame:
+        """Rows of one table over all stored seasons or races.
+
+        History sections get RaceID column of the race they belong to.
+
+        Args:
+            table: 'schedule' or key of HISTORY_PAGES
+            columns: columns to return, all if None
+            **filters: column -> value, see filter_frame
+
+        Returns:
+            matching rows
+        """
+        raise NotImplementedError
+
+
+class FileStorage(Storage):
+    """CSV schedules and JSON race histories under ``data_dir``.
+
+    Layout is ``seasons/schedule{gender}_{season}.csv`` and one file per
+    history section ``races/race_{id}/{section}.{version}.json``, so a section
+    is decoded without touching the others. A race is written as a new version
+    of every section and ``manifest.json``, which names the current file of
+    each section, is replaced last. A write that stops halfway leaves the
+    previous version in place. Races stored before as ``{section}.json`` files
+    without manifest or as a single ``history_race.json`` are still read.
+
+    Decoded sections are kept in ``cache`` keyed by (data_dir, race_id, section)
+    and checked against mtime of the file on every lookup.
+    """
+
+    def __init__(self, data_dir: Union[str, Path], cache: Optional[FrameCache] = DEFAULT_CACHE):
+        """
+
+        Args:
+            data_dir: root of the cache
+            cache: LRU of decoded sections shared by all FileStorage by default, None disables it
+        """
+        self.data_dir = Path(data_dir)
+        self.cache = cache
+
+    def _schedule_path(self, season: int, gender: str) -> Path:
+        return self.data_dir / "seasons" / "{}.csv".format(schedule_resource(season, gender))
+
+    def _race_dir(self, race_id: int) -> Path:
+        return self.data_dir / "races" / race_resource(race_id)
+
+    def _manifest_path(self, race_id: int) -> Path:
+        return self._race_dir(race_id) / 'manifest.json'
+
+    def _manifest(self, race_id: int) -> Dict[str, str]:
+        """
+
+        Returns:
+            section -> name of its current file, {} if race has no manifest
+        """
+        path = self._manifest_path(race_id)
+        if not path.exists():
+            return {}
+        with path.open('r') as file:
+            return json.load(file)['sections']
+
+    def _section_path(self, race_id: int, section: str, manifest: Optional[Dict[str, str]] = None) -> Path:
+        manifest = self._manifest(race_id) if manifest is None else manifest
+        return self._race_dir(race_id) / manifest.get(section, "{}.json".format(section))
+
+    def _history_path(self, race_id: int) -> Path:
+        return self._race_dir(race_id) / 'history_race.json'
+
+    def _lock_dir(self) -> Path:
+        return self.data_dir / "locks"
+
+    def _validators_path(self, resource: str) -> Path:
+        if resource.startswith('race_'):
+            return self.data_dir / "races" / resource / "validators.json"
+        return self.data_dir / "seasons" / "{}.validators.json".format(resource)
+
+    def write_schedule(self, schedule: pd.DataFrame, season: int, gender: str) -> None:
+        with atomic_write(self._schedule_path(season, gender), newline='') as file:
+            schedule.to_csv(file, index=False)
+
+    def read_schedule(self, season: int, gender: str) -> pd.DataFrame:
+        return pd.read_csv(self._schedule_path(season, gender), parse_dates=['Date_Start', 'Date_End'])
+
+    def write_race_history(self, race_id: int, sections: Dict[str, Optional[pd.DataFrame]]) -> None:
+        race_dir = self._race_dir(race_id)
+        manifest = self._manifest(race_id)
+        previous = {section: self._section_path(race_id, section, manifest).name for section in HISTORY_PAGES}
+        current = {section: name for section, name in previous.items() if (race_dir / name).exists()}
+        version = uuid.uuid4().hex[:12]
+        for section, tbl in sections.items():
+            current[section] = "{}.{}.json".format(section, version)
+            with atomic_write(race_dir / current[section]) as file:
+                json.dump({
+                    'headers': f.convert_dataframe_to_json(tbl, True),
+                    'data': f.convert_dataframe_to_json(tbl)
+                }, file)
+        with atomic_write(self._manifest_path(race_id)) as file:
+            json.dump({'sections': current}, file)
+        if self.cache is not None:
+            for section in sections:
+                self.cache.pop((self.data_dir, race_id, section))
+        # files of the previous version stay for readers that loaded the old manifest
+        keep = {*current.values(), *manifest.values()}
+        for path in race_dir.iterdir():
+            match = RE_SECTION_FILE.fullmatch(path.name)
+            if match is not None and match.group(1) in HISTORY_PAGES and path.name not in keep:
+                path.unlink(missing_ok=True)
+
+    def has_race_history(self, race_id: int) -> bool:
+        return self.race_history_updated(race_id) is not None
+
+    def read_validators(self, resource: str) -> Dict:
+        path = self._validators_path(resource)
+        if not path.exists():
+            return {}
+        with path.open('r') as file:
+            return json.load(file)
+
+    def write_validators(self, resource: str, validators: Dict) -> None:
+        with atomic_write(self._validators_path(resource)) as file:
+            json.dump(validators, file)
+
+    def schedule_updated(self, season: int, gender: str) -> Optional[float]:
+        filepath = self._schedule_path(season, gender)
+        return filepath.stat().st_mtime if filepath.exists() else None
+
+    def race_history_updated(self, race_id: int) -> Optional[float]:
+        manifest = self._manifest(race_id)
+        if all(section in manifest for section in HISTORY_PAGES):
+            return self._manifest_path(race_id).stat().st_mtime
+        paths = [self._section_path(race_id, section, manifest) for section in HISTORY_PAGES]
+        if all(path.exists() for path in paths):
+            return min(path.stat().st_mtime for path in paths)
+        path = self._history_path(race_id)
+        return path.stat().st_mtime if path.exists() else None
+
+    def _stored_section_path(self, race_id: int, section: str, manifest: Dict[str, str]) -> Path:
+        path = self._section_path(race_id, section, manifest)
+        if not path.exists() and self._history_path(race_id).exists():
+            return self._history_path(race_id)
+        return path
+
+    @staticmethod
+    def _load_section(path: Path, section: str) -> Dict:
+        with path.open('r') as file:
+            tbl = json.load(file)
+        return tbl[section] if path.name == 'history_race.json' else tbl
+
+    def read_race_history(self, race_id: int) -> Dict:
+        manifest = self._manifest(race_id)
+        return {section: self._load_section(self._stored_section_path(race_id, section, manifest), section)
+                for section in HISTORY_PAGES}
+
+    def read_race_section(self, race_id: int, section: str) -> pd.DataFrame:
+        path = self._stored_section_path(race_id, section, self._manifest(race_id))
+        if self.cache is None:
+            tbl = self._load_section(path, section)
+            return conform(pd.DataFrame(tbl['data'], columns=tbl['headers']), section)
+        key = (self.data_dir, race_id, section)
+        stat = path.stat()
+        version = (path.name, stat.st_mtime_ns, stat.st_size)
+        frame = self.cache.get(key, version)
+        if frame is None:
+            tbl = self._load_section(path, section)
+            frame = conform(pd.DataFrame(tbl['data'], columns=tbl['headers']), section)
+            self.cache.put(key, version, frame)
+        return frame
+
+    def _iter_partitions(self, table: str, filters: Filters) -> Iterator[Tuple[Dict, Path]]:
+        if table == 'schedule':
+            pattern, folder = RE_SCHEDULE_FILE, self.data_dir / "seasons"
+        else:
+            pattern, folder = RE_RACE_DIR, self.data_dir / "races"
+        if not folder.exists():
+            return
+        for path in sorted(folder.iterdir()):
+            match = pattern.fullmatch(path.name)
+            if match is None:
+                continue
+            if table == 'schedule':
+                keys = {'Season': int(match.group(2)), 'Gender': match.group(1)}
+            else:
+                keys = {'RaceID': int(match.group(1))}
+                if not self.has_race_history(keys['RaceID']):
+                    continue
+            if all(_matches(value, filters[key]) for key, value in keys.items() if key in filters):
+                yield keys, path
+
+    def query(self, table: str, columns: Optional[List[str]] = None, **filters) -> pd.DataFrame:
+        frames = []
+        for keys, path in self._iter_partitions(table, filters):
+            if table == 'schedule':
+                tbl = self.read_schedule(keys['Season'], keys['Gender'])
+            else:
+                tbl = self.read_race_section(keys['RaceID'], table).assign(RaceID=keys['RaceID'])
+            frames.append(filter_frame(query_result(tbl, table), filters))
+        if not frames:
+            return query_result(None, table, columns)
+        result = pd.concat(frames, ignore_index=True)
+        return result.loc[:, columns] if columns is not None else result
+
+
+class ParquetStorage(Storage):
+    """Parquet dataset under ``root`` with one directory per table.
+
+    Schedules are partitioned as ``schedule/Season=../Gender=..`` and history
+    sections as ``{section}/RaceID=..``, every file has the explicit schema of
+    SCHEMAS. ``query`` prunes partitions by path and the remaining filters are
+    evaluated against row group statistics, so a question about one season
+    or one race opens only its files.
+
+    Requires pyarrow.
+    """
+
+    def __init__(self, root: Union[str, Path]):
+        if pa is None:
+            raise ImportError("ParquetStorage requires pyarrow, install it with `pip install procycling[parquet]`")
+        self.root = Path(root)
+
+    @staticmethod
+    def _schema(table: str, partitioned: bool = False) -> 'pa.Schema':
+        types = {'string': pa.string(), 'Int32': pa.int32(), 'Int64': pa.int64(),
+                 'datetime64[ns]': pa.timestamp('ns')}
+        schema = SCHEMAS[table] if not partitioned else \
+            {**SCHEMAS[table], **{column: SCHEMAS['schedule'][column] for column in PARTITIONS[table]}}
+        return pa.schema([(column, types[dtype]) for column, dtype in schema.items()
+                          if partitioned or column not in PARTITIONS[table]])
+
+    def _lock_dir(self) -> Path:
+        return self.root / "locks"
+
+    def _partition_dir(self, table: str, **keys) -> Path:
+        return self.root.joinpath(table, *["{}={}".format(key, keys[key]) for key in PARTITIONS[table]])
+
+    def _write(self, tbl: Optional[pd.DataFrame], table: str, **keys) -> None:
+        arrow_tbl = pa.Table.from_pandas(conform(tbl, table).drop(columns=PARTITIONS[table], errors='ignore'),
+                                         schema=self._schema(table), preserve_index=False)
+        with atomic_write(self._partition_dir(table, **keys) / 'part-0.parquet', 'wb') as file:
+            pq.write_table(arrow_tbl, file)
+
+    def _read(self, table: str, **keys) -> pd.DataFrame:
+        path = self._partition_dir(table, **keys) / 'part-0.parquet'
+        return conform(pq.read_table(path, schema=self._schema(table)).to_pandas().assign(**keys), table)
+
+    def write_schedule(self, schedule: pd.DataFrame, season: int, gender: str) -> None:
+        self._write(schedule, 'schedule', Season=season, Gender=gender)
+
+    def read_schedule(self, season: int, gender: str) -> pd.DataFrame:
+        return self._read('schedule', Season=season, Gender=gender)
+
+    def write_race_history(self, race_id: int, sections: Dict[str, Optional[pd.DataFrame]]) -> None:
+        for section, tbl in sections.items():
+            self._write(tbl, section, RaceID=race_id)
+
+    def has_race_history(self, race_id: int) -> bool:
+        return self.race_history_updated(race_id) is not None
+
+    def schedule_updated(self, season: int, gender: str) -> Optional[float]:
+        path = self._partition_dir('schedule', Season=season, Gender=gender) / 'part-0.parquet'
+        return path.stat().st_mtime if path.exists() else None
+
+    def race_history_updated(self, race_id: int) -> Optional[float]:
+        paths = [self._partition_dir(section, RaceID=race_id) / 'part-0.parquet' for section in HISTORY_PAGES]
+        return min(path.stat().st_mtime for path in paths) if all(path.exists() for path in paths) else None
+
+    def read_race_section(self, race_id: int, section: str) -> pd.DataFrame:
+        return self._read(section, RaceID=race_id)
+
+    def read_validators(self, resource: str) -> Dict:
+        path = self.root / "validators" / "{}.json".format(resource)
+        if not path.exists():
+            return {}
+        with path.open('r') as file:
+            return json.load(file)
+
+    def write_validators(self, resource: str, validators: Dict) -> None:
+        with atomic_write(self.root / "validators" / "{}.json".format(resource)) as file:
+            json.dump(validators, file)
+
+    @staticmethod
+    def _expression(filters: Filters) -> Optional['ds.Expression']:
+        expression = None
+        for column, value in filters.items():
+            field = ds.field(column)
+            if isinstance(value, tuple):
+                low, high = value
+                condition = None
+                if low is not None:
+                    condition = field >= low
+                if high is not None:
+                    condition = field <= high if condition is None else condition & (field <= high)
+                if condition is None:
+                    continue
+            elif isinstance(value, (list, set, frozenset)):
+                condition = field.isin(list(value))
+            else:
+                condition = field == value
+            expression = condition if expression is None else expression & condition
+        return expression
+
+    def query(self, table: str, columns: Optional[List[str]] = None, **filters) -> pd.DataFrame:
+        folder = self.root / table
+        if not folder.exists():
+            return query_result(None, table, columns)
+        schema = self._schema(table, partitioned=True)
+        partitioning = ds.partitioning(pa.schema([schema.field(key) for key in PARTITIONS[table]]), flavor='hive')
+        dataset = ds.dataset(folder, schema=schema, format='parquet', partitioning=partitioning,
+                             ignore_prefixes=['.'])
+        load = None if columns is None else list(dict.fromkeys([*columns, *PARTITIONS[table]]))
+        result = dataset.to_table(columns=load, filter=self._expression(filters)).to_pandas()
+        return query_result(result, table, columns)
+
+
+class SQLiteStorage(Storage):
+    """One SQLite database with a table per SCHEMAS entry.
+
+    Schedule rows are keyed by (Season, Gender, Row) and rows of history
+    sections by (RaceID, Row), where Row keeps the order of the page.
+    Natural keys of every table (Season_RaceID of the schedule,
+    (RaceID, Classification, Year) of general, (RaceID, Year, Position) of
+    yby ...) and columns used for lookups (rider, year) are indexed, see
+    SQL_INDEXES. A race is written in one transaction, so a
+    reader never sees half of its sections.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS race_history "
+                         "(RaceID INTEGER PRIMARY KEY, Updated REAL NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS schedule_history "
+                         "(Season INTEGER, Gender TEXT, Updated REAL NOT NULL, PRIMARY KEY (Season, Gender))")
+            conn.execute("CREATE TABLE IF NOT EXISTS validators (Resource TEXT PRIMARY KEY, Validators TEXT NOT NULL)")
+            for table, schema in SCHEMAS.items():
+                keys = ['Season', 'Gender', 'Row'] if table == 'schedule' else ['RaceID', 'Row']
+                columns = {**{key: 'INTEGER' for key in keys}, **schema}
+                conn.execute("CREATE TABLE IF NOT EXISTS {} ({}, PRIMARY KEY ({}))".format(
+                    table,
+                    ', '.join('{} {}'.format(column, 'INTEGER' if dtype in ('INTEGER', 'Int32', 'Int64') else 'TEXT')
+                              for column, dtype in columns.items()),
+                    ', '.join(keys)
+                ))
+                for index in SQL_INDEXES[table]:
+                    conn.execute("CREATE INDEX IF NOT EXISTS ix_{}_{} ON {} ({})".format(
+                        table, '_'.join(index), table, ', '.join(index)))
+
+    def _lock_dir(self) -> Path:
+        return self.path.with_name(self.path.name + '.locks')
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    @staticmethod
+    def _insert(conn: sqlite3.Connection, tbl: Optional[pd.DataFrame], table: str, **keys) -> None:
+        tbl = conform(tbl, table).drop(columns=list(keys), errors='ignore')
+        for column, dtype in SCHEMAS[table].items():
+            if column in tbl.columns and dtype.startswith('datetime'):
+                tbl[column] = tbl[column].dt.strftime('%Y-%m-%d')
+        if tbl.shape[0] == 0:
+            return
+        columns = [*keys, 'Row', *tbl.columns]
+        values = tbl.astype(object).where(tbl.notna(), None)
+        conn.executemany(
+            "INSERT INTO {} ({}) VALUES ({})".format(table, ', '.join(columns), ', '.join('?' * len(columns))),
+            [(*keys.values(), row, *values) for row, values in enumerate(values.itertuples(index=False))]
+        )
+
+    def write_schedule(self, schedule: pd.DataFrame, season: int, gender: str) -> None:
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM schedule WHERE Season = ? AND Gender = ?", (season, gender))
+            self._insert(conn, schedule, 'schedule', Season=season, Gender=gender)
+            conn.execute("INSERT OR REPLACE INTO schedule_history VALUES (?, ?, ?)", (season, gender, time.time()))
+
+    def read_schedule(self, season: int, gender: str) -> pd.DataFrame:
+        schedule = self.query('schedule', Season=season, Gender=gender)
+        if schedule.shape[0] == 0:
+            raise FileNotFoundError("Schedule {} {} is not stored in {}".format(gender, season, self.path))
+        return schedule
+
+    def write_race_history(self, race_id: int, sections: Dict[str, Optional[pd.DataFrame]]) -> None:
+        with closing(self._connect()) as conn, conn:
+            for section, tbl in sections.items():
+                conn.execute("DELETE FROM {} WHERE RaceID = ?".format(section), (race_id,))
+                self._insert(conn, tbl, section, RaceID=race_id)
+            conn.execute("INSERT OR REPLACE INTO race_history VALUES (?, ?)", (race_id, time.time()))
+
+    def has_race_history(self, race_id: int) -> bool:
+        return self.race_history_updated(race_id) is not None
+
+    def schedule_updated(self, season: int, gender: str) -> Optional[float]:
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT Updated FROM schedule_history WHERE Season = ? AND Gender = ?",
+                               (season, gender)).fetchone()
+        return row[0] if row is not None else None
+
+    def race_history_updated(self, race_id: int) -> Optional[float]:
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT Updated FROM race_history WHERE RaceID = ?", (race_id,)).fetchone()
+        return row[0] if row is not None else None
+
+    def read_race_section(self, race_id: int, section: str) -> pd.DataFrame:
+        if not self.has_race_history(race_id):
+            raise FileNotFoundError("History of race {} is not stored in {}".format(race_id, self.path))
+        return self.query(section, RaceID=race_id).drop(columns='RaceID')
+
+    def read_validators(self, resource: str) -> Dict:
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT Validators FROM validators WHERE Resource = ?", (resource,)).fetchone()
+        return json.loads(row[0]) if row is not None else {}
+
+    def write_validators(self, resource: str, validators: Dict) -> None:
+        with closing(self._connect()) as conn, conn:
+            conn.execute("INSERT OR REPLACE INTO validators VALUES (?, ?)", (resource, json.dumps(validators)))
+
+    def read_sql(self, sql: str, params: Union[Tuple, Dict] = ()) -> pd.DataFrame:
+        """Run any SELECT against the database, tables are named as SCHEMAS keys.
+
+        Args:
+            sql: SQL statement
+            params: parameters of the statement
+
+        Returns:
+            result set
+        """
+        with closing(self._connect()) as conn:
+            return pd.read_sql_query(sql, conn, params=params)
+
+    def query(self, table: str, columns: Optional[List[str]] = None, **filters) -> pd.DataFrame:
+        known = {*SCHEMAS[table], *PARTITIONS[table]}
+        unknown = [column for column in [*filters, *(columns or [])] if column not in known]
+        if unknown:
+            raise KeyError("Unknown columns of {}: {}".format(table, unknown))
+        where, params = [], []
+        for column, value in filters.items():
+            if isinstance(value, tuple):
+                low, high = value
+                if low is not None:
+                    where.append("{} >= ?".format(column))
+                    params.append(low)
+                if high is not None:
+                    where.append("{} <= ?".format(column))
+                    params.append(high)
+            elif isinstance(value, (list, set, frozenset)):
+                where.append("{} IN ({})".format(column, ', '.join('?' * len(value))))
+                params.extend(value)
+            else:
+                where.append("{} = ?".format(column))
+                params.append(value)
+        order = 'Season, Gender, Row' if table == 'schedule' else 'RaceID, Row'
+        sql = "SELECT * FROM {}{} ORDER BY {}".format(table, " WHERE " + " AND ".join(where) if where else "", order)
+        return query_result(self.read_sql(sql, tuple(params)), table, columns)
+
+
+class WriteThroughStorage(Storage):
+    """Reads from ``primary`` and writes every table to ``primary`` and all ``mirrors``.
+
+    E.g. WriteThroughStorage(FileStorage(data_dir), SQLiteStorage(path))
+    keeps the file cache and fills a database for services at the same time.
+    """
+
+    def __init__(self, primary: Storage, *mirrors: Storage):
+        self.primary = primary
+        self.mirrors = list(mirrors)
+
+    def write_schedule(self, schedule: pd.DataFrame, season: int, gender: str) -> None:
+        for storage in [self.primary, *self.mirrors]:
+            storage.write_schedule(schedule, season, gender)
+
+    def read_schedule(self, season: int, gender: str) -> pd.DataFrame:
+        return self.primary.read_schedule(season, gender)
+
+    def write_race_history(self, race_id: int, sections: Dict[str, Optional[pd.DataFrame]]) -> None:
+        for storage in [self.primary, *self.mirrors]:
+            storage.write_race_history(race_id, sections)
+
+    def has_race_history(self, race_id: int) -> bool:
+        return self.primary.has_race_history(race_id)
+
+    def schedule_updated(self, season: int, gender: str) -> Optional[float]:
+        return self.primary.schedule_updated(season, gender)
+
+    def race_history_updated(self, race_id: int) -> Optional[float]:
+        return self.primary.race_history_updated(race_id)
+
+    def read_race_section(self, race_id: int, section: str) -> pd.DataFrame:
+        return self.primary.read_race_section(race_id, section)
+
+    def read_race_history(self, race_id: int) -> Dict:
+        return self.primary.read_race_history(race_id)
+
+    def read_validators(self, resource: str) -> Dict:
+        return self.primary.read_validators(resource)
+
+    def lock(self, resource: str) -> FileLock:
+        return self.primary.lock(resource)
+
+    def write_validators(self, resource: str, validators: Dict) -> None:
+        for storage in [self.primary, *self.mirrors]:
+            storage.write_validators(resource, validators)
+
+    def query(self, table: str, columns: Optional[List[str]] = None, **filters) -> pd.DataFrame:
+        return self.primary.query(table, columns, **filters)
@@ -1,17 +1,191 @@
+import hashlib
+import json
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
 from datetime import datetime
+from pathlib import Path
+from typing import Optional, List, Dict, Tuple, Union, Set, Iterator
 
-import bs4
 import pandas as pd
-import requests
-from lxml import etree
 
-import procycling.functions as f
-from procycling.utils import (
-    XPATH_HIST_GEN
-)
+from procycling.filelock import atomic_write, shared_lock
+from procycling.parsers import parse_race_catalog_month
+from procycling.ratelimit import AdaptiveRateLimiter, RATE, MAX_RATE
+from procycling.tools.sinks import Sink, CSVSink
+from procycling.transport import Transport, MAX_CONNECTIONS
+from procycling.utils import PARSE_MODE
 
-FIRSTCYCLING_URL = "https://firstcycling.com/"
+CATALOG_SCHEMA = {
+    'Season': 'Int32', 'Date': 'string', 'Category': 'string', 'Country_Race': 'string', 'Race_Name': 'string',
+    'RaceLink': 'string', 'Country_Winner': 'string', 'WinnerID': 'Int64', 'Winner': 'string',
+    'WinnerLink': 'string'
+}
+RACE_LINK = 4
+
+
+def catalog_batch(races_month: List[List], season: int) -> pd.DataFrame:
+    """
+
+    Args:
+        races_month: rows of parse_race_catalog_month
+        season: season of the page
+
+    Returns:
+        races of the page, columns and dtypes of CATALOG_SCHEMA
+    """
+    columns = [column for column in CATALOG_SCHEMA if column != 'Season']
+    batch = pd.DataFrame(races_month, columns=columns)
+    batch.insert(0, 'Season', season)
+    return batch.astype(CATALOG_SCHEMA)
+
+
+class CrawlState(object):
+    """Checkpoint of a RaceScraper crawl under ``state_dir``.
+
+    Rows of every finished (year, month) page are written to
+    ``shards/{year}_{month}.json`` as soon as the page is parsed and the
+    shard is recorded in ``manifest.json``. Both are replaced atomically and
+    the manifest is updated under a file lock, so an interrupted crawl loses
+    at most the pages in flight and several processes can crawl different
+    seasons into one state. Races emitted by the crawl are appended to
+    ``seen.log``, see SeenRaces.
+    """
+
+    def __init__(self, state_dir: Union[str, Path], gender: str = 'M'):
+        """
+
+        Args:
+            state_dir: directory of the manifest and shards, created if missing
+            gender: gender of the crawl, a state is never shared between genders
+
+        Raises:
+            ValueError: state_dir holds a crawl of the other gender
+        """
+        self.state_dir = Path(state_dir)
+        self.gender = gender
+        self.manifest_path = self.state_dir / 'manifest.json'
+        self.seen_path = self.state_dir / 'seen.log'
+        self._lock = shared_lock(self.state_dir / 'manifest.lock')
+        stored = self.manifest().get('gender', gender)
+        if stored != gender:
+            raise ValueError("{} holds crawl of gender {}, not {}".format(self.state_dir, stored, gender))
+
+    def _shard_path(self, year: int, month: int) -> Path:
+        return self.state_dir / 'shards' / '{}_{:02d}.json'.format(year, month)
+
+    def manifest(self) -> Dict:
+        """
+
+        Returns:
+            {'gender': .., 'shards': {'{year}_{month}': {'rows': .., 'updated': ..}}}, empty dict for a new crawl
+        """
+        if not self.manifest_path.exists():
+            return {}
+        with self.manifest_path.open('r') as file:
+            return json.load(file)
+
+    def completed(self) -> List[Tuple[int, int]]:
+        """
+
+        Returns:
+            finished (year, month) shards in year/month order
+        """
+        return sorted(tuple(int(x) for x in shard.split('_')) for shard in self.manifest().get('shards', {}))
+
+    def save_shard(self, year: int, month: int, rows: List[List]) -> None:
+        with atomic_write(self._shard_path(year, month)) as file:
+            json.dump(rows, file)
+        with self._lock:
+            manifest = self.manifest()
+            manifest['gender'] = self.gender
+            manifest.setdefault('shards', {})['{}_{:02d}'.format(year, month)] = {
+                'rows': len(rows),
+                'updated': time.time()
+            }
+            with atomic_write(self.manifest_path) as file:
+                json.dump(manifest, file)
+
+    def load_shard(self, year: int, month: int) -> List[List]:
+        with self._shard_path(year, month).open('r') as file:
+            return json.load(file)
+
+    def load_seen(self) -> Dict[str, str]:
+        """
+
+        Returns:
+            hash of race -> shard ('{year}_{month}') the race was first seen in
+        """
+        seen = {}
+        if self.seen_path.exists():
+            with self.seen_path.open('r') as file:
+                for line in file:
+                    key, _, shard = line.strip().partition(' ')
+                    if shard:
+                        seen[key] = shard
+        return seen
+
+    def append_seen(self, entries: List[Tuple[str, str]]) -> None:
+        if not entries:
+            return
+        with self._lock:
+            self.state_dir.mkdir(parents=True, exist_ok=True)
+            with self.seen_path.open('a') as file:
+                file.write(''.join('{} {}\n'.format(key, shard) for key, shard in entries))
+
+
+class SeenRaces(object):
+    """Races emitted by a crawl, keyed on 64-bit hash of race link and season.
+
+    A race listed in several monthly pages (multi-month stage races) is
+    kept in the earliest page and dropped from the later ones while the
+    crawl runs, so duplicates are never materialised. Every key remembers
+    its page: crawling the page again keeps the race, so resumed crawls and
+    recrawl of a season range dedupe against the existing catalog and
+    still reproduce their own rows.
+    """
+
+    def __init__(self, state: Optional[CrawlState] = None):
+        """
+
+        Args:
+            state: crawl state the seen-set is loaded from and appended to, in-memory seen-set if None
+        """
+        self.state = state
+        self.seen = state.load_seen() if state is not None else {}
+        self.skipped = 0
+
+    @staticmethod
+    def key(race: List, season: int) -> str:
+        return hashlib.blake2b('{}|{}'.format(race[RACE_LINK], season).encode(), digest_size=8).hexdigest()
+
+    def unique(self, races_month: List[List], year: int, month: int) -> List[List]:
+        """
+
+        Args:
+            races_month: rows of parse_race_catalog_month
+            year: season of the page
+            month: month of the page
+
+        Returns:
+            races not seen in an earlier page, in the order of the page
+        """
+        shard = '{}_{:02d}'.format(year, month)
+        unique, keys, new = [], set(), []
+        for race in races_month:
+            key = self.key(race, year)
+            owner = self.seen.get(key)
+            if key in keys or (owner is not None and owner < shard):
+                self.skipped += 1
+                continue
+            keys.add(key)
+            unique.append(race)
+            if owner != shard:
+                self.seen[key] = shard
+                new.append((key, shard))
+        if self.state is not None:
+            self.state.append_seen(new)
+        return unique
 
 
 class RaceScraper(object):
@@ -19,61 +193,190 @@ class RaceScraper(object):
     def __init__(self,
                  start_year: int = 1876,
                  end_year: int = datetime.now().year,
-                 gender: str = 'M'):
+                 gender: str = 'M',
+                 transport: Optional[Transport] = None,
+                 workers: int = 1,
+                 max_rps: float = MAX_RATE,
+                 parse_mode: str = PARSE_MODE,
+                 state_dir: Optional[Union[str, Path]] = None):
+        """
+
+        Args:
+            start_year: first season of the crawl
+            end_year: last season of the crawl
+            gender: 'M' or 'W'
+            transport: HTTP client, new rate limited Transport is created if None
+            workers: number of (year, month) pages fetched concurrently
+            max_rps: upper bound of the adaptive request rate shared by all workers, 1 request per second by default;
+                ignored if transport is passed
+            parse_mode: parse mode of pages, see functions.parse_page
+            state_dir: directory of CrawlState checkpoints, nothing is persisted if None
+        """
         self.start_year = start_year
         self.end_year = end_year
         self.gender = gender
+        self.workers = workers
+        self.parse_mode = parse_mode
+        if transport is None:
+            transport = Transport(max_connections=max(workers, MAX_CONNECTIONS),
+                                  rate_limiter=AdaptiveRateLimiter(rate=min(RATE, max_rps), max_rate=max_rps))
+        self.transport = transport
+        self.state = CrawlState(state_dir, gender) if state_dir is not None else None
+        self.skipped = 0
         self.url = "https://firstcycling.com/race.php?y={}&t={}&m={}"
 
-    def scrape_races(self):
-        t = 2 if self.gender == 'M' else 6
+    def scrape_races(self, workers: Optional[int] = None, resume: bool = False):
+        """
+
+        Args:
+            workers: overrides number of concurrent workers set in constructor
+            resume: take shards finished by a previous crawl from state_dir instead of fetching them again
+
+        Returns:
+            list of races in year/month order without duplicates
+        """
+        return self._crawl(self.start_year, self.end_year, workers, resume)
+
+    def recrawl(self, start_year: int, end_year: int, workers: Optional[int] = None):
+        """Crawl seasons again and merge them into the catalog kept in state_dir.
+
+        Shards of the seasons replace stored ones, shards of all other seasons are kept.
+
+        Args:
+            start_year: first season to crawl again
+            end_year: last season to crawl again
+            workers: overrides number of concurrent workers set in constructor
+
+        Returns:
+            whole catalog, see catalog
+        """
+        self._require_state()
+        for _ in self._iter_unique(start_year, end_year, workers, resume=False):
+            pass
+        return self.catalog()
+
+    def catalog(self):
+        """
+
+        Returns:
+            list of races of all shards in state_dir in year/month order without duplicates
+        """
+        self._require_state()
+        seen = SeenRaces()
+        races = []
+        for year, month in self.state.completed():
+            races.extend(seen.unique(self.state.load_shard(year, month), year, month))
+        return races
+
+    def _require_state(self) -> None:
+        if self.state is None:
+            raise ValueError("RaceScraper was created without state_dir")
+
+    def iter_races(self, workers: Optional[int] = None, resume: bool = False) -> Iterator[pd.DataFrame]:
+        """Stream the catalog one (year, month) page at a time.
+
+        At most two pages per worker are fetched ahead of the consumer, so
+        memory stays flat however many seasons are crawled. Races already
+        emitted for an earlier month are dropped, see SeenRaces.
+
+        Args:
+            workers: overrides number of concurrent workers set in constructor
+            resume: take shards finished by a previous crawl from state_dir instead of fetching them again
+
+        Returns:
+            races of one month in year/month order, see catalog_batch; months without races are skipped
+        """
+        for (year, month), races_month in self._iter_unique(self.start_year, self.end_year, workers, resume):
+            if races_month:
+                yield catalog_batch(races_month, year)
+
+    def write_races(self, *sinks: Sink, workers: Optional[int] = None, resume: bool = False) -> int:
+        """Write every batch of iter_races to all sinks as soon as it is parsed, sinks are closed at the end.
+
+        Args:
+            *sinks: destinations of batches, e.g. CSVSink, ParquetSink, SQLiteSink
+            workers: overrides number of concurrent workers set in constructor
+            resume: take shards finished by a previous crawl from state_dir instead of fetching them again
+
+        Returns:
+            number of written rows
+        """
+        rows = 0
+        try:
+            for batch in self.iter_races(workers, resume):
+                for sink in sinks:
+                    sink.write(batch)
+                rows += batch.shape[0]
+        finally:
+            for sink in sinks:
+                sink.close()
+        return rows
+
+    def _crawl(self, start_year: int, end_year: int, workers: Optional[int], resume: bool):
         races = []
-        for year in range(self.start_year, self.end_year+1):
-            print(f'Year {year} start in {datetime.fromtimestamp(time.time()).strftime("%Y-%m-%d %H:%M:%S")}')
-            for month in range(1, 13):
-                time.sleep(1)
-                s = bs4.BeautifulSoup(requests.get(self.url.format(str(year), str(t), str(month))).content,
-                                      'lxml')
-                dom = etree.HTML(str(s.find('body')))
-                tbl = s.find('tbody')
-                if tbl is None:
-                    continue
-                text = [x.strip('\t').strip('\r') for x in tbl.text.split('\n') if x not in ['', ' ', '\r']]
-                text = [[x1, x2, x3, x4, x5] for x1, x2, x3, x4, x5 in zip(text[::5],
-                                                                           text[1::5],
-                                                                           text[2::5],
-                                                                           text[3::5],
-                                                                           text[4::5])]
-                xpath = [[
-                    *f.xpath_element(dom, XPATH_HIST_GEN, 3, tr, 3, 'span'),
-                    *f.xpath_element(dom, XPATH_HIST_GEN, 3, tr, 3, 'a', expected_length=2),
-                    *f.xpath_element(dom, XPATH_HIST_GEN, 3, tr, 4, 'span'),
-                    *f.xpath_element(dom, XPATH_HIST_GEN, 3, tr, 4, 'a', expected_length=2)
-                ] for tr in range(1, len(tbl.find_all('tr')) + 1)]
-                flag_race = [f.re_country_flag(flag[0]) for flag in xpath]
-                res_lnk = [FIRSTCYCLING_URL + lnk[1] for lnk in xpath]
-                winner_flag = [f.re_country_flag(flag[3]) for flag in xpath]
-                rider_id = [f.re_racer_id(rider_id[4]) for rider_id in xpath]
-                rider_lnk = [FIRSTCYCLING_URL + rider_id[4] if isinstance(rider_id[4], str) else None for rider_id in xpath]
-                races_month = [[res[0], res[1], flag_race, res[2], res_lnk,
-                                winner_flag, rider_id, res[3], rider_lnk] for (flag_race,
-                                                                               res_lnk,
-                                                                               winner_flag,
-                                                                               rider_id,
-                                                                               rider_lnk,
-                                                                               res) in zip(flag_race,
-                                                                                           res_lnk,
-                                                                                           winner_flag,
-                                                                                           rider_id,
-                                                                                           rider_lnk,
-                                                                                           text)]
-                races.extend(races_month)
-            print(f'Year {year} finish in {datetime.fromtimestamp(time.time()).strftime("%Y-%m-%d %H:%M:%S")}')
-        races = pd.DataFrame(races).drop_duplicates().values.tolist()
+        for _, races_month in self._iter_unique(start_year, end_year, workers, resume):
+            races.extend(races_month)
         return races
 
+    def _iter_unique(self,
+                     start_year: int,
+                     end_year: int,
+                     workers: Optional[int],
+                     resume: bool
+                     ) -> Iterator[Tuple[Tuple[int, int], List[List]]]:
+        """Pages of _iter_months without races seen before, self.skipped counts dropped rows of the crawl."""
+        seen = SeenRaces(self.state)
+        self.skipped = 0
+        for (year, month), races_month in self._iter_months(start_year, end_year, workers, resume):
+            races_month = seen.unique(races_month, year, month)
+            self.skipped = seen.skipped
+            yield (year, month), races_month
+
+    def _iter_months(self,
+                     start_year: int,
+                     end_year: int,
+                     workers: Optional[int],
+                     resume: bool
+                     ) -> Iterator[Tuple[Tuple[int, int], List[List]]]:
+        workers = self.workers if workers is None else workers
+        if resume:
+            self._require_state()
+        done = set(self.state.completed()) if resume else set()
+        grid = [(year, month) for year in range(start_year, end_year+1) for month in range(1, 13)]
+        executor = ThreadPoolExecutor(max_workers=workers)
+        pending = deque()
+        try:
+            for year, month in grid:
+                pending.append(((year, month), executor.submit(self._checkpointed_month, year, month, done)))
+                if len(pending) >= 2 * workers:
+                    yield self._month_result(*pending.popleft())
+            while pending:
+                yield self._month_result(*pending.popleft())
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    @staticmethod
+    def _month_result(year_month: Tuple[int, int], future: Future) -> Tuple[Tuple[int, int], List[List]]:
+        races_month = future.result()
+        if year_month[1] == 12:
+            print(f'Year {year_month[0]} finish in {datetime.fromtimestamp(time.time()).strftime("%Y-%m-%d %H:%M:%S")}')
+        return year_month, races_month
+
+    def _checkpointed_month(self, year: int, month: int, done: Set[Tuple[int, int]]) -> List[List]:
+        if (year, month) in done:
+            return self.state.load_shard(year, month)
+        races_month = self._scrape_month(year, month)
+        if self.state is not None:
+            self.state.save_shard(year, month, races_month)
+        return races_month
+
+    def _scrape_month(self, year: int, month: int) -> List[List]:
+        t = 2 if self.gender == 'M' else 6
+        return parse_race_catalog_month(self.transport.get_content(self.url.format(str(year), str(t), str(month))),
+                                        self.parse_mode)
+
 
 if __name__ == '__main__':
-    test = RaceScraper(1876, 2023)
-    list_race = test.scrape_races()
-    pd.DataFrame(list_race).to_csv('static_race.csv', index=False)
+    test = RaceScraper(1876, 2023, workers=4, state_dir='race_crawl')
+    test.write_races(CSVSink('static_race.csv', append=False), resume=True)
+    print(f'Duplicates skipped: {test.skipped}')
@@ -0,0 +1,120 @@
+import sqlite3
+from pathlib import Path
+from typing import Union, Optional
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+
+class Sink(object):
+    """Destination of DataFrame batches written one by one as they arrive.
+
+    Only the current batch is held in memory, a sink never buffers the
+    whole stream. Sinks are context managers and are closed on exit.
+    """
+
+    def write(self, batch: pd.DataFrame) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CSVSink(Sink):
+    """Appends batches to a CSV file, header is written only if the file is new or empty."""
+
+    def __init__(self, path: Union[str, Path], append: bool = True):
+        """
+
+        Args:
+            path: CSV file
+            append: keep rows already in the file, otherwise it is truncated by the first batch
+        """
+        self.path = Path(path)
+        self.append = append
+        self._file = None
+
+    def write(self, batch: pd.DataFrame) -> None:
+        if self._file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = self.path.open('a' if self.append else 'w', newline='')
+            header = self._file.tell() == 0
+        else:
+            header = False
+        batch.to_csv(self._file, index=False, header=header)
+        self._file.flush()
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class ParquetSink(Sink):
+    """Writes every batch as one row group of a Parquet file.
+
+    Schema is taken from the first batch, so batches have to share columns
+    and dtypes. The file is complete only after close. Requires pyarrow.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        if pa is None:
+            raise ImportError("ParquetSink requires pyarrow, install it with `pip install procycling[parquet]`")
+        self.path = Path(path)
+        self._writer: Optional['pq.ParquetWriter'] = None
+
+    def write(self, batch: pd.DataFrame) -> None:
+        if self._writer is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._writer = pq.ParquetWriter(self.path, pa.Schema.from_pandas(batch, preserve_index=False))
+        self._writer.write_table(pa.Table.from_pandas(batch, schema=self._writer.schema, preserve_index=False))
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+class SQLiteSink(Sink):
+    """Inserts batches into a table of a SQLite database, one transaction per batch.
+
+    The table is created from columns of the first batch if it does not exist.
+    """
+
+    def __init__(self, path: Union[str, Path], table: str = 'races'):
+        self.path = Path(path)
+        self.table = table
+        self._conn = None
+
+    def write(self, batch: pd.DataFrame) -> None:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=30)
+            self._conn.execute("CREATE TABLE IF NOT EXISTS {} ({})".format(
+                self.table,
+                ', '.join('{} {}'.format(column, 'INTEGER' if pd.api.types.is_integer_dtype(dtype) else 'TEXT')
+                          for column, dtype in batch.dtypes.items())
+            ))
+        values = batch.astype(object).where(batch.notna(), None)
+        with self._conn:
+            self._conn.executemany(
+                "INSERT INTO {} ({}) VALUES ({})".format(self.table, ', '.join(batch.columns),
+                                                         ', '.join('?' * batch.shape[1])),
+                values.itertuples(index=False)
+            )
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
@@ -0,0 +1,484 @@
+import hashlib
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import dataclass, field
+from typing import Optional, Dict, List, Tuple, Callable, Iterator
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.request import ACCEPT_ENCODING
+
+from procycling.ratelimit import RateLimiter
+
+MAX_CONNECTIONS = 4
+HISTORY_SIZE = 1000
+USER_AGENT = "procycling (+https://github.com/shufinskiy/procycling)"
+
+TIMEOUT = (5.0, 30.0)
+RETRIES = 3
+BACKOFF = 0.5
+BACKOFF_MAX = 30.0
+HEDGE_AFTER = 5.0
+CHUNK_SIZE = 64 * 1024
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+RETRY_BUDGET_RATIO = 0.1
+RETRY_BUDGET_MIN = 10
+
+
+@dataclass
+class RequestRecord(object):
+    """Outcome of one HTTP request made through a Transport.
+
+    Attributes:
+        url: requested url
+        status: HTTP status code
+        wire_bytes: bytes received from the socket (compressed size)
+        content_bytes: bytes of the decoded body
+        elapsed: wall time of the request in seconds, body download included
+    """
+    url: str
+    status: int
+    wire_bytes: int
+    content_bytes: int
+    elapsed: float
+
+
+@dataclass
+class FetchResult(object):
+    """Outcome of one page fetch, retries and hedged requests included.
+
+    Attributes:
+        url: requested url
+        status: HTTP status code of the last response, None if no response was received
+        content: decoded body of the last response
+        headers: headers of the last response
+        attempts: number of requests sent
+        hedged: True if a hedged request was sent
+        elapsed: wall time of the whole fetch in seconds
+        error: description of the last failure, None if the fetch succeeded
+    """
+    url: str
+    status: Optional[int] = None
+    content: bytes = b''
+    headers: Dict[str, str] = field(default_factory=dict)
+    attempts: int = 0
+    hedged: bool = False
+    elapsed: float = 0.0
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and self.status is not None and self.status < 400
+
+
+class FetchError(Exception):
+    """Raised when a page could not be fetched. Outcome is kept in ``result``."""
+
+    def __init__(self, result: FetchResult):
+        super().__init__(f"{result.url}: {result.error or result.status} after {result.attempts} attempt(s)")
+        self.result = result
+
+
+class RetryBudget(object):
+    """Global cap on retries shared by all fetches of a Transport.
+
+    Every first attempt deposits ``ratio`` tokens and every retry or hedged
+    request withdraws one, so retries stay around ``ratio`` of the traffic
+    and a site-wide outage does not multiply the load by the retry count.
+    """
+
+    def __init__(self,
+                 ratio: float = RETRY_BUDGET_RATIO,
+                 min_retries: int = RETRY_BUDGET_MIN
+                 ):
+        """
+
+        Args:
+            ratio: retries allowed per first attempt
+            min_retries: retries available before any traffic was made, also the cap of saved tokens
+        """
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self._tokens = float(min_retries)
+        self._lock = threading.Lock()
+
+    def deposit(self) -> None:
+        with self._lock:
+            self._tokens = min(self._tokens + self.ratio, float(self.min_retries))
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class Transport(object):
+    """Pooled keep-alive HTTP client shared by FirstCycling and RaceScraper.
+
+    One ``requests.Session`` is reused for all requests, so connections to
+    firstcycling.com stay open between page fetches instead of paying the
+    TCP+TLS handshake every time. Bodies are negotiated compressed (gzip,
+    deflate and brotli when a brotli decoder is installed).
+
+    Every request has connect/read timeouts. Failed requests, 429 and 5xx
+    are retried with jittered exponential backoff while ``retry_budget``
+    allows it. Slow pages can be hedged: if the first request is not done
+    after ``hedge_after`` seconds a second one is sent and the first
+    response wins.
+    """
+
+    def __init__(self,
+                 max_connections: int = MAX_CONNECTIONS,
+                 headers: Optional[Dict[str, str]] = None,
+                 history_size: int = HISTORY_SIZE,
+                 rate_limiter: Optional[RateLimiter] = None,
+                 timeout: Tuple[float, float] = TIMEOUT,
+                 retries: int = RETRIES,
+                 backoff: float = BACKOFF,
+                 retry_budget: Optional[RetryBudget] = None,
+                 hedge_after: Optional[float] = HEDGE_AFTER,
+                 on_fetch: Optional[Callable[[FetchResult], None]] = None
+                 ):
+        """
+
+        Args:
+            max_connections: upper bound of simultaneously open connections per host
+            headers: extra headers sent with every request
+            history_size: number of last RequestRecord kept in ``history``
+            rate_limiter: limiter every request waits on, no throttling if None
+            timeout: (connect, read) timeouts in seconds
+            retries: max number of retries of one fetch
+            backoff: base of exponential backoff in seconds
+            retry_budget: budget shared by all fetches, new RetryBudget is created if None
+            hedge_after: delay before hedged request is sent for ``hedge=True`` fetches, hedging is off if None
+            on_fetch: called with FetchResult of every finished fetch
+        """
+        self.max_connections = max_connections
+        self.rate_limiter = rate_limiter
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.retry_budget = retry_budget if retry_budget is not None else RetryBudget()
+        self.hedge_after = hedge_after
+        self.on_fetch = on_fetch
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_connections, pool_block=True)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "Accept-Encoding": ACCEPT_ENCODING,
+            "Connection": "keep-alive",
+            "User-Agent": USER_AGENT
+        })
+        if headers is not None:
+            self.session.headers.update(headers)
+
+        self.history = deque(maxlen=history_size)
+        self._lock = threading.Lock()
+        self._hedge_executor = None
+        self._requests = 0
+        self._wire_bytes = 0
+        self._content_bytes = 0
+        self._elapsed = 0.0
+        self._retries = 0
+        self._hedges = 0
+        self._failures = 0
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """Send one request without retries.
+
+        Args:
+            url: page url
+            **kwargs: passed to ``requests.Session.get``
+
+        Returns:
+            response with the body already downloaded
+        """
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        kwargs.setdefault('timeout', self.timeout)
+        start = time.perf_counter()
+        try:
+            response = self.session.get(url, stream=True, **kwargs)
+            try:
+                content = response.content
+            finally:
+                response.close()
+        except requests.RequestException:
+            if self.rate_limiter is not None:
+                self.rate_limiter.feedback(None, time.perf_counter() - start)
+            raise
+        elapsed = time.perf_counter() - start
+        if self.rate_limiter is not None:
+            self.rate_limiter.feedback(response.status_code, elapsed)
+        self._record(RequestRecord(
+            url=url,
+            status=response.status_code,
+            wire_bytes=response.raw.tell() if response.raw is not None else len(content),
+            content_bytes=len(content),
+            elapsed=elapsed
+        ))
+        return response
+
+    def fetch(self, url: str, hedge: bool = False, **kwargs) -> FetchResult:
+        """Fetch page with retries and optional hedged request. Never raises on network errors.
+
+        Args:
+            url: page url
+            hedge: send a hedged request if the first one is slower than ``hedge_after``
+            **kwargs: passed to ``requests.Session.get``
+
+        Returns:
+            outcome of the fetch
+        """
+        start = time.perf_counter()
+        result = FetchResult(url=url)
+        self.retry_budget.deposit()
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                if not self.retry_budget.withdraw():
+                    result.error = f"retry budget exhausted: {result.error}"
+                    break
+                with self._lock:
+                    self._retries += 1
+                time.sleep(self._backoff_delay(attempt, result.headers))
+            if hedge and self.hedge_after is not None:
+                response, error, hedged = self._hedged_get(url, **kwargs)
+                result.attempts += 2 if hedged else 1
+                result.hedged = result.hedged or hedged
+            else:
+                response, error = self._try_get(url, **kwargs)
+                result.attempts += 1
+            result.error = error
+            if response is not None:
+                result.status = response.status_code
+                result.content = response.content
+                result.headers = dict(response.headers)
+                if response.status_code >= 400:
+                    result.error = f"HTTP {response.status_code}"
+                if response.status_code not in RETRY_STATUS:
+                    break
+        result.elapsed = time.perf_counter() - start
+        self._finish(result)
+        return result
+
+    def get_content(self, url: str, hedge: bool = False, **kwargs) -> bytes:
+        """
+
+        Args:
+            url: page url
+            hedge: send a hedged request if the first one is slower than ``hedge_after``
+            **kwargs: passed to ``requests.Session.get``
+
+        Returns:
+            decoded body of the page
+
+        Raises:
+            FetchError: page was not fetched after all retries
+        """
+        result = self.fetch(url, hedge=hedge, **kwargs)
+        if not result.ok:
+            raise FetchError(result)
+        return result.content
+
+    def get_if_changed(self,
+                       url: str,
+                       validator: Optional[Dict] = None,
+                       hedge: bool = False
+                       ) -> Tuple[Optional[bytes], Dict]:
+        """Conditional GET of a page fetched before.
+
+        ETag and Last-Modified of ``validator`` are sent as If-None-Match and
+        If-Modified-Since. A page is unchanged if the site answers 304 or sends
+        a body with the same sha256 as before, the hash covers sites that send
+        no validators at all.
+
+        Args:
+            url: page url
+            validator: validator returned for the previous fetch of the page, None to fetch unconditionally
+            hedge: send a hedged request if the first one is slower than ``hedge_after``
+
+        Returns:
+            body of the page, None if it has not changed, and validator of the current version
+
+        Raises:
+            FetchError: page was not fetched after all retries
+        """
+        validator = validator or {}
+        headers = {}
+        if validator.get('etag'):
+            headers['If-None-Match'] = validator['etag']
+        if validator.get('last_modified'):
+            headers['If-Modified-Since'] = validator['last_modified']
+        result = self.fetch(url, hedge=hedge, headers=headers)
+        if not result.ok:
+            raise FetchError(result)
+        if result.status == 304:
+            return None, validator
+        current = {
+            'etag': result.headers.get('ETag'),
+            'last_modified': result.headers.get('Last-Modified'),
+            'hash': hashlib.sha256(result.content).hexdigest()
+        }
+        return (None if current['hash'] == validator.get('hash') else result.content), current
+
+    def stream(self, url: str, chunk_size: int = CHUNK_SIZE, **kwargs) -> Iterator[bytes]:
+        """Yield decoded body of the page in chunks as they arrive.
+
+        Opening the response is retried like in ``fetch``. Once the first
+        chunk is yielded the request is not retried, a failure in the middle
+        of the body is raised as FetchError.
+
+        Args:
+            url: page url
+            chunk_size: size of chunks read from the socket
+            **kwargs: passed to ``requests.Session.get``
+
+        Returns:
+            chunks of decoded body
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        start = time.perf_counter()
+        result = FetchResult(url=url)
+        self.retry_budget.deposit()
+        response = None
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                if not self.retry_budget.withdraw():
+                    result.error = f"retry budget exhausted: {result.error}"
+                    break
+                with self._lock:
+                    self._retries += 1
+                time.sleep(self._backoff_delay(attempt, result.headers))
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            result.attempts += 1
+            try:
+                response = self.session.get(url, stream=True, **kwargs)
+            except requests.RequestException as e:
+                result.error = f"{type(e).__name__}: {e}"
+                if self.rate_limiter is not None:
+                    self.rate_limiter.feedback(None, time.perf_counter() - start)
+                continue
+            result.status = response.status_code
+            result.headers = dict(response.headers)
+            result.error = f"HTTP {response.status_code}" if response.status_code >= 400 else None
+            if response.status_code not in RETRY_STATUS:
+                break
+            if self.rate_limiter is not None:
+                self.rate_limiter.feedback(response.status_code, time.perf_counter() - start)
+            response.close()
+            response = None
+
+        if response is None or not result.ok:
+            if response is not None:
+                response.close()
+            result.elapsed = time.perf_counter() - start
+            self._finish(result)
+            raise FetchError(result)
+
+        size = 0
+        try:
+            for chunk in response.iter_content(chunk_size):
+                size += len(chunk)
+                yield chunk
+        except requests.RequestException as e:
+            result.error = f"{type(e).__name__}: {e}"
+        finally:
+            response.close()
+            result.elapsed = time.perf_counter() - start
+            if self.rate_limiter is not None:
+                self.rate_limiter.feedback(result.status if result.error is None else None, result.elapsed)
+            self._record(RequestRecord(
+                url=url,
+                status=result.status,
+                wire_bytes=response.raw.tell() if response.raw is not None else size,
+                content_bytes=size,
+                elapsed=result.elapsed
+            ))
+            self._finish(result)
+        if result.error is not None:
+            raise FetchError(result)
+
+    def _finish(self, result: FetchResult) -> None:
+        if not result.ok:
+            with self._lock:
+                self._failures += 1
+        if self.on_fetch is not None:
+            self.on_fetch(result)
+
+    def _try_get(self, url: str, **kwargs) -> Tuple[Optional[requests.Response], Optional[str]]:
+        try:
+            return self.get(url, **kwargs), None
+        except requests.RequestException as e:
+            return None, f"{type(e).__name__}: {e}"
+
+    def _hedged_get(self, url: str, **kwargs) -> Tuple[Optional[requests.Response], Optional[str], bool]:
+        with self._lock:
+            if self._hedge_executor is None:
+                self._hedge_executor = ThreadPoolExecutor(max_workers=2 * self.max_connections)
+        first = self._hedge_executor.submit(self._try_get, url, **kwargs)
+        done, _ = wait([first], timeout=self.hedge_after)
+        if done or not self.retry_budget.withdraw():
+            return (*first.result(), False)
+        with self._lock:
+            self._hedges += 1
+        pending = {first, self._hedge_executor.submit(self._try_get, url, **kwargs)}
+        response, error = None, None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                response, error = future.result()
+                if response is not None and response.status_code not in RETRY_STATUS:
+                    return response, error, True
+        return response, error, True
+
+    def _backoff_delay(self, attempt: int, headers: Dict[str, str]) -> float:
+        retry_after = headers.get('Retry-After')
+        if retry_after is not None and retry_after.isdigit():
+            return min(float(retry_after), BACKOFF_MAX)
+        return random.uniform(0, min(BACKOFF_MAX, self.backoff * 2 ** attempt))
+
+    def _record(self, record: RequestRecord) -> None:
+        with self._lock:
+            self.history.append(record)
+            self._requests += 1
+            self._wire_bytes += record.wire_bytes
+            self._content_bytes += record.content_bytes
+            self._elapsed += record.elapsed
+
+    @property
+    def stats(self) -> Dict[str, float]:
+        """Totals over all requests made through the transport."""
+        with self._lock:
+            return {
+                'requests': self._requests,
+                'wire_bytes': self._wire_bytes,
+                'content_bytes': self._content_bytes,
+                'elapsed': self._elapsed,
+                'mean_latency': self._elapsed / self._requests if self._requests else 0.0,
+                'retries': self._retries,
+                'hedges': self._hedges,
+                'failures': self._failures
+            }
+
+    def last_records(self, n: int = 10) -> List[RequestRecord]:
+        with self._lock:
+            return list(self.history)[-n:]
+
+    def close(self) -> None:
+        if self._hedge_executor is not None:
+            self._hedge_executor.shutdown(wait=False)
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
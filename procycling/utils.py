@@ -1,13 +1,28 @@
 import re
 
-XPATH_HIST_GEN = '//*[@id="wrapper"]/div[{}]/table/tbody/tr[{}]/td[{}]'
-XPATH_HIST_YBY = '//*[@id="wrapper"]/div[3]/div[{}]/div/table/tbody/tr[{}]/td[{}]'
-XPATH_HIST_YO = '//*[@id="wrapper"]/div[{}]/table[{}]/tbody/tr[{}]/td[{}]'
+FIRSTCYCLING_URL = "https://firstcycling.com/"
+RACE_PAGE_URL = FIRSTCYCLING_URL + "race.php?r={}&k={}"
+SCHEDULE_URL = FIRSTCYCLING_URL + "race.php?y={}&t={}&m={}"
+
+PARSE_MODE = 'lxml'
+PAGE_ENCODING = 'utf-8'
+CHARSET_SNIFF_BYTES = 1024
+
+XPATH_TBODY_GEN = '//*[@id="wrapper"]/div[3]/table/tbody'
+XPATH_TBODY_YBY = '//*[@id="wrapper"]/div[3]/div/div/table/tbody'
 
 RE_FLAG = re.compile(r"(?<=flag flag-)\w+")
 RE_ID = re.compile(r"(?<=r=)\d+")
+RE_FLAG_CODE = re.compile(r"flag flag-(\w+)")
+RE_ID_CODE = re.compile(r"r=(\d+)")
+RE_YEAR_CODE = re.compile(r"y=(\d{4})")
+RE_RACE_TIME = re.compile(r"^\+?\s*(?:(?:(\d+):)?(\d+):)?(\d+)$")
+RE_YBY_TIME = re.compile(r"(\d{1,3}:\d{2}:\d{2}|(?<=\+ ).+|0)")
+RE_YBY_TIME_STRIP = re.compile(r"(\d{1,3}:\d{2}:\d{2})|(\+.+)")
 RE_DATE_TOUR = re.compile(r"\d{2}\.\d{2}-\d{2}\.\d{2}")
 RE_DATE_RACE = re.compile(r"\d{2}\.\d{2}")
+RE_DATE_RANGE = re.compile(r"(\d{2})\.(\d{2})(?:-(\d{2})\.(\d{2}))?")
+RE_CHARSET = re.compile(rb"charset|encoding=", re.IGNORECASE)
 
 HISTORY_CODE = {
     1: 'Overall',
@@ -16,6 +31,14 @@ HISTORY_CODE = {
     4: 'Mountain'
 }
 
+HISTORY_PAGES = {
+    'general': ['1', '2', '3', '4'],
+    'yby': ['X'],
+    'victory': ['W'],
+    'stage': ['Z'],
+    'age_winner': ['Y']
+}
+
 ISO_COUNTRY_CODE = {
     "AU": "AUS",
     "AT": "AUT",
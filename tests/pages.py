@@ -0,0 +1,157 @@
+"""Synthetic firstcycling.com pages and a Transport serving them without network."""
+import hashlib
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit, parse_qs
+
+import requests
+
+from procycling.transport import Transport
+
+FLAGS = ['fr', 'be', 'it', 'es', 'nl', 'de', 'gb', 'xx']
+YEARS = range(2015, 2024)
+
+
+def wrap(inner: str) -> str:
+    return ('<html><head><title>x</title></head><body>\n<div id="wrapper">\n<div class="a">header</div>\n'
+            f'<div class="b">menu</div>\n{inner}\n</div></body></html>')
+
+
+def anchor(href: str, text: str, title: str = 'x', **attributes: str) -> str:
+    """Link with attributes out of alphabetical order, as served by the site."""
+    extra = ''.join(f' {name}="{value}"' for name, value in attributes.items())
+    return f'<a title="{title}" href="{href}"{extra}>{text}</a>'
+
+
+def flag(i: int) -> str:
+    return f'<span class="flag flag-{FLAGS[i % 8]}"></span>'
+
+
+def table(rows: List[str]) -> str:
+    return '<div class="c"><table>\n<tbody>\n' + '\n'.join(rows) + '\n</tbody></table></div>'
+
+
+def month_page(year: int, month: int) -> str:
+    if month in (4, 9):
+        return wrap('<div class="c">No races</div>')
+    rows = []
+    for i in range(1, 4):
+        race_id = month * 10 + i
+        date = f"{i * 5:02d}.{month:02d}" if i == 2 else f"{i * 5:02d}.{month:02d}-{i * 5 + 2:02d}.{month:02d}"
+        rows.append(f"""<tr>
+<td>{date}</td>
+<td>{1 if i == 2 else 2}.{'UWT' if i == 1 else '1'}</td>
+<td>{flag(i)} {anchor(f"race.php?r={race_id}&y={year}", f"Race {race_id}")}</td>
+<td>{flag(i + month)} {anchor(f"rider.php?r={1000 + race_id}&y={year}", f"Rider {race_id}")}</td>
+<td><a href="team.php?r={50 + i}&y={year}">Team {i}</a></td>
+</tr>""")
+    return wrap('<div class="c"><table>\n<thead><tr><th>Date</th></tr></thead>\n<tbody>\n' + '\n'.join(rows) +
+                '\n</tbody></table></div>')
+
+
+def general_page(race_id: int, k: int, years=YEARS) -> str:
+    rows = []
+    for y in sorted(years, reverse=True):
+        rows.append(f"""<tr>
+<td><a href="race.php?r={race_id}&y={y}">{y}</a></td>
+<td>2.UWT</td>
+<td>{anchor(f"race.php?r={race_id}&y={y}&k={k}", 'Information' if y == 2020 else 'Results', **{'class': 'info'})}</td>
+<td>{flag(y)} {anchor(f"rider.php?r={y * 10 + k}", f"W {y}", f"W {y}")}</td>
+<td>{flag(y + 1)} {anchor(f"rider.php?r={y * 10 + k + 1}", f"S {y}", f"S {y}")}</td>
+<td>{flag(y + 2)} {anchor(f"rider.php?r={y * 10 + k + 2}", f"T {y}", f"T {y}")}</td>
+</tr>""")
+    return wrap(table(rows))
+
+
+def yby_page(race_id: int, years=YEARS, riders: int = 5) -> str:
+    blocks = []
+    for y in sorted(years, reverse=True):
+        rows = []
+        for p in range(1, riders + 1):
+            time = f"{80 + y % 7}:{p:02d}:1{p}" if p == 1 else ("+ 0" if p == 2 else f"+ {p:02d}:{p * 7 % 60:02d}")
+            rows.append(f"""<tr>
+<td>{p}</td>
+<td>{flag(y + p)}</td><td>{anchor(f"rider.php?r={y * 100 + p}&y={y}", f"Rider {race_id}-{p}")} {time}</td>
+</tr>""")
+        blocks.append(f'<div class="yr"><div><table><thead><tr><th>{y}</th></tr></thead>\n<tbody>\n' +
+                      '\n'.join(rows) + '\n</tbody></table></div></div>')
+    return wrap('<div class="c"><div class="intro">intro</div>\n' + '\n'.join(blocks) + '\n</div>')
+
+
+def winners_page(columns: int) -> str:
+    rows = []
+    for p in range(1, 8):
+        extra = ''.join(f'\n<td>{p * j % 5}</td>' for j in range(columns - 3))
+        rows.append(f"""<tr>
+<td>{p}</td>
+<td>{anchor(f"rider.php?r={900 + p}", f"Victor {p}")}</td>
+<td>{flag(p)} Country {p}</td>{extra}
+</tr>""")
+    return wrap(table(rows))
+
+
+def young_old_page() -> str:
+    tables = []
+    for i in range(2):
+        rows = [f"""<tr>
+<td>{1990 + p + i}</td>
+<td>{anchor(f"rider.php?r={700 + p + 10 * i}", f"Age {i}-{p}")}</td>
+<td>{flag(p)} Country {p}</td>
+<td>{20 + p + i * 15} years</td>
+</tr>""" for p in range(1, 5)]
+        tables.append('<table>\n<tbody>\n' + '\n'.join(rows) + '\n</tbody></table>')
+    return wrap('<div class="c">' + '\n'.join(tables) + '</div>')
+
+
+def page_for(url: str) -> Optional[str]:
+    """Body of a schedule or race history page, None for race ids >= 900."""
+    query = {key: values[0] for key, values in parse_qs(urlsplit(url).query).items()}
+    if 'm' in query:
+        return month_page(int(query['y']), int(query['m']))
+    race_id, k = int(query['r']), query['k']
+    if race_id >= 900:
+        return None
+    if k in '1234':
+        return general_page(race_id, int(k))
+    return {'X': lambda: yby_page(race_id), 'W': lambda: winners_page(6), 'Z': lambda: winners_page(4),
+            'Y': young_old_page}[k]()
+
+
+def serve(path: str, headers: Dict[str, str]) -> Tuple[int, Dict[str, str], bytes]:
+    """PageServer route answering with page_for, 404 for unknown pages."""
+    body = page_for(path)
+    return (404, {}, b'not found') if body is None else (200, {}, body.encode())
+
+
+class PageTransport(Transport):
+    """Transport answering from ``pages`` instead of the network.
+
+    Every requested url is recorded in ``calls``. Pages carry an ETag of their
+    body and If-None-Match with the current one is answered with 304, unless
+    ``etags`` is False.
+    """
+
+    def __init__(self, pages: Callable[[str], Optional[str]] = page_for, etags: bool = True, **kwargs):
+        kwargs.setdefault('retries', 0)
+        super().__init__(**kwargs)
+        self.pages = pages
+        self.etags = etags
+        self.calls = []
+        self._calls_lock = threading.Lock()
+
+    def _try_get(self, url: str, **kwargs) -> Tuple[Optional[requests.Response], Optional[str]]:
+        with self._calls_lock:
+            self.calls.append(url)
+        body = self.pages(url)
+        response = requests.Response()
+        response.url = url
+        if body is None:
+            response.status_code, response._content = 404, b'not found'
+            return response, None
+        response.status_code, response._content = 200, body.encode()
+        if self.etags:
+            etag = '"{}"'.format(hashlib.sha1(response._content).hexdigest())
+            response.headers['ETag'] = etag
+            if (kwargs.get('headers') or {}).get('If-None-Match') == etag:
+                response.status_code, response._content = 304, b''
+        return response, None
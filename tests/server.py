@@ -0,0 +1,66 @@
+"""Local HTTP/1.1 server for tests of Transport against a real socket."""
+import gzip
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional, Tuple
+
+BODY = b'<html><body>' + b'<p>firstcycling</p>' * 200 + b'</body></html>'
+
+Route = Callable[[str, Dict[str, str]], Tuple[int, Dict[str, str], bytes]]
+
+
+def static(path: str, headers: Dict[str, str]) -> Tuple[int, Dict[str, str], bytes]:
+    return 200, {}, BODY
+
+
+class PageServer(object):
+    """Keep-alive server answering every GET with ``route(path, headers)``.
+
+    Bodies are gzipped when the client accepts it. Paths of all requests are
+    recorded in ``requests`` and client addresses in ``connections``, so
+    tests can count TCP connections.
+    """
+
+    def __init__(self, route: Optional[Route] = None):
+        self.route = route or static
+        self.requests = []
+        self.connections = set()
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                with server._lock:
+                    server.connections.add(self.client_address)
+                    server.requests.append(self.path)
+                status, headers, body = server.route(self.path, dict(self.headers))
+                if body and 'gzip' in self.headers.get('Accept-Encoding', ''):
+                    body, headers = gzip.compress(body), {**headers, 'Content-Encoding': 'gzip'}
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        # clients giving up on a slow response are expected, don't print their broken pipes
+        self.httpd.handle_error = lambda request, client_address: None
+
+    @property
+    def url(self) -> str:
+        return 'http://127.0.0.1:{}/'.format(self.httpd.server_port)
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
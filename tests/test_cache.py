@@ -0,0 +1,36 @@
+import pandas as pd
+
+from procycling.cache import FrameCache
+
+
+def frame(rows: int) -> pd.DataFrame:
+    return pd.DataFrame({'Rider': ['Rider {}'.format(i) for i in range(rows)]})
+
+
+def test_version_mismatch_is_miss():
+    cache = FrameCache()
+    cache.put('yby', 1, frame(3))
+    assert cache.get('yby', 1).shape == (3, 1)
+    assert cache.get('yby', 2) is None
+    assert cache.get('yby', 1) is None
+    assert (cache.hits, cache.misses, len(cache)) == (1, 2, 0)
+
+
+def test_bounded_by_memory():
+    size = int(frame(100).memory_usage(index=True, deep=True).sum())
+    cache = FrameCache(max_bytes=2 * size)
+    for key in 'abc':
+        cache.put(key, 0, frame(100))
+    assert cache.get('a', 0) is None
+    assert cache.get('c', 0) is not None
+    assert cache.nbytes == 2 * size
+    cache.put('big', 0, frame(1000))
+    assert cache.get('big', 0) is None
+
+
+def test_copies_returned():
+    cache = FrameCache()
+    cache.put('yby', 0, frame(2))
+    returned = cache.get('yby', 0)
+    returned.loc[0, 'Rider'] = 'changed'
+    assert cache.get('yby', 0).Rider.tolist() == ['Rider 0', 'Rider 1']
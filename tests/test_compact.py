@@ -0,0 +1,45 @@
+import pandas as pd
+
+from procycling.compact import Dimensions, compact, expand
+from procycling.firstcycling import FirstCycling
+from tests.pages import PageTransport
+
+RACE_ID = 17
+
+
+def reader(**kwargs) -> FirstCycling:
+    return FirstCycling(2023, no_store=True, transport=PageTransport(), compact=True, **kwargs)
+
+
+def test_dimensions_keep_last_name():
+    dimensions = Dimensions()
+    dimensions.add_riders(pd.Series([1, 2, None]), pd.Series(['A', 'B', 'C']))
+    dimensions.add_riders(pd.Series([1, 3]), pd.Series(['A2', None]))
+    assert dimensions.riders.to_dict() == {1: 'A2', 2: 'B'}
+    assert dimensions.rider_names(pd.Series([2, 1, 3, None], dtype='Int32')).tolist() == ['B', 'A2', pd.NA, pd.NA]
+
+
+def test_compact_round_trip():
+    full_reader, fc = FirstCycling(2023, no_store=True, transport=PageTransport()), reader()
+    full = full_reader.read_race_hist_yby(RACE_ID, force_cache=False)
+    small = fc.read_race_hist_yby(RACE_ID, force_cache=False)
+    assert not {'Rider', 'RiderLink'} & set(small.columns)
+    assert (small.RiderID.dtype, small.Year.dtype, small.RiderCountry.dtype) == ('Int32', 'Int32', 'category')
+    assert small.memory_usage(deep=True).sum() < full.memory_usage(deep=True).sum()
+    expanded = fc.expand(small)
+    assert expanded.Rider.astype(object).tolist() == full.Rider.tolist()
+    assert all(link.startswith(derived + '&') for derived, link in zip(expanded.RiderLink, full.RiderLink))
+    general = fc.expand(fc.read_race_hist_general(RACE_ID, force_cache=False))
+    assert general.RaceLink.astype(object).tolist() == \
+        full_reader.read_race_hist_general(RACE_ID, force_cache=False).RaceLink.tolist()
+
+
+def test_race_name_only_for_known_races():
+    fc = reader()
+    general = fc.read_race_hist_general(RACE_ID, force_cache=False)
+    assert 'Race_Name' not in fc.expand(general).columns
+    schedule = fc.read_schedule(force_cache=False)
+    assert 'Race_Name' not in schedule.columns
+    assert fc.expand(schedule).Race_Name.tolist()[:2] == [' Race 11', ' Race 12']
+    known = compact(pd.DataFrame({'RaceID': [11, RACE_ID]}), fc.dimensions)
+    assert expand(known, fc.dimensions).Race_Name.tolist() == [' Race 11', pd.NA]
@@ -0,0 +1,42 @@
+import threading
+
+import pytest
+
+from procycling.filelock import FileLock, shared_lock, atomic_write
+
+
+def test_lock_reentrant(tmp_path):
+    lock = FileLock(tmp_path / 'a.lock')
+    with lock:
+        with lock:
+            assert lock.acquire(blocking=False)
+            lock.release()
+    assert lock.acquire(blocking=False)
+    lock.release()
+
+
+def test_lock_excludes_other_threads(tmp_path):
+    lock = shared_lock(tmp_path / 'a.lock')
+    acquired = []
+    with lock:
+        thread = threading.Thread(target=lambda: acquired.append(lock.acquire(blocking=False)))
+        thread.start()
+        thread.join()
+    assert acquired == [False]
+
+
+def test_shared_lock_same_object(tmp_path):
+    assert shared_lock(tmp_path / 'a.lock') is shared_lock(str(tmp_path / 'a.lock'))
+    assert shared_lock(tmp_path / 'a.lock') is not shared_lock(tmp_path / 'b.lock')
+
+
+def test_atomic_write_keeps_old_content_on_error(tmp_path):
+    path = tmp_path / 'data.csv'
+    with atomic_write(path) as file:
+        file.write('old')
+    with pytest.raises(RuntimeError):
+        with atomic_write(path) as file:
+            file.write('new')
+            raise RuntimeError
+    assert path.read_text() == 'old'
+    assert [p.name for p in tmp_path.iterdir()] == ['data.csv']
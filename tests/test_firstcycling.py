@@ -0,0 +1,322 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import json
+import os
+import time
+
+import pandas as pd
+import pytest
+
+from procycling.firstcycling import FirstCycling
+from procycling.freshness import FreshnessPolicy, HIT, STALE, FRESH
+from procycling.storage import FileStorage
+from procycling.transport import FetchError
+from procycling.utils import HISTORY_PAGES
+from tests.pages import PageTransport, page_for, general_page, yby_page, YEARS
+
+RACE_ID = 17
+
+
+def pages_until(last_year: int, url: str):
+    """Site where the last edition of every race is ``last_year``."""
+    years = range(YEARS.start, last_year + 1)
+    if 'k=X' in url:
+        return yby_page(RACE_ID, years=years)
+    if any('k={}'.format(k) in url for k in '1234'):
+        return general_page(RACE_ID, int(url[-1]), years=years)
+    return page_for(url)
+
+
+def reader(data_dir, transport=None, **kwargs) -> FirstCycling:
+    return FirstCycling(2023, data_dir=data_dir, transport=transport or PageTransport(), **kwargs)
+
+
+@pytest.fixture
+def stored(tmp_path):
+    """Data dir with history of RACE_ID stored up to 2022."""
+    reader(tmp_path, PageTransport(partial(pages_until, 2022))).read_race_history(RACE_ID, force_cache=False)
+    return tmp_path
+
+
+def test_bulk_read_matches_single_race(tmp_path):
+    single = reader(tmp_path, no_store=True).read_race_history(RACE_ID, force_cache=False)
+    results = list(reader(tmp_path, no_store=True).read_race_histories([RACE_ID, 23, RACE_ID], max_workers=3))
+    assert sorted(result.race_id for result in results) == [RACE_ID, 23]
+    assert all(result.error is None for result in results)
+    assert next(result.history for result in results if result.race_id == RACE_ID) == single
+
+
+def test_bulk_read_fetches_every_page_once(tmp_path):
+    fc = reader(tmp_path)
+    list(fc.read_race_histories([RACE_ID, 23]))
+    pages = sum(len(section) for section in HISTORY_PAGES.values())
+    assert len(fc.transport.calls) == len(set(fc.transport.calls)) == 2 * pages
+
+
+def test_bulk_read_failed_race_reported(tmp_path):
+    results = {result.race_id: result for result in reader(tmp_path).read_race_histories([RACE_ID, 950])}
+    assert isinstance(results[950].error, FetchError)
+    assert results[950].history is None
+    assert results[RACE_ID].error is None
+
+
+def test_bulk_read_from_cache(tmp_path):
+    list(reader(tmp_path).read_race_histories([RACE_ID]))
+    fc = reader(tmp_path)
+    result, = fc.read_race_histories([RACE_ID], force_cache=True)
+    assert result.history == fc.read_race_history(RACE_ID)
+    assert fc.transport.calls == []
+
+
+def test_history_returned_without_store(tmp_path):
+    history = reader(tmp_path, no_store=True).read_race_history(RACE_ID, force_cache=False)
+    assert set(history) == set(HISTORY_PAGES)
+    assert not any(tmp_path.iterdir())
+    assert not FileStorage(tmp_path).has_race_history(RACE_ID)
+
+
+def test_schedule_dates_typed_in_cache(tmp_path):
+    fresh = reader(tmp_path).read_schedule(force_cache=False)
+    cached = reader(tmp_path).read_schedule()
+    for column in ('Date_Start', 'Date_End'):
+        assert fresh[column].dtype == cached[column].dtype == 'datetime64[ns]'
+        pd.testing.assert_series_equal(fresh[column], cached[column])
+
+
+def test_schedule_dtypes_match_on_every_path(tmp_path):
+    fetched = reader(tmp_path).read_schedule(force_cache=False)
+    loaded = reader(tmp_path).read_schedule()
+    refreshed = reader(tmp_path).refresh_schedule()
+    assert fetched.dtypes.to_dict() == loaded.dtypes.to_dict() == refreshed.dtypes.to_dict()
+    pd.testing.assert_frame_equal(loaded, fetched)
+    pd.testing.assert_frame_equal(refreshed, fetched)
+
+
+def test_refresh_fetches_from_latest_month(tmp_path):
+    fetched = reader(tmp_path).read_schedule(force_cache=False)
+    fc = reader(tmp_path)
+    fc.refresh_schedule()
+    assert len(fc.transport.calls) == 1
+    assert 'm={:02d}'.format(fetched.Date_Start.max().month) in fc.transport.calls[0]
+
+
+def test_refresh_ignores_race_without_result(tmp_path):
+    fetched = reader(tmp_path).read_schedule(force_cache=False)
+    path = tmp_path / 'seasons' / 'scheduleM_2023.csv'
+    stored = pd.read_csv(path)
+    stored.loc[0, ['WinnerID', 'Winner']] = None
+    stored.to_csv(path, index=False)
+    fc = reader(tmp_path)
+    fc.refresh_schedule()
+    assert len(fc.transport.calls) == 1
+    assert 'm={:02d}'.format(fetched.Date_Start.max().month) in fc.transport.calls[0]
+
+
+def test_past_season_schedule_covers_whole_year(tmp_path):
+    fc = reader(tmp_path)
+    fc.read_schedule(force_cache=False)
+    assert sorted(url[-2:] for url in fc.transport.calls) == ['{:02d}'.format(month) for month in range(1, 13)]
+    fc = reader(tmp_path)
+    fc.read_schedule()
+    assert (fc.last_status, fc.transport.calls) == (HIT, [])
+
+
+def test_incomplete_past_season_schedule_refreshed(tmp_path):
+    reader(tmp_path).read_schedule(force_cache=False)
+    validators = tmp_path / 'seasons' / 'scheduleM_2023.validators.json'
+    validators.write_text(json.dumps({**json.loads(validators.read_text()), 'complete': False}))
+    fc = reader(tmp_path, policy=FreshnessPolicy(schedule_ttl=0))
+    fc.read_schedule()
+    assert fc.last_status == FRESH
+    assert fc.transport.calls[-1].endswith('m=12')
+    fc = reader(tmp_path, policy=FreshnessPolicy(schedule_ttl=0))
+    fc.read_schedule()
+    assert (fc.last_status, fc.transport.calls) == (HIT, [])
+
+
+def test_refresh_without_stored_schedule(tmp_path):
+    fc = reader(tmp_path)
+    pd.testing.assert_frame_equal(fc.refresh_schedule(), reader(tmp_path).read_schedule())
+
+
+def test_update_adds_new_edition(stored):
+    fc = reader(stored, PageTransport(partial(pages_until, 2023)))
+    history = fc.update_race_history(RACE_ID)
+    assert history == reader(stored, no_store=True).read_race_history(RACE_ID, force_cache=False)
+    yby = FileStorage(stored, cache=None).read_race_section(RACE_ID, 'yby')
+    assert yby.Year.tolist()[:6] == [2023] * 5 + [2022]
+    assert len(fc.transport.calls) == sum(len(section) for section in HISTORY_PAGES.values())
+
+
+def test_update_without_new_edition(stored):
+    sections = ['manifest.json', *json.loads((stored / 'races' / 'race_17' / 'manifest.json').read_text())[
+        'sections'].values()]
+    before = {name: (stored / 'races' / 'race_17' / name).stat().st_mtime_ns for name in sections}
+    fc = reader(stored, PageTransport(partial(pages_until, 2022)))
+    assert fc.update_race_history(RACE_ID) == reader(stored).read_race_history(RACE_ID)
+    assert sorted(url[-1] for url in fc.transport.calls) == ['1', '2', '3', '4', 'X']
+    assert {name: (stored / 'races' / 'race_17' / name).stat().st_mtime_ns for name in sections} == before
+
+
+@pytest.mark.parametrize('etags', [True, False])
+def test_unchanged_pages_not_parsed(stored, monkeypatch, etags):
+    def parse(*args, **kwargs):
+        raise AssertionError("unchanged page parsed")
+
+    monkeypatch.setattr('procycling.firstcycling.parse_hist_general', parse)
+    monkeypatch.setattr('procycling.firstcycling.parse_hist_yby', parse)
+    fc = reader(stored, PageTransport(partial(pages_until, 2022), etags=etags))
+    fc.update_race_history(RACE_ID)
+    assert sorted(url[-1] for url in fc.transport.calls) == ['1', '2', '3', '4', 'X']
+
+
+def test_revalidation_restarts_ttl(stored):
+    for path in (stored / 'races' / 'race_17').iterdir():
+        os.utime(path, (time.time() - 7200,) * 2)
+    validators = stored / 'races' / 'race_17' / 'validators.json'
+    validators.write_text(json.dumps({**json.loads(validators.read_text()), 'checked': time.time() - 7200}))
+    policy = FreshnessPolicy(race_ttl=3600)
+    fc = reader(stored, PageTransport(partial(pages_until, 2022)), policy=policy)
+    fc.read_race_history(RACE_ID)
+    assert fc.last_status == FRESH
+    assert len(fc.transport.calls) == 5
+    fc = reader(stored, policy=policy)
+    fc.read_race_history(RACE_ID)
+    assert (fc.last_status, fc.transport.calls) == (HIT, [])
+
+
+def test_missing_history_fetched_with_force_cache(tmp_path):
+    fc = reader(tmp_path)
+    fc.read_race_history(RACE_ID, force_cache=True)
+    assert fc.last_status == FRESH
+    assert FileStorage(tmp_path).has_race_history(RACE_ID)
+
+
+def test_stale_history_on_fetch_failure(stored):
+    fc = reader(stored, PageTransport(lambda url: None), policy=FreshnessPolicy(race_ttl=0))
+    general = fc.read_race_hist_general(RACE_ID)
+    assert fc.last_status == STALE
+    assert general.Year.max() == 2022
+
+
+def test_refreshed_section_without_store(stored):
+    fc = reader(stored, PageTransport(partial(pages_until, 2023)), no_store=True,
+                policy=FreshnessPolicy(race_ttl=0))
+    general = fc.read_race_hist_general(RACE_ID)
+    assert fc.last_status == FRESH
+    assert 2023 in general.Year.tolist()
+    assert 2023 not in FileStorage(stored).read_race_section(RACE_ID, 'general').Year.tolist()
+
+
+def test_status_per_thread(stored):
+    fc = reader(stored)
+    fc.read_race_history(5)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        assert executor.submit(lambda: (fc.read_race_history(RACE_ID), fc.last_status)[1]).result() == HIT
+    assert fc.last_status == FRESH
+
+
+def test_bulk_read_status(stored):
+    results = {result.race_id: result for result in reader(stored).read_race_histories([RACE_ID, 5])}
+    assert (results[RACE_ID].status, results[5].status) == (HIT, FRESH)
+
+
+def test_bulk_read_follows_policy(stored):
+    fc = reader(stored, PageTransport(partial(pages_until, 2023)), policy=FreshnessPolicy(race_ttl=0))
+    result, = fc.read_race_histories([RACE_ID])
+    assert result.status == FRESH
+    assert 2023 in [row[1] for row in result.history['general']['data']]
+    assert len(fc.transport.calls) == len(set(fc.transport.calls))
+
+
+def lose_election(fc: FirstCycling, stored_at: str) -> None:
+    """Make fc see a resource as missing when it decides to fetch, as if another writer stored it meanwhile."""
+    current = getattr(fc, stored_at)
+    checks = iter([None])
+    setattr(fc, stored_at, lambda *args: next(checks, current(*args)))
+
+
+@pytest.mark.parametrize('read, stored_at', [
+    (lambda fc: fc.read_race_history(RACE_ID), '_race_stored_at'),
+    (lambda fc: fc.read_race_hist_stages(RACE_ID), '_race_stored_at'),
+    (lambda fc: fc.read_schedule(), '_schedule_stored_at')
+])
+def test_election_loser_reads_storage(tmp_path, read, stored_at):
+    reader(tmp_path).read_schedule()
+    reader(tmp_path).read_race_history(RACE_ID)
+    fc = reader(tmp_path)
+    lose_election(fc, stored_at)
+    read(fc)
+    assert fc.last_status == HIT
+    assert fc.transport.calls == []
+
+
+def test_bulk_election_loser_reads_storage(tmp_path):
+    reader(tmp_path).read_race_history(RACE_ID)
+    fc = reader(tmp_path)
+    lose_election(fc, '_race_stored_at')
+    result, = fc.read_race_histories([RACE_ID])
+    assert (result.status, result.error) == (HIT, None)
+    assert fc.transport.calls == []
+
+
+def test_concurrent_readers_fetch_once(tmp_path):
+    transport = PageTransport()
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(lambda _: reader(tmp_path, transport).read_race_history(RACE_ID), range(4)))
+    assert len(transport.calls) == len(set(transport.calls))
+
+
+def test_load_season_tables(tmp_path):
+    tables = reader(tmp_path).load_season(tables=['schedule', 'yby'])
+    assert list(tables) == ['schedule', 'yby']
+    schedule, yby = tables['schedule'], tables['yby']
+    assert list(yby.columns[:2]) == ['Season_RaceID', 'RaceID']
+    assert yby.Year.dtype == 'Int32'
+    assert list(yby.RaceID.unique()) == list(schedule.RaceID.dropna().unique())
+    assert (yby.Season_RaceID == '2023_' + yby.RaceID.astype('string')).all()
+
+
+def test_load_season_progress(tmp_path):
+    reader(tmp_path).load_season(tables=['general'])
+    progress = []
+    fc = reader(tmp_path, PageTransport(lambda url: None if 'r=21&' in url else page_for(url)), no_cache=True)
+    general = fc.load_season(tables=['general'], progress=lambda *args: progress.append(args))['general']
+    assert [total for _, _, total in progress] == [30] * 30
+    assert sorted(done for _, done, _ in progress) == list(range(1, 31))
+    failed = [result.race_id for result, _, _ in progress if result.error is not None]
+    assert failed == [21] and 21 not in general.RaceID.tolist()
+    assert {result.status for result, _, _ in progress if result.error is None} == {FRESH}
+
+
+def test_load_season_from_storage(tmp_path):
+    reader(tmp_path).load_season()
+    fc = reader(tmp_path)
+    statuses = []
+    fc.load_season(tables=['stage'], progress=lambda result, *_: statuses.append(result.status))
+    assert set(statuses) == {HIT}
+    assert fc.transport.calls == []
+
+
+def test_load_season_parse_processes(tmp_path):
+    season = reader(tmp_path).load_season(parse_workers=2)
+    fc = reader(tmp_path)
+    again = fc.load_season(parse_workers=2)
+    assert fc.transport.calls == []
+    for table, tbl in season.items():
+        pd.testing.assert_frame_equal(again[table], tbl)
+
+
+def test_concurrent_bulk_reads_fetch_once(tmp_path):
+    transport = PageTransport()
+    race_ids = [5, 8, RACE_ID, 23]
+
+    def read(order):
+        return {result.race_id: result.status
+                for result in reader(tmp_path, transport).read_race_histories(order, max_workers=2, parse_workers=0)}
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        statuses = list(executor.map(read, [race_ids, race_ids[::-1]]))
+    assert len(transport.calls) == len(set(transport.calls)) == 8 * len(race_ids)
+    for race_id in race_ids:
+        assert {statuses[0][race_id], statuses[1][race_id]} == {FRESH, HIT}
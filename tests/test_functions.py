@@ -0,0 +1,41 @@
+import pandas as pd
+import pytest
+
+from procycling import functions as f
+
+
+@pytest.mark.parametrize('race_time, seconds', [('5', 5), ('1:05', 65), ('4:01:07', 14467), (None, None)])
+def test_convert_to_seconds(race_time, seconds):
+    assert f.convert_to_seconds(race_time) == seconds
+
+
+def test_times_to_seconds():
+    times = pd.Series(['4:01:07', '+ 0', '+ 01:05', '+0', None, 'DNF'])
+    assert f.times_to_seconds(times).tolist() == [14467, 0, 65, 0, pd.NA, pd.NA]
+    assert f.times_to_seconds(times).dtype == 'Int64'
+
+
+def test_flags_to_country_matches_scalar():
+    flags = pd.Series(['flag flag-fra', 'flag flag-zz', 'flag', None, 'flag flag-fra'])
+    assert f.flags_to_country(flags).tolist() == [f.re_country_flag(flag) for flag in flags]
+
+
+def test_hrefs_to_id_and_year():
+    hrefs = pd.Series(['rider.php?r=12&y=2019', None, 'rider.php?r=12&y=2019', 'race.php?r=7&y=2021&k=1'])
+    assert f.hrefs_to_id(hrefs).tolist() == [12, pd.NA, 12, 7]
+    assert f.hrefs_to_year(hrefs).tolist() == [2019, pd.NA, 2019, 2021]
+
+
+def test_json_missing_values():
+    df = pd.DataFrame({'RiderID': pd.array([1, None], dtype='Int64'), 'Rider': ['A', None]})
+    assert f.convert_dataframe_to_json(df) == [[1, 'A'], [None, None]]
+
+
+def test_race_dates():
+    dates = pd.Series(['05.03', '28.12-03.01', '10.06-14.06', None])
+    parsed = f.race_dates(dates, pd.Series([2023, 2023, 2022, 2023]))
+    assert parsed.Date_Start.tolist()[:3] == [pd.Timestamp('2023-03-05'), pd.Timestamp('2023-12-28'),
+                                              pd.Timestamp('2022-06-10')]
+    assert parsed.Date_End.tolist()[:3] == [pd.Timestamp('2023-03-05'), pd.Timestamp('2024-01-03'),
+                                            pd.Timestamp('2022-06-14')]
+    assert parsed.iloc[3].isna().all()
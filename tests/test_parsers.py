@@ -0,0 +1,106 @@
+import pandas as pd
+import pytest
+
+from procycling import functions as f
+from procycling.parsers import (
+    parse_schedule_month,
+    parse_race_catalog_month,
+    parse_hist_general,
+    parse_hist_yby,
+    iter_hist_yby,
+    parse_hist_victories,
+    parse_hist_stages,
+    parse_hist_young_old_win
+)
+from tests.pages import month_page, general_page, yby_page, winners_page, young_old_page, wrap, YEARS
+
+PARSERS = {
+    'schedule': lambda content, mode: parse_schedule_month(content, 2023, 'M', mode=mode),
+    'general': lambda content, mode: parse_hist_general(content, 1, mode),
+    'yby': lambda content, mode: parse_hist_yby(content, mode=mode),
+    'yby_sec': lambda content, mode: parse_hist_yby(content, convert_to_sec=True, mode=mode),
+    'victories': parse_hist_victories,
+    'stages': parse_hist_stages,
+    'young_old': parse_hist_young_old_win
+}
+PAGES = {
+    'schedule': month_page(2023, 5),
+    'general': general_page(17, 1),
+    'yby': yby_page(17),
+    'yby_sec': yby_page(17),
+    'victories': winners_page(6),
+    'stages': winners_page(4),
+    'young_old': young_old_page()
+}
+
+
+@pytest.mark.parametrize('table', list(PARSERS))
+def test_parse_modes_agree(table):
+    content = PAGES[table].encode()
+    pd.testing.assert_frame_equal(PARSERS[table](content, 'lxml'), PARSERS[table](content, 'bs4'))
+
+
+def test_catalog_modes_agree():
+    content = month_page(2023, 5).encode()
+    assert parse_race_catalog_month(content, 'lxml') == parse_race_catalog_month(content, 'bs4')
+
+
+def test_cell_values_ordered_by_attribute_name():
+    dom = f.parse_page(b'<html><body><table><tbody><tr><td><a title="A" class="c" href="rider.php?r=1">x</a>'
+                       b'</td></tr></tbody></table></body></html>', 'lxml')
+    cells = next(f.iter_rows(dom.find('.//tbody')))
+    assert f.cell_values(cells, 1, 'a', expected_length=3) == ['c', 'rider.php?r=1', 'A']
+
+
+def test_cell_values_lookup():
+    dom = f.parse_page(b'<html><body><table><tbody><tr><td>1</td><td><a href="race.php?r=1">Information</a></td>'
+                       b'</tr></tbody></table></body></html>', 'lxml')
+    cells = next(f.iter_rows(dom.find('.//tbody')))
+    assert f.cell_values(cells, 1, return_text=True) == ['1']
+    assert f.cell_values(cells, 2, 'a', expected_length=2, check_information=True) == ['Information'] * 2
+    assert f.cell_values(cells, 1, 'a', expected_length=2) == [None, None]
+    assert f.cell_values(cells, 3, expected_length=2) == [None, None]
+
+
+def test_large_yby_page():
+    tbl = parse_hist_yby(yby_page(17, years=range(1903, 2024), riders=150).encode())
+    assert tbl.shape[0] == 121 * 150
+    assert tbl.Position.tolist()[:3] == [1, 2, 3]
+
+
+def test_general_reads_links_by_name():
+    tbl = parse_hist_general(general_page(17, 1, years=[2018]).encode(), 1)
+    row = tbl.iloc[0]
+    assert (row.Year, row.WinnerID, row.Winner) == (2018, 20181, 'W 2018')
+    assert row.WinnerLink == 'https://firstcycling.com/rider.php?r=20181'
+    assert row.RaceLink.endswith('race.php?r=17&y=2018&k=1')
+
+
+def test_general_drops_information_rows():
+    tbl = parse_hist_general(general_page(17, 1).encode(), 1)
+    assert 2020 not in tbl.Year.tolist()
+    assert tbl.shape[0] == 8
+
+
+@pytest.mark.parametrize('head, encoding, body', [
+    ('', None, 'Pogačar'.encode()),
+    ('<meta charset="windows-1250">', None, 'Pogačar'.encode('cp1250')),
+    ('', 'cp1250', 'Pogačar'.encode('cp1250'))
+])
+def test_page_encoding(head, encoding, body):
+    content = f'<html><head>{head}</head><body><p>'.encode() + body + b'</p></body></html>'
+    for mode in ('lxml', 'bs4'):
+        assert f.parse_page(content, mode, encoding).findtext('.//p') == 'Pogačar'
+
+
+def test_streamed_yby_matches_page():
+    content = yby_page(17).encode()
+    editions = list(iter_hist_yby(content[i:i + 100] for i in range(0, len(content), 100)))
+    assert [edition.Year.iloc[0] for edition in editions] == sorted(YEARS, reverse=True)
+    pd.testing.assert_frame_equal(pd.concat(editions, ignore_index=True), parse_hist_yby(content))
+
+
+def test_yby_without_editions():
+    tbl = parse_hist_yby(wrap('<div class="c"><div class="intro">intro</div></div>').encode())
+    assert tbl.empty
+    assert list(tbl.columns) == list(parse_hist_yby(yby_page(17).encode()).columns)
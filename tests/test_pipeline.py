@@ -0,0 +1,98 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from procycling.parsers import parse_race_pages
+from procycling.pipeline import RacePipeline, PAGES, PARSE_START_METHOD, frame_to_columns, columns_to_frame
+from procycling.transport import FetchError
+from procycling.utils import RACE_PAGE_URL
+from tests.pages import PageTransport, page_for
+
+
+def race_pages(race_id: int):
+    return {k: page_for(RACE_PAGE_URL.format(race_id, k)).encode() for k in PAGES}
+
+
+def test_columns_round_trip():
+    df = pd.DataFrame({
+        'Int': np.array([1, 2, 3]),
+        'Float': [0.5, np.nan, 1.5],
+        'Date': pd.to_datetime(['2023-01-05', None, '2023-03-01']),
+        'Nullable': pd.array([1, None, 3], dtype='Int32'),
+        'String': pd.array(['a', None, 'c'], dtype='string'),
+        'Category': pd.Categorical(['FRA', None, 'FRA']),
+        'Object': ['x', None, 'z']
+    })
+    pd.testing.assert_frame_equal(columns_to_frame(frame_to_columns(df)), df)
+    assert columns_to_frame(frame_to_columns(None)) is None
+
+
+def test_columns_round_trip_parsed():
+    for tbl in parse_race_pages(race_pages(17)):
+        pd.testing.assert_frame_equal(columns_to_frame(frame_to_columns(tbl)), tbl)
+
+
+@pytest.mark.parametrize('parse_workers', [0, 2])
+def test_run(parse_workers):
+    pipeline = RacePipeline(PageTransport(), fetch_workers=3, parse_workers=parse_workers)
+    parsed = {race.race_id: race for race in pipeline.run([17, 999, 5, 17, 8])}
+    assert sorted(parsed) == [5, 8, 17, 999]
+    assert isinstance(parsed[999].error, FetchError) and parsed[999].tables is None
+    for race_id in [5, 8, 17]:
+        assert parsed[race_id].error is None
+        assert set(parsed[race_id].validators) == {RACE_PAGE_URL.format(race_id, k) for k in PAGES}
+        for tbl, expected in zip(parsed[race_id].tables, parse_race_pages(race_pages(race_id))):
+            pd.testing.assert_frame_equal(tbl, expected)
+
+
+def test_parse_processes_not_forked():
+    assert PARSE_START_METHOD in ('forkserver', 'spawn')
+
+
+def test_pages_of_one_race_fetched_concurrently():
+    lock, running, peak = threading.Lock(), [0], [0]
+
+    def slow_pages(url):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.05)
+        with lock:
+            running[0] -= 1
+        return page_for(url)
+
+    race, = RacePipeline(PageTransport(slow_pages), fetch_workers=4, parse_workers=0).run([17])
+    assert race.error is None
+    assert peak[0] == 4
+
+
+def test_closed_run_stops_fetching():
+    transport = PageTransport()
+    run = RacePipeline(transport, fetch_workers=2, parse_workers=0).run(range(1, 200))
+    next(run)
+    run.close()
+    time.sleep(0.1)
+    fetched = len(transport.calls)
+    time.sleep(0.2)
+    assert len(transport.calls) == fetched < 200 * len(PAGES)
+
+
+@pytest.mark.parametrize('cpus, race_ids, processes', [(4, [17, 5], False), (1, [17, 5, 8], False), (2, [17, 5, 8], True)])
+def test_default_parses_small_batches_in_thread(monkeypatch, cpus, race_ids, processes):
+    started = []
+
+    class Pool(ThreadPoolExecutor):
+        def __init__(self, max_workers, mp_context):
+            started.append(max_workers)
+            super().__init__(max_workers)
+
+    monkeypatch.setattr('procycling.pipeline.os.cpu_count', lambda: cpus)
+    monkeypatch.setattr('procycling.pipeline.ProcessPoolExecutor', Pool)
+    parsed = list(RacePipeline(PageTransport(), fetch_workers=2).run(race_ids))
+    assert sorted(race.race_id for race in parsed) == sorted(race_ids)
+    assert all(race.error is None for race in parsed)
+    assert started == ([cpus] if processes else [])
@@ -0,0 +1,103 @@
+import json
+import threading
+import time
+
+import pytest
+
+from procycling.ratelimit import RateLimiter
+from procycling.tools.racescraper import RaceScraper, CrawlState, SeenRaces
+from procycling.transport import Transport
+from tests.pages import serve
+from tests.server import PageServer
+
+MONTH_URL = 'race.php?y={}&t={}&m={}'
+
+
+def scraper(server: PageServer, **kwargs) -> RaceScraper:
+    kwargs.setdefault('transport', Transport(max_connections=4, rate_limiter=RateLimiter(1000)))
+    race_scraper = RaceScraper(2021, 2022, **kwargs)
+    race_scraper.url = server.url + MONTH_URL
+    return race_scraper
+
+
+def test_concurrent_crawl_keeps_order():
+    with PageServer(serve) as server:
+        serial = scraper(server).scrape_races()
+        concurrent = scraper(server, workers=4).scrape_races()
+    assert concurrent == serial
+    assert len(serial) == 2 * 10 * 3
+    assert [race[4].split('?')[1] for race in serial[:4]] == ['r=11&y=2021', 'r=12&y=2021', 'r=13&y=2021',
+                                                              'r=21&y=2021']
+
+
+def test_workers_fetch_concurrently():
+    lock, running, peak = threading.Lock(), [0], [0]
+
+    def slow(path, headers):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.05)
+        with lock:
+            running[0] -= 1
+        return serve(path, headers)
+
+    with PageServer(slow) as server:
+        scraper(server, workers=4).scrape_races()
+    assert 1 < peak[0] <= 4
+
+
+def counting(paths):
+    def handler(path, headers):
+        paths.append(path)
+        return serve(path, headers)
+    return handler
+
+
+def test_resume_loads_finished_shards(tmp_path):
+    with PageServer(serve) as server:
+        expected = scraper(server).scrape_races()
+        scraper(server, state_dir=tmp_path).scrape_races()
+    assert len(CrawlState(tmp_path).completed()) == 24
+    manifest = json.loads((tmp_path / 'manifest.json').read_text())
+    del manifest['shards']['2022_12']
+    (tmp_path / 'manifest.json').write_text(json.dumps(manifest))
+    paths = []
+    with PageServer(counting(paths)) as server:
+        resumed = scraper(server, state_dir=tmp_path).scrape_races(resume=True)
+    assert resumed == expected
+    assert [path.rsplit('?', 1)[1] for path in paths] == ['y=2022&t=2&m=12']
+
+
+def test_recrawl_replaces_seasons(tmp_path):
+    paths = []
+    with PageServer(counting(paths)) as server:
+        first = scraper(server, state_dir=tmp_path).scrape_races()
+        paths.clear()
+        assert scraper(server, state_dir=tmp_path).recrawl(2022, 2022) == first
+    assert len(paths) == 12 and all('y=2022' in path for path in paths)
+
+
+def test_state_of_other_gender_rejected(tmp_path):
+    CrawlState(tmp_path).save_shard(2021, 1, [])
+    with pytest.raises(ValueError):
+        CrawlState(tmp_path, gender='W')
+
+
+def race(link: str) -> list:
+    return ['01.02', '1.1', 'FRA', 'x', link, 'FRA', 1, 'y', 'rider.php?r=1']
+
+
+def test_seen_races_keep_earliest_page():
+    seen = SeenRaces()
+    assert seen.unique([race('r=1'), race('r=2'), race('r=1')], 2021, 3) == [race('r=1'), race('r=2')]
+    assert seen.unique([race('r=2'), race('r=3')], 2021, 4) == [race('r=3')]
+    assert seen.unique([race('r=2')], 2022, 1) == [race('r=2')]
+    assert seen.skipped == 2
+
+
+def test_seen_races_persisted(tmp_path):
+    SeenRaces(CrawlState(tmp_path)).unique([race('r=1'), race('r=2')], 2021, 3)
+    seen = SeenRaces(CrawlState(tmp_path))
+    assert seen.unique([race('r=1'), race('r=3')], 2021, 4) == [race('r=3')]
+    assert seen.unique([race('r=1'), race('r=2')], 2021, 3) == [race('r=1'), race('r=2')]
@@ -0,0 +1,65 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from procycling.ratelimit import RateLimiter, AdaptiveRateLimiter
+
+
+def test_rate_shared_by_threads():
+    limiter = RateLimiter(rate=50)
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(lambda _: limiter.acquire(), range(11)))
+    assert time.monotonic() - start >= 10 / 50 * 0.9
+
+
+def test_burst():
+    limiter = RateLimiter(rate=1, burst=3)
+    assert [limiter.acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+
+
+def test_rate_positive():
+    with pytest.raises(ValueError):
+        RateLimiter(rate=0)
+
+
+def test_adaptive_default_keeps_old_pace():
+    limiter = AdaptiveRateLimiter()
+    for _ in range(50):
+        limiter.feedback(200, 0.1)
+    assert limiter.rate == 1.0
+
+
+def test_adaptive_increase_up_to_max_rate():
+    limiter = AdaptiveRateLimiter(rate=1, max_rate=1.2, increase=0.1)
+    limiter.feedback(200, 0.1)
+    assert limiter.rate == pytest.approx(1.1)
+    for _ in range(5):
+        limiter.feedback(200, 0.1)
+    assert limiter.rate == pytest.approx(1.2)
+
+
+@pytest.mark.parametrize('status', [429, 503, None])
+def test_adaptive_backs_off(status):
+    limiter = AdaptiveRateLimiter(rate=1, min_rate=0.3)
+    limiter.feedback(status, 0.1)
+    assert limiter.rate == 0.5
+    limiter.feedback(status, 0.1)
+    assert limiter.rate == 0.3
+
+
+def test_adaptive_slow_response_backs_off():
+    limiter = AdaptiveRateLimiter(rate=1, max_rate=2)
+    limiter.feedback(200, 0.1)
+    limiter.feedback(200, 1.0)
+    assert limiter.rate == pytest.approx(0.525)
+
+
+def test_state_shared_by_limiters(tmp_path):
+    first = AdaptiveRateLimiter(state_path=tmp_path / 'bucket.json')
+    second = AdaptiveRateLimiter(state_path=tmp_path / 'bucket.json')
+    first.feedback(429, 0.1)
+    assert second.rate == 0.5
+    assert first.acquire() == 0.0
+    assert second.acquire() > 1.5
@@ -0,0 +1,65 @@
+import sqlite3
+from contextlib import closing
+
+import pytest
+
+from procycling.firstcycling import FirstCycling
+from procycling.riderindex import RiderIndex, INDEX_SCHEMA
+from procycling.storage import FileStorage, ParquetStorage, SQLiteStorage, WriteThroughStorage
+from tests.pages import PageTransport
+
+RACE_ID = 17
+
+
+def reader(tmp_path, **kwargs) -> FirstCycling:
+    return FirstCycling(2023, data_dir=tmp_path, transport=PageTransport(), **kwargs)
+
+
+def test_index_matches_stored_histories(tmp_path):
+    fc = reader(tmp_path)
+    fc.read_race_history(RACE_ID, force_cache=False)
+    yby = fc.read_race_hist_yby(RACE_ID, force_cache=True)
+    rider_id = int(yby.RiderID.iloc[0])
+    results = fc.read_rider_results(rider_id)
+    assert results.dtypes.to_dict() == INDEX_SCHEMA
+    assert sorted(results.loc[results.Table == 'yby', 'Year']) == \
+        sorted(yby.loc[yby.RiderID == rider_id, 'Year'])
+    assert fc.build_rider_index() > 0
+    assert fc.read_rider_results(rider_id).equals(results)
+
+
+def test_race_entries_replaced(tmp_path):
+    fc = reader(tmp_path)
+    fc.read_race_history(RACE_ID, force_cache=False)
+    fc.read_race_history(RACE_ID, force_cache=False)
+    with closing(sqlite3.connect(tmp_path / 'rider_index.sqlite')) as conn:
+        rows, = conn.execute("SELECT COUNT(*) FROM rider_index").fetchone()
+    assert rows == fc.build_rider_index()
+
+
+def test_sqlite_index_in_storage_database(tmp_path):
+    storage = SQLiteStorage(tmp_path / 'db' / 'cycling.sqlite')
+    fc = reader(tmp_path / 'data', storage=storage)
+    fc.read_race_history(RACE_ID, force_cache=False)
+    assert fc.rider_index.path == storage.path
+    assert not (tmp_path / 'data').exists()
+    with closing(sqlite3.connect(storage.path)) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM rider_index").fetchone()[0] > 0
+
+
+def test_write_through_indexed_beside_primary(tmp_path):
+    primary = SQLiteStorage(tmp_path / 'cycling.sqlite')
+    fc = reader(tmp_path / 'data', storage=WriteThroughStorage(primary, FileStorage(tmp_path / 'files')))
+    assert fc.rider_index.path == primary.path
+
+
+def test_parquet_requires_explicit_index(tmp_path):
+    pytest.importorskip('pyarrow')
+    fc = reader(tmp_path / 'data', storage=ParquetStorage(tmp_path / 'parquet'))
+    fc.read_race_history(RACE_ID, force_cache=False)
+    assert fc.rider_index is None
+    with pytest.raises(ValueError):
+        fc.read_rider_results(1)
+    fc = reader(tmp_path / 'data', storage=ParquetStorage(tmp_path / 'parquet'),
+                rider_index=RiderIndex(tmp_path / 'index.sqlite'))
+    assert fc.build_rider_index() > 0
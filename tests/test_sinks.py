@@ -0,0 +1,60 @@
+import sqlite3
+from contextlib import closing
+
+import pandas as pd
+import pytest
+
+from procycling.tools.racescraper import CATALOG_SCHEMA
+from procycling.tools.sinks import CSVSink, ParquetSink, SQLiteSink
+from tests.pages import serve
+from tests.server import PageServer
+from tests.test_racescraper import scraper
+
+
+@pytest.fixture(scope='module')
+def batches():
+    with PageServer(serve) as server:
+        return list(scraper(server, workers=4).iter_races())
+
+
+def test_batches_typed_in_order(batches):
+    assert len(batches) == 20
+    assert all(batch.dtypes.to_dict() == CATALOG_SCHEMA for batch in batches)
+    assert [batch.Season.iloc[0] for batch in batches] == [2021] * 10 + [2022] * 10
+
+
+def test_csv_sink_appends(tmp_path, batches):
+    path = tmp_path / 'races.csv'
+    with CSVSink(path, append=False) as sink:
+        for batch in batches[:3]:
+            sink.write(batch)
+    with CSVSink(path) as sink:
+        sink.write(batches[3])
+    assert pd.read_csv(path).shape[0] == sum(batch.shape[0] for batch in batches[:4])
+
+
+def test_parquet_sink_row_group_per_batch(tmp_path, batches):
+    pq = pytest.importorskip('pyarrow.parquet')
+    path = tmp_path / 'races.parquet'
+    with ParquetSink(path) as sink:
+        for batch in batches:
+            sink.write(batch)
+    assert pq.ParquetFile(path).num_row_groups == len(batches)
+    pd.testing.assert_frame_equal(pd.read_parquet(path).astype(CATALOG_SCHEMA),
+                                  pd.concat(batches, ignore_index=True))
+
+
+def test_sqlite_sink(tmp_path, batches):
+    path = tmp_path / 'races.sqlite'
+    with SQLiteSink(path) as sink:
+        for batch in batches:
+            sink.write(batch)
+    with closing(sqlite3.connect(path)) as conn:
+        rows = conn.execute("SELECT COUNT(*), COUNT(DISTINCT Season) FROM races").fetchone()
+    assert rows == (sum(batch.shape[0] for batch in batches), 2)
+
+
+def test_write_races_to_every_sink(tmp_path, batches):
+    with PageServer(serve) as server:
+        rows = scraper(server, workers=4).write_races(CSVSink(tmp_path / 'a.csv'), SQLiteSink(tmp_path / 'a.sqlite'))
+    assert rows == sum(batch.shape[0] for batch in batches) == pd.read_csv(tmp_path / 'a.csv').shape[0]
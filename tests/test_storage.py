@@ -0,0 +1,209 @@
+import json
+import sqlite3
+from contextlib import closing
+
+import pandas as pd
+import pytest
+
+from procycling.cache import FrameCache
+from procycling.filelock import atomic_write
+from procycling.firstcycling import FirstCycling
+from procycling.storage import FileStorage, ParquetStorage, SQLiteStorage, WriteThroughStorage, SCHEMAS, conform
+from procycling.utils import HISTORY_PAGES
+from tests.pages import PageTransport, page_for, general_page, yby_page
+
+BACKENDS = {
+    'file': FileStorage,
+    'parquet': lambda path: ParquetStorage(path / 'parquet'),
+    'sqlite': lambda path: SQLiteStorage(path / 'cycling.sqlite')
+}
+
+
+def early_history(url: str):
+    """Site where race 23 was held until 2018 only."""
+    if 'r=23&k=X' in url:
+        return yby_page(23, years=range(2015, 2019))
+    if 'r=23&k=' in url and url[-1] in '1234':
+        return general_page(23, int(url[-1]), years=range(2015, 2019))
+    return page_for(url)
+
+
+def fill(storage, data_dir):
+    """Store schedule of 2023 and histories of races 17 and 23."""
+    fc = FirstCycling(2023, data_dir=data_dir, transport=PageTransport(early_history), storage=storage)
+    fc.read_schedule(force_cache=False)
+    list(fc.read_race_histories([17, 23]))
+    return storage
+
+
+@pytest.fixture(params=list(BACKENDS))
+def storage(request, tmp_path):
+    return fill(BACKENDS[request.param](tmp_path), tmp_path)
+
+
+@pytest.mark.parametrize('section', ['general', 'yby', 'age_winner'])
+def test_year_typed(storage, section):
+    assert storage.query(section).Year.dtype == 'Int32'
+    assert SCHEMAS[section]['Year'] == 'Int32'
+
+
+def test_year_range_query(storage):
+    yby = storage.query('yby', Year=(2017, 2019))
+    assert sorted(yby.Year.unique()) == [2017, 2018, 2019]
+    assert yby.groupby('RaceID').Year.nunique().to_dict() == {17: 3, 23: 2}
+    general = storage.query('general', ['RaceID', 'Year', 'Winner'], Year=(2022, None), Classification='Overall')
+    assert list(general.columns) == ['RaceID', 'Year', 'Winner']
+    assert sorted(general.Year.tolist()) == [2022, 2023]
+    assert (general.RaceID == 17).all()
+
+
+def test_partition_and_list_filters(storage):
+    schedule = storage.query('schedule', Season=2023, RaceID=[11, 52, 92])
+    assert sorted(schedule.RaceID.tolist()) == [11, 52]
+    assert storage.query('schedule', Season=2022).empty
+    assert storage.query('victory', RaceID=23).shape[0] == 7
+    assert storage.query('stage', RaceID=99).empty
+
+
+def test_query_matches_read(storage):
+    stored = storage.read_race_section(23, 'yby')
+    queried = storage.query('yby', RaceID=23).drop(columns='RaceID')
+    assert queried.Year.tolist() == pd.to_numeric(stored.Year).tolist()
+    assert queried.shape == stored.shape
+
+
+def test_validators_stored(storage):
+    validators = storage.read_validators('race_17')
+    assert sorted(url[-1] for url in validators['pages']) == ['1', '2', '3', '4', 'W', 'X', 'Y', 'Z']
+    assert all(page['etag'] and page['hash'] for page in validators['pages'].values())
+    storage.write_validators('race_17', {'checked': 1.0, 'pages': {}})
+    assert storage.read_validators('race_17') == {'checked': 1.0, 'pages': {}}
+    assert storage.read_validators('race_5') == {}
+
+
+def test_parquet_section_replaced(tmp_path):
+    storage = ParquetStorage(tmp_path)
+    storage.write_race_history(17, {'yby': pd.DataFrame({'Position': [1], 'Year': [2019]})})
+    storage.write_race_history(17, {'yby': pd.DataFrame({'Position': [1, 2], 'Year': [2020, 2020]})})
+    assert [path.name for path in (tmp_path / 'yby' / 'RaceID=17').iterdir()] == ['part-0.parquet']
+    assert storage.query('yby').Year.tolist() == [2020, 2020]
+
+
+@pytest.mark.parametrize('table, index, where', [
+    ('schedule', 'Season_RaceID', "Season_RaceID = '2023_17'"),
+    ('general', 'RaceID_Classification_Year', "RaceID = 17 AND Classification = 'Points' AND Year = 2020"),
+    ('yby', 'RaceID_Year_Position', "RaceID = 17 AND Year = 2020 AND Position = 3"),
+    ('victory', 'RaceID_RiderID', "RaceID = 17 AND RiderID = 901"),
+    ('stage', 'RaceID_RiderID', "RaceID = 17 AND RiderID = 901"),
+    ('age_winner', 'RaceID_AgeType_Year', "RaceID = 17 AND AgeType = 'Oldest' AND Year = 1995")
+])
+def test_sqlite_natural_key_indexed(tmp_path, table, index, where):
+    storage = SQLiteStorage(tmp_path / "cycling.sqlite")
+    with closing(sqlite3.connect(storage.path)) as conn:
+        plan = ' '.join(row[-1] for row in conn.execute("EXPLAIN QUERY PLAN SELECT * FROM {} WHERE {}".format(
+            table, where)))
+    assert 'USING INDEX ix_{}_{} '.format(table, index) in plan + ' '
+
+
+def test_sqlite_read_sql(tmp_path):
+    storage = fill(SQLiteStorage(tmp_path / 'cycling.sqlite'), tmp_path)
+    editions = storage.read_sql("SELECT RaceID, COUNT(DISTINCT Year) AS Editions FROM yby GROUP BY RaceID")
+    assert dict(zip(editions.RaceID, editions.Editions)) == {17: 9, 23: 4}
+
+
+def test_write_through(tmp_path):
+    mirror = SQLiteStorage(tmp_path / 'cycling.sqlite')
+    storage = WriteThroughStorage(FileStorage(tmp_path), mirror)
+    FirstCycling(2023, data_dir=tmp_path, transport=PageTransport(), storage=storage).read_race_history(
+        17, force_cache=False)
+    assert mirror.has_race_history(17)
+    pd.testing.assert_frame_equal(storage.query('yby', Year=2020), mirror.query('yby', Year=2020))
+
+
+def test_file_sections_cached(tmp_path):
+    cache = FrameCache()
+    storage = fill(FileStorage(tmp_path, cache=cache), tmp_path)
+    manifest = json.loads((tmp_path / 'races' / 'race_17' / 'manifest.json').read_text())['sections']
+    assert sorted(manifest) == sorted(HISTORY_PAGES)
+    assert sorted(path.name for path in (tmp_path / 'races' / 'race_17').iterdir()) == \
+        sorted(['validators.json', 'manifest.json', *manifest.values()])
+    first = storage.read_race_section(17, 'yby')
+    pd.testing.assert_frame_equal(storage.read_race_section(17, 'yby'), first)
+    assert (cache.misses, cache.hits) == (1, 1)
+    storage.write_race_history(17, {'yby': first.head(2)})
+    assert storage.read_race_section(17, 'yby').shape[0] == 2
+
+
+def test_single_history_file_read(tmp_path):
+    history = FirstCycling(2023, no_store=True, transport=PageTransport()).read_race_history(17, force_cache=False)
+    folder = tmp_path / 'races' / 'race_17'
+    folder.mkdir(parents=True)
+    (folder / 'history_race.json').write_text(json.dumps(history))
+    storage = FileStorage(tmp_path, cache=None)
+    assert storage.has_race_history(17)
+    assert storage.read_race_history(17) == history
+    assert storage.read_race_section(17, 'general').shape[0] == 8 * 4
+
+
+def test_interrupted_file_write_keeps_previous_history(tmp_path, monkeypatch):
+    storage = fill(FileStorage(tmp_path, cache=None), tmp_path)
+    before = storage.read_race_history(17)
+    updated = storage.race_history_updated(17)
+    written = []
+
+    def fail_third(path, *args, **kwargs):
+        written.append(path)
+        if len(written) == 3:
+            raise OSError("disk full")
+        return atomic_write(path, *args, **kwargs)
+
+    monkeypatch.setattr('procycling.storage.atomic_write', fail_third)
+    sections = {section: storage.read_race_section(17, section).head(1) for section in HISTORY_PAGES}
+    with pytest.raises(OSError):
+        storage.write_race_history(17, sections)
+    assert storage.read_race_history(17) == before
+    assert storage.race_history_updated(17) == updated
+    monkeypatch.undo()
+    storage.write_race_history(17, sections)
+    assert storage.read_race_section(17, 'yby').shape[0] == 1
+    stored = [path.name for path in (tmp_path / 'races' / 'race_17').glob('yby*.json')]
+    assert len(stored) == 2
+
+
+def test_history_headers_are_lists(storage):
+    storage.write_race_history(23, {**{section: storage.read_race_section(23, section) for section in HISTORY_PAGES},
+                                    'stage': conform(None, 'stage')})
+    history = storage.read_race_history(23)
+    assert all(isinstance(tbl['headers'], list) and isinstance(tbl['data'], list) for tbl in history.values())
+    assert history['stage'] == {'headers': list(SCHEMAS['stage']), 'data': []}
+
+
+READERS = {
+    'general': 'read_race_hist_general',
+    'yby': 'read_race_hist_yby',
+    'victory': 'read_race_hist_victories',
+    'stage': 'read_race_hist_stages',
+    'age_winner': 'read_race_hist_young_old_win'
+}
+
+
+@pytest.mark.parametrize('backend', list(BACKENDS))
+def test_stored_sections_typed_as_fetched(tmp_path, backend):
+    fresh = FirstCycling(2023, no_store=True, transport=PageTransport())
+    fc = FirstCycling(2023, data_dir=tmp_path, transport=PageTransport(), storage=BACKENDS[backend](tmp_path))
+    fc.read_race_history(17, force_cache=False)
+    for section, reader in READERS.items():
+        fetched = getattr(fresh, reader)(17, force_cache=False)
+        stored = getattr(fc, reader)(17, force_cache=True)
+        assert dict(fetched.dtypes.astype(str)) == SCHEMAS[section]
+        pd.testing.assert_frame_equal(stored, fetched)
+    assert fresh.read_race_hist_yby(17, convert_to_sec=True, force_cache=False).Time.dtype == 'Int64'
+    assert fc.read_race_hist_yby(17, convert_to_sec=True, force_cache=True).Time.dtype == 'Int64'
+
+
+def test_filtered_query_matches_fetched(storage):
+    fetched = FirstCycling(2023, no_store=True, transport=PageTransport()).read_race_hist_general(
+        17, force_cache=False)
+    expected = fetched.loc[(fetched.Year >= 2020) & (fetched.Classification == 'Points')].reset_index(drop=True)
+    queried = storage.query('general', RaceID=17, Year=(2020, None), Classification='Points')
+    pd.testing.assert_frame_equal(queried.drop(columns='RaceID'), expected)
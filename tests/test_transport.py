@@ -0,0 +1,136 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from procycling.firstcycling import FirstCycling
+from procycling.tools.racescraper import RaceScraper
+from procycling.transport import Transport, RetryBudget, FetchError
+from tests.server import PageServer, BODY
+
+
+def test_connection_reused():
+    with PageServer() as server, Transport() as transport:
+        for i in range(5):
+            assert transport.get_content(server.url + str(i)) == BODY
+    assert len(server.requests) == 5
+    assert len(server.connections) == 1
+
+
+def test_compressed_body_counted():
+    with PageServer() as server, Transport() as transport:
+        transport.get_content(server.url)
+        record, = transport.last_records()
+    assert record.status == 200
+    assert record.content_bytes == len(BODY)
+    assert 0 < record.wire_bytes < record.content_bytes
+    stats = transport.stats
+    assert (stats['requests'], stats['content_bytes'], stats['wire_bytes']) == (1, len(BODY), record.wire_bytes)
+    assert stats['mean_latency'] == stats['elapsed'] > 0
+
+
+def test_connections_bounded():
+    def slow(path, headers):
+        time.sleep(0.05)
+        return 200, {}, BODY
+
+    with PageServer(slow) as server, Transport(max_connections=2) as transport:
+        with ThreadPoolExecutor(max_workers=6) as executor:
+            list(executor.map(lambda i: transport.get_content(server.url + str(i)), range(12)))
+    assert len(server.requests) == 12
+    assert len(server.connections) <= 2
+
+
+def test_transport_injected():
+    transport = Transport()
+    assert FirstCycling(2023, no_store=True, transport=transport).transport is transport
+    assert RaceScraper(transport=transport).transport is transport
+
+
+def flaky(failures: int, status: int = 503, headers=None):
+    """Route failing the first ``failures`` requests of every path."""
+    seen = {}
+
+    def route(path, request_headers):
+        seen[path] = seen.get(path, 0) + 1
+        if seen[path] <= failures:
+            return status, dict(headers or {}), b''
+        return 200, {}, BODY
+    return route
+
+
+def test_retry_until_success():
+    results = []
+    with PageServer(flaky(2)) as server, Transport(backoff=0.01, on_fetch=results.append) as transport:
+        assert transport.get_content(server.url) == BODY
+    result, = results
+    assert (result.ok, result.status, result.attempts) == (True, 200, 3)
+    assert transport.stats['retries'] == 2
+
+
+def test_retry_after_honoured():
+    with PageServer(flaky(1, 429, {'Retry-After': '1'})) as server, Transport(backoff=0.01) as transport:
+        result = transport.fetch(server.url)
+    assert result.ok
+    assert result.elapsed >= 1
+
+
+def test_no_retry_on_client_error():
+    with PageServer(flaky(1, 404)) as server, Transport(backoff=0.01) as transport:
+        with pytest.raises(FetchError) as error:
+            transport.get_content(server.url)
+    assert (error.value.result.status, error.value.result.attempts) == (404, 1)
+
+
+def test_retry_budget_shared():
+    budget = RetryBudget(ratio=0, min_retries=2)
+    with PageServer(flaky(10)) as server, Transport(backoff=0.01, retry_budget=budget) as transport:
+        first = transport.fetch(server.url + 'a')
+        second = transport.fetch(server.url + 'b')
+    assert (first.attempts, second.attempts) == (3, 1)
+    assert second.error.startswith('retry budget exhausted')
+
+
+def test_timeout_reported():
+    def hang(path, headers):
+        time.sleep(0.5)
+        return 200, {}, BODY
+
+    with PageServer(hang) as server, Transport(timeout=(1, 0.1), retries=1, backoff=0.01) as transport:
+        result = transport.fetch(server.url)
+    assert not result.ok
+    assert result.status is None
+    assert result.attempts == 2
+    assert 'Timeout' in result.error
+
+
+def test_hedged_request_wins():
+    seen = []
+
+    def first_slow(path, headers):
+        seen.append(path)
+        if len(seen) == 1:
+            time.sleep(1)
+        return 200, {}, BODY
+
+    with PageServer(first_slow) as server, Transport(hedge_after=0.1) as transport:
+        result = transport.fetch(server.url, hedge=True)
+        assert (result.ok, result.hedged, result.attempts) == (True, True, 2)
+        assert result.elapsed < 0.9
+        assert transport.stats['hedges'] == 1
+
+
+def test_stream_retries_opening():
+    with PageServer(flaky(1)) as server, Transport(backoff=0.01) as transport:
+        chunks = list(transport.stream(server.url, chunk_size=256))
+        record, = transport.last_records()
+    assert b''.join(chunks) == BODY
+    assert len(chunks) > 1
+    assert (record.status, record.content_bytes) == (200, len(BODY))
+    assert transport.stats['retries'] == 1
+
+
+def test_stream_error_raised():
+    with PageServer(flaky(1, 404)) as server, Transport() as transport:
+        with pytest.raises(FetchError):
+            list(transport.stream(server.url))